@@ -15,7 +15,7 @@ from shared import db
 from shared.config import Config
 
 app = Flask(__name__)
-CORS(app) # Enable Cross-Origin Resource Sharing (CORS) for the app
+CORS(app, expose_headers=['ETag', 'X-Next-Cursor']) # Enable Cross-Origin Resource Sharing (CORS) for the app
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -26,6 +26,14 @@ app.config.from_object(Config)
 # Initialise database with the Flask app
 db.init_app(app)
 
+# Load and validate the eBPF function objects once, installs are served from memory
+from artifacts import ArtifactStore
+app.artifact_store = ArtifactStore(app.config['FUNCTIONS_DIR'], app.config['ARTIFACT_SCAN_INTERVAL']).load()
+
+# Map the MAC vendor index, compiled from the IEEE registries if missing or outdated
+from vendors import VendorDatabase
+app.vendor_db = VendorDatabase([path for path in app.config['OUI_REGISTRIES'].split(',') if path], app.config['OUI_INDEX_PATH']).load()
+
 # Import controller routes
 from controller_routes import controller_routes
 
@@ -33,6 +41,17 @@ from controller_routes import controller_routes
 app.register_blueprint(controller_routes, url_prefix='/api')
 
 if __name__ == '__main__':
+    # Keep the telemetry rollups up to date and apply retention in the background
+    from rollups import RollupEngine
+    app.rollup_engine = RollupEngine(app).start()
+
+    # Pick up recompiled function objects
+    app.artifact_store.start()
+
+    # Push the topology changes of the network simulation to the live stream subscribers
+    from topology_cache import topology_cache
+    topology_cache.watch(app)
+
     # Run the controller application on localhost with port 5050
     app.run(host="127.0.0.1", port=5050, debug=True, use_reloader=False)
 
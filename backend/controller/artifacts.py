@@ -0,0 +1,274 @@
+import hashlib
+import logging
+import os
+import struct
+import threading
+from io import BytesIO
+
+from elftools.common.exceptions import ELFError
+from elftools.elf.constants import SH_FLAGS
+from elftools.elf.elffile import ELFFile
+
+# Machine types accepted by the uBPF loader (EM_NONE and EM_BPF)
+ACCEPTED_MACHINES = ('EM_NONE', 'EM_BPF')
+
+# struct bpf_map_def from includes/ebpf_switch.h
+MAP_DEF = struct.Struct('<5I')
+
+class ArtifactError(Exception):
+    """
+    Raised when a function object would be rejected by the switch.
+    """
+
+class ArtifactNotFound(ArtifactError):
+    """
+    Raised when no object exists for a function.
+    """
+
+class Artifact:
+    """
+    A validated eBPF function object.
+
+    Attributes:
+        name: Function name (file name without the .o extension).
+        path: Path of the object file.
+        digest: SHA-256 of the object file, identifying its content.
+        elf: Raw bytes of the object file, sent as is in FunctionAddRequest.
+        text_size: Size in bytes of the executable section.
+        maps: Map definitions found in the "maps" section, as dictionaries.
+        mtime: Modification time of the file when it was loaded.
+    """
+    def __init__(self, name, path, elf, mtime):
+        self.name = name
+        self.path = path
+        self.elf = elf
+        self.mtime = mtime
+        self.digest = hashlib.sha256(elf).hexdigest()
+        self.text_size, self.maps = validate_elf(elf)
+
+    def to_dict(self):
+        """
+        Serialises the artifact metadata (without the ELF bytes) into a dictionary.
+        """
+        return {
+            'name': self.name,
+            'digest': self.digest,
+            'size': len(self.elf),
+            'text_size': self.text_size,
+            'maps': self.maps,
+        }
+
+def validate_elf(elf):
+    """
+    Runs the checks of the switch's uBPF loader on an object file, so a broken function is rejected
+    before it is sent instead of coming back as INVALID_FUNCTION.
+
+    Args:
+        elf: Raw bytes of the object file.
+
+    Returns:
+        Tuple of (size of the executable section, list of map definitions).
+
+    Raises:
+        ArtifactError: If the object would be rejected by the loader.
+    """
+    try:
+        elffile = ELFFile(BytesIO(elf))
+        if elffile.elfclass != 64:
+            raise ArtifactError('wrong class, expected 64-bit ELF')
+        if elffile['e_type'] != 'ET_REL':
+            raise ArtifactError('wrong type, expected relocatable')
+        if elffile['e_machine'] not in ACCEPTED_MACHINES:
+            raise ArtifactError(f"wrong machine, expected none or BPF, got {elffile['e_machine']}")
+
+        # The loader runs the first executable PROGBITS section (.text or prog)
+        text = None
+        for section in elffile.iter_sections():
+            if section['sh_type'] == 'SHT_PROGBITS' and section['sh_flags'] == SH_FLAGS.SHF_ALLOC | SH_FLAGS.SHF_EXECINSTR:
+                text = section
+                break
+        if text is None or text.data_size == 0:
+            raise ArtifactError('text section not found')
+        if text.data_size % 8:
+            raise ArtifactError('text section size is not a multiple of the instruction size')
+
+        maps = []
+        maps_section = elffile.get_section_by_name('maps')
+        symtab = elffile.get_section_by_name('.symtab')
+        if maps_section is not None:
+            data = maps_section.data()
+            if len(data) % MAP_DEF.size:
+                raise ArtifactError('maps section size is not a multiple of struct bpf_map_def')
+            maps_index = next(i for i, section in enumerate(elffile.iter_sections()) if section.name == 'maps')
+            for symbol in (symtab.iter_symbols() if symtab is not None else []):
+                if symbol['st_shndx'] != maps_index:
+                    continue
+                map_type, key_size, value_size, max_entries, flags = MAP_DEF.unpack_from(data, symbol['st_value'])
+                maps.append({
+                    'name': symbol.name,
+                    'type': map_type,
+                    'key_size': key_size,
+                    'value_size': value_size,
+                    'max_entries': max_entries,
+                    'flags': flags,
+                })
+        return text.data_size, maps
+    except (ELFError, struct.error) as e:
+        raise ArtifactError(f'malformed ELF: {e}')
+
+class ArtifactStore:
+    """
+    In-memory store of the eBPF function objects, addressed by name and by content hash.
+
+    Every object in the functions directory is read, hashed and validated once. A background watcher
+    reloads files that are added, changed or removed, so installs are served from memory.
+
+    Attributes:
+        directory: Directory holding the compiled function objects.
+        interval: Seconds between two scans of the directory by the watcher.
+        artifacts: Valid artifacts mapped by function name.
+        by_digest: Valid artifacts mapped by content hash.
+        errors: Validation errors of the rejected objects mapped by function name.
+    """
+    def __init__(self, directory, interval=2.0):
+        self.directory = directory
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.scan_lock = threading.Lock()
+        self.artifacts = {}
+        self.by_digest = {}
+        self.errors = {}
+        self.stats = {}
+        self.watching = False
+        self.stopped = threading.Event()
+
+    def load(self):
+        """
+        Loads every object of the directory.
+
+        Returns:
+            Reference to the instance for further use.
+        """
+        self.scan()
+        logging.info(f"Loaded {len(self.artifacts)} function artifacts from {self.directory}.")
+        return self
+
+    def start(self):
+        """
+        Starts watching the directory for changes in a background daemon thread.
+
+        Returns:
+            Reference to the instance for further use.
+        """
+        self.watching = True
+        threading.Thread(target=self.watch, daemon=True).start()
+        return self
+
+    def stop(self):
+        """
+        Stops the watcher.
+        """
+        self.stopped.set()
+        self.watching = False
+
+    def watch(self):
+        """
+        Scans the directory until stopped.
+        """
+        while not self.stopped.wait(self.interval):
+            try:
+                self.scan()
+            except Exception as e:
+                logging.error(f"Error scanning function artifacts: {e}")
+
+    def scan(self):
+        """
+        Reloads the objects whose size or modification time changed and forgets removed ones.
+        """
+        with self.scan_lock:
+            self.scan_directory()
+
+    def scan_directory(self):
+        """
+        Compares the directory with the loaded objects. Must be called with the scan lock held.
+        """
+        try:
+            entries = {entry.name[:-2]: entry for entry in os.scandir(self.directory) if entry.name.endswith('.o') and entry.is_file()}
+        except FileNotFoundError:
+            entries = {}
+
+        for name, entry in entries.items():
+            stat = entry.stat()
+            if self.stats.get(name) != (stat.st_size, stat.st_mtime_ns):
+                self.stats[name] = (stat.st_size, stat.st_mtime_ns)
+                self.reload(name, entry.path, stat.st_mtime)
+
+        for name in set(self.stats) - set(entries):
+            del self.stats[name]
+            with self.lock:
+                artifact = self.artifacts.pop(name, None)
+                self.errors.pop(name, None)
+                if artifact:
+                    self.by_digest.pop(artifact.digest, None)
+            logging.info(f"Function artifact {name} removed.")
+
+    def reload(self, name, path, mtime):
+        """
+        Reads, hashes and validates a single object.
+        """
+        try:
+            with open(path, 'rb') as f:
+                artifact = Artifact(name, path, f.read(), mtime)
+        except (OSError, ArtifactError) as e:
+            logging.error(f"Rejected function artifact {name}: {e}")
+            with self.lock:
+                previous = self.artifacts.pop(name, None)
+                if previous:
+                    self.by_digest.pop(previous.digest, None)
+                self.errors[name] = str(e)
+            return
+
+        with self.lock:
+            previous = self.artifacts.get(name)
+            if previous:
+                self.by_digest.pop(previous.digest, None)
+            self.artifacts[name] = artifact
+            self.by_digest[artifact.digest] = artifact
+            self.errors.pop(name, None)
+        logging.info(f"Loaded function artifact {name} ({artifact.digest[:12]}, {len(artifact.maps)} maps).")
+
+    def get(self, name):
+        """
+        Returns the artifact of a function.
+
+        Args:
+            name: The function name.
+
+        Returns:
+            The Artifact.
+
+        Raises:
+            ArtifactNotFound: If the function object does not exist.
+            ArtifactError: If the function object is invalid.
+        """
+        if not self.watching:
+            # Without the watcher, pick up changes on demand
+            self.scan()
+        with self.lock:
+            artifact = self.artifacts.get(name)
+            error = self.errors.get(name)
+        if artifact:
+            return artifact
+        if error:
+            raise ArtifactError(f'Function {name} is invalid: {error}')
+        raise ArtifactNotFound(f'Function ELF file not found: {name}.o')
+
+    def list(self):
+        """
+        Returns the metadata of the valid artifacts and the errors of the rejected ones.
+        """
+        with self.lock:
+            return {
+                'functions': [artifact.to_dict() for _, artifact in sorted(self.artifacts.items())],
+                'errors': dict(self.errors),
+            }
@@ -0,0 +1,231 @@
+import logging
+import math
+import threading
+import time
+from array import array
+from collections import deque
+from datetime import datetime, timezone
+
+from shared import db
+from shared.models import Device, EventLog
+from stream import broker
+
+# A series whose deviation stays under this fraction of its mean is never anomalous, so constant
+# series (zero variance) do not alert on the first small change
+MIN_STDDEV_RATIO = 0.05
+
+# Observations of a per second metric closer than this to the previous one are skipped
+MIN_INTERVAL = 0.5
+
+class BaselineDetector:
+    """
+    Online anomaly detection on the per MAC rates computed by the controller.
+
+    Every series, identified by (dpid, metric, MAC), has an exponentially weighted moving mean and
+    variance. Each new value is scored against the baseline before updating it:
+
+        z = (x - mean) / max(sqrt(var), MIN_STDDEV_RATIO * |mean|, 1)
+        mean += alpha * (x - mean)
+        var = (1 - alpha) * (var + alpha * (x - mean_before)^2)
+
+    and |z| over the switch's threshold raises an anomaly once the series has seen warmup values.
+    The state of all the series lives in flat arrays indexed by a slot number, so a series costs a
+    few machine words plus its key in the slot dictionary, and scoring a poll is one loop over it.
+
+    Anomalies are rate limited per series (cooldown) and per poll (max_events, the rest is summed up
+    in one event), stored as EventLog rows and published to the events stream.
+
+    Attributes:
+        app: Flask application instance for database context.
+        controller: The running eBPFController.
+        alpha: Weight of a new value in the moving mean and variance.
+        threshold: Default |z| over which a value is anomalous.
+        thresholds: Per switch thresholds overriding the default, mapped by dpid.
+        warmup: Number of values of a series before it is scored.
+        cooldown: Seconds before the same series raises an anomaly again.
+        max_events: Maximum number of anomaly events raised per poll of a switch.
+        slots: Slot number of each series, mapped by (dpid, metric, MAC).
+        anomalies: Most recent anomalies, newest last.
+    """
+    def __init__(self, app, controller):
+        self.app = app
+        self.controller = controller
+        self.alpha = app.config['ANOMALY_ALPHA']
+        self.threshold = app.config['ANOMALY_Z_THRESHOLD']
+        self.warmup = app.config['ANOMALY_WARMUP']
+        self.cooldown = app.config['ANOMALY_COOLDOWN']
+        self.max_events = app.config['ANOMALY_MAX_EVENTS']
+        self.thresholds = {}
+        for item in app.config['ANOMALY_DEVICE_THRESHOLDS'].split(','):
+            if item.strip():
+                dpid, threshold = item.split('=')
+                self.set_threshold(int(dpid), threshold)
+        self.lock = threading.Lock()
+        self.slots = {}
+        self.mean = array('d')
+        self.var = array('d')
+        self.count = array('L')
+        self.alerted = array('d')
+        self.observed = {}
+        self.scored = 0
+        self.anomalies = deque(maxlen=app.config['ANOMALY_HISTORY'])
+
+    def observe(self, dpid, metric, values, per_second=False):
+        """
+        Scores the values of a poll against their baselines, updates the baselines and raises the
+        anomalies found.
+
+        Args:
+            dpid: The switch the values come from.
+            metric: Name of the metric, e.g. "bandwidth".
+            values: Value of each series, mapped by MAC address.
+            per_second: The values are totals since the previous poll and are divided by its age.
+        """
+        now = time.time()
+        if per_second:
+            previous = self.observed.get((dpid, metric))
+            if previous is not None and now - previous < MIN_INTERVAL:
+                return
+            self.observed[(dpid, metric)] = now
+            if previous is None:
+                return
+            elapsed = now - previous
+            values = {mac: value / elapsed for mac, value in values.items()}
+        if not values:
+            return
+
+        found = self.score(dpid, metric, values, now)
+        if found:
+            self.raise_anomalies(dpid, metric, found, now)
+
+    def score(self, dpid, metric, values, now):
+        """
+        Updates the baselines of a poll's series.
+
+        Returns:
+            List of (MAC, value, mean, z) for the anomalous values out of their cooldown.
+        """
+        alpha = self.alpha
+        threshold = self.thresholds.get(dpid, self.threshold)
+        warmup = self.warmup
+        cooldown = self.cooldown
+        slots = self.slots
+        found = []
+        with self.lock:
+            mean, var, count, alerted = self.mean, self.var, self.count, self.alerted
+            for mac, x in values.items():
+                i = slots.get((dpid, metric, mac))
+                if i is None:
+                    i = slots[(dpid, metric, mac)] = len(mean)
+                    mean.append(x)
+                    var.append(0.0)
+                    count.append(1)
+                    alerted.append(0.0)
+                    continue
+
+                m = mean[i]
+                d = x - m
+                n = count[i]
+                if n >= warmup:
+                    scale = max(math.sqrt(var[i]), MIN_STDDEV_RATIO * abs(m), 1.0)
+                    z = d / scale
+                    if (z > threshold or z < -threshold) and now - alerted[i] >= cooldown:
+                        alerted[i] = now
+                        found.append((mac, x, m, z))
+                else:
+                    count[i] = n + 1
+                incr = alpha * d
+                mean[i] = m + incr
+                var[i] = (1 - alpha) * (var[i] + d * incr)
+            self.scored += len(values)
+        return found
+
+    def raise_anomalies(self, dpid, metric, found, now):
+        """
+        Stores and publishes the anomalies of a poll, the largest deviations first.
+        """
+        found.sort(key=lambda anomaly: abs(anomaly[3]), reverse=True)
+        timestamp = datetime.fromtimestamp(now, timezone.utc)
+        reported = []
+        for mac, value, baseline, z in found[:self.max_events]:
+            reported.append({
+                'dpid': dpid,
+                'metric': metric,
+                'mac_address': mac,
+                'value': round(value, 1),
+                'baseline': round(baseline, 1),
+                'z': round(z, 2),
+                'direction': 'spike' if z > 0 else 'drop',
+                'timestamp': timestamp.isoformat(),
+            })
+        with self.lock:
+            self.anomalies.extend(reported)
+
+        try:
+            with self.app.app_context():
+                device = Device.query.filter_by(dpid=dpid).first()
+                if not device:
+                    logging.error(f"Device with DPID {dpid} not found in the database.")
+                    return
+                events = [
+                    EventLog(
+                        timestamp=timestamp,
+                        device_id=device.id,
+                        message=f"{metric} {anomaly['direction']} for {anomaly['mac_address']} on switch {dpid}: "
+                                f"{anomaly['value']} against a baseline of {anomaly['baseline']} (z={anomaly['z']})",
+                        event_type='WARNING',
+                        data=anomaly
+                    )
+                    for anomaly in reported
+                ]
+                if len(found) > len(reported):
+                    events.append(EventLog(
+                        timestamp=timestamp,
+                        device_id=device.id,
+                        message=f"{len(found) - len(reported)} more {metric} anomalies on switch {dpid}",
+                        event_type='WARNING',
+                        data={'dpid': dpid, 'metric': metric, 'suppressed': len(found) - len(reported)}
+                    ))
+                db.session.add_all(events)
+                db.session.commit()
+                for event in events:
+                    logging.warning(event.message)
+                    broker.publish('events', self.controller.serialise_event(event))
+        except Exception as e:
+            logging.error(f"Error storing {metric} anomalies for device {dpid}: {e}")
+            db.session.rollback()
+
+    def set_threshold(self, dpid, threshold):
+        """
+        Sets the |z| threshold of a switch, or restores the default if threshold is None.
+
+        Returns:
+            The threshold now applied to the switch.
+
+        Raises:
+            ValueError: If the threshold is not a positive number.
+        """
+        if threshold is None:
+            self.thresholds.pop(dpid, None)
+            return self.threshold
+        threshold = float(threshold)
+        if not threshold > 0:
+            raise ValueError('threshold must be a positive number')
+        self.thresholds[dpid] = threshold
+        return threshold
+
+    def status(self):
+        """
+        Returns the detector settings, the number of series tracked and the recent anomalies.
+        """
+        with self.lock:
+            return {
+                'alpha': self.alpha,
+                'threshold': self.threshold,
+                'thresholds': {str(dpid): threshold for dpid, threshold in self.thresholds.items()},
+                'warmup': self.warmup,
+                'cooldown': self.cooldown,
+                'series': len(self.slots),
+                'scored': self.scored,
+                'anomalies': list(self.anomalies),
+            }
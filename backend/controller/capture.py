@@ -0,0 +1,551 @@
+import logging
+import os
+import queue
+import random
+import re
+import struct
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from sqlalchemy.dialects.postgresql import insert
+
+from shared import db
+from shared.models import Device, PacketCapture
+
+# Metadata the switch puts in front of the Ethernet frame: in_port, sec, nsec, length
+METADATA = struct.Struct('<IIIH')
+
+# Pcap file format with nanosecond timestamps, as the switch metadata carries nanoseconds
+PCAP_HEADER = struct.Struct('<IHHiIII')
+PCAP_RECORD = struct.Struct('<IIII')
+PCAP_MAGIC = 0xa1b23c4d
+PCAP_SNAPLEN = 65535
+LINKTYPE_ETHERNET = 1
+
+ETHERTYPES = {0x0800: 'IPv4', 0x0806: 'ARP', 0x86dd: 'IPv6', 0x8100: 'VLAN', 0x88b8: 'GOOSE', 0x88ba: 'SV', 0x88cc: 'LLDP'}
+IP_PROTOCOLS = {1: 'ICMP', 6: 'TCP', 17: 'UDP'}
+
+def format_mac(frame, offset):
+    return ':'.join(f'{b:02x}' for b in frame[offset:offset + 6])
+
+def format_ip(frame, offset):
+    return '.'.join(str(b) for b in frame[offset:offset + 4])
+
+def summarise(frame):
+    """
+    Decodes the headers of an Ethernet frame needed for filtering and indexing.
+
+    Args:
+        frame: The frame (bytes or memoryview), starting at the Ethernet header.
+
+    Returns:
+        Dictionary with src_mac, dst_mac, ethertype, vlan, src_ip, dst_ip, ip_proto, src_port, dst_port
+        and protocol (name of the innermost known protocol). Fields absent from the frame are None.
+    """
+    summary = {
+        'src_mac': format_mac(frame, 6), 'dst_mac': format_mac(frame, 0), 'ethertype': None, 'vlan': None,
+        'src_ip': None, 'dst_ip': None, 'ip_proto': None, 'src_port': None, 'dst_port': None,
+    }
+    offset = 12
+    ethertype = struct.unpack_from('!H', frame, offset)[0]
+    if ethertype == 0x8100 and len(frame) >= 18:
+        summary['vlan'] = struct.unpack_from('!H', frame, 14)[0] & 0x0fff
+        offset = 16
+        ethertype = struct.unpack_from('!H', frame, offset)[0]
+    summary['ethertype'] = ethertype
+    summary['protocol'] = ETHERTYPES.get(ethertype, f'0x{ethertype:04x}')
+    offset += 2
+
+    if ethertype == 0x0800 and len(frame) >= offset + 20:
+        header_length = (frame[offset] & 0x0f) * 4
+        summary['ip_proto'] = frame[offset + 9]
+        summary['src_ip'] = format_ip(frame, offset + 12)
+        summary['dst_ip'] = format_ip(frame, offset + 16)
+        summary['protocol'] = IP_PROTOCOLS.get(summary['ip_proto'], summary['protocol'])
+        offset += header_length
+        if summary['ip_proto'] in (6, 17) and len(frame) >= offset + 4:
+            summary['src_port'], summary['dst_port'] = struct.unpack_from('!HH', frame, offset)
+    return summary
+
+class CaptureFilter:
+    """
+    Capture filter written in a subset of the pcap-filter (tcpdump) syntax.
+
+    Supported primitives are protocol names (ip, ip6, arp, tcp, udp, icmp, vlan, goose, sv, lldp),
+    "[src|dst] host IP", "[src|dst] port N", "ether [src|dst|host] MAC", "ether proto N" and "vlan N",
+    combined with and/&&, or/||, not/! and parentheses. An empty filter matches every frame.
+
+    Attributes:
+        expression: The filter as given.
+    """
+    PROTOCOLS = {
+        'ip': lambda s: s['ethertype'] == 0x0800,
+        'ip6': lambda s: s['ethertype'] == 0x86dd,
+        'arp': lambda s: s['ethertype'] == 0x0806,
+        'goose': lambda s: s['ethertype'] == 0x88b8,
+        'sv': lambda s: s['ethertype'] == 0x88ba,
+        'lldp': lambda s: s['ethertype'] == 0x88cc,
+        'vlan': lambda s: s['vlan'] is not None,
+        'tcp': lambda s: s['ip_proto'] == 6,
+        'udp': lambda s: s['ip_proto'] == 17,
+        'icmp': lambda s: s['ip_proto'] == 1,
+    }
+    TOKEN = re.compile(r'\s*(\(|\)|&&|\|\||!|[^\s()!]+)')
+
+    def __init__(self, expression):
+        """
+        Raises:
+            ValueError: If the expression is not a valid filter.
+        """
+        self.expression = (expression or '').strip()
+        self.tokens = [token.lower() for token in self.TOKEN.findall(self.expression)]
+        self.position = 0
+        if not self.tokens:
+            self.predicate = lambda summary: True
+            return
+        self.predicate = self.parse_or()
+        if self.position != len(self.tokens):
+            raise ValueError(f'Unexpected "{self.tokens[self.position]}" in capture filter.')
+
+    def matches(self, summary):
+        return self.predicate(summary)
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise ValueError('Capture filter ends unexpectedly.')
+        self.position += 1
+        return token
+
+    def parse_or(self):
+        left = self.parse_and()
+        while self.peek() in ('or', '||'):
+            self.next()
+            right = self.parse_and()
+            left = lambda s, left=left, right=right: left(s) or right(s)
+        return left
+
+    def parse_and(self):
+        left = self.parse_not()
+        while self.peek() in ('and', '&&'):
+            self.next()
+            right = self.parse_not()
+            left = lambda s, left=left, right=right: left(s) and right(s)
+        return left
+
+    def parse_not(self):
+        if self.peek() in ('not', '!'):
+            self.next()
+            operand = self.parse_not()
+            return lambda s: not operand(s)
+        if self.peek() == '(':
+            self.next()
+            inner = self.parse_or()
+            if self.next() != ')':
+                raise ValueError('Missing ")" in capture filter.')
+            return inner
+        return self.parse_primitive()
+
+    def parse_primitive(self):
+        token = self.next()
+        if token == 'ether':
+            qualifier = self.next()
+            if qualifier == 'proto':
+                value = self.number(self.next())
+                return lambda s: s['ethertype'] == value
+            if qualifier not in ('src', 'dst', 'host'):
+                raise ValueError(f'Unknown ether qualifier "{qualifier}" in capture filter.')
+            mac = self.next().replace('-', ':')
+            if not re.fullmatch(r'([0-9a-f]{2}:){5}[0-9a-f]{2}', mac):
+                raise ValueError(f'Invalid MAC address "{mac}" in capture filter.')
+            return self.directed(qualifier if qualifier != 'host' else None, 'src_mac', 'dst_mac', mac)
+
+        if token == 'vlan' and self.peek() is not None and self.peek().isdigit():
+            value = int(self.next())
+            return lambda s: s['vlan'] == value
+        if token in self.PROTOCOLS:
+            return self.PROTOCOLS[token]
+
+        direction = None
+        if token in ('src', 'dst'):
+            direction, token = token, self.next()
+        if token == 'host':
+            address = self.next()
+            if not re.fullmatch(r'(\d{1,3}\.){3}\d{1,3}', address):
+                raise ValueError(f'Invalid IPv4 address "{address}" in capture filter.')
+            return self.directed(direction, 'src_ip', 'dst_ip', address)
+        if token == 'port':
+            return self.directed(direction, 'src_port', 'dst_port', self.number(self.next()))
+        raise ValueError(f'Unknown primitive "{token}" in capture filter.')
+
+    @staticmethod
+    def directed(direction, src_field, dst_field, value):
+        if direction == 'src':
+            return lambda s: s[src_field] == value
+        if direction == 'dst':
+            return lambda s: s[dst_field] == value
+        return lambda s: s[src_field] == value or s[dst_field] == value
+
+    @staticmethod
+    def number(token):
+        try:
+            return int(token, 0)
+        except ValueError:
+            raise ValueError(f'Invalid number "{token}" in capture filter.')
+
+class CaptureSettings:
+    """
+    Capture settings of a switch.
+
+    Attributes:
+        filter: CaptureFilter selecting the captured frames.
+        sample_rate: Fraction (0 to 1) of the captured frames persisted to disk.
+        mirror: PACKET_IN messages of the switch are copies sent by a mirror function, they are only
+            captured and never forwarded.
+    """
+    def __init__(self, filter, sample_rate, mirror=False):
+        self.filter = filter
+        self.sample_rate = sample_rate
+        self.mirror = mirror
+
+    def to_dict(self):
+        return {'filter': self.filter.expression, 'sample_rate': self.sample_rate, 'mirror': self.mirror}
+
+class PcapFile:
+    """
+    Pcap file being written for a switch.
+
+    Attributes:
+        name: Path of the file relative to the capture directory.
+        size: Current size of the file in bytes.
+    """
+    def __init__(self, directory, dpid, sequence):
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+        self.name = os.path.join(str(dpid), f'capture-{dpid}-{stamp}-{sequence:06d}.pcap')
+        path = os.path.join(directory, self.name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, 'wb')
+        self.file.write(pcap_header())
+        self.size = PCAP_HEADER.size
+
+    def write(self, sec, nsec, data, original_length):
+        """
+        Appends a packet record.
+
+        Returns:
+            Offset of the record in the file.
+        """
+        offset = self.size
+        self.file.write(PCAP_RECORD.pack(sec, nsec, len(data), original_length))
+        self.file.write(data)
+        self.size += PCAP_RECORD.size + len(data)
+        return offset
+
+    def close(self):
+        self.file.close()
+
+def pcap_header():
+    return PCAP_HEADER.pack(PCAP_MAGIC, 2, 4, 0, 0, PCAP_SNAPLEN, LINKTYPE_ETHERNET)
+
+def pcap_record(sec, nsec, frame, original_length):
+    return PCAP_RECORD.pack(sec, nsec, len(frame), original_length) + bytes(frame)
+
+class CaptureEngine:
+    """
+    Packet capture fed with the frames of PACKET_IN messages.
+
+    The last frames of each switch are kept in a fixed-size ring in memory. Frames matching the switch's
+    filter are sampled, and the sampled ones are handed to a writer thread that appends them to rotating
+    pcap files on disk. Only an index row (time, addresses, protocol, file and offset) is stored in the
+    packet_captures table, written in batches. Nothing on the PACKET_IN path waits for the disk or the
+    database: when the writer falls behind, sampled frames are dropped and counted.
+
+    Attributes:
+        app: Flask application instance for database context.
+        enabled: Frames are captured.
+        directory: Directory of the pcap files.
+        defaults: CaptureSettings of switches without their own settings.
+        settings: CaptureSettings of each switch, mapped by DPID.
+        rings: Recent (timestamp, data, summary) tuples of each switch, mapped by DPID.
+        counters: Capture counters of each switch, mapped by DPID.
+        pending: Sampled frames waiting for the writer thread.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.enabled = app.config['CAPTURE_ENABLED']
+        self.directory = app.config['CAPTURE_DIR']
+        self.ring_size = app.config['CAPTURE_RING_SIZE']
+        self.file_bytes = app.config['CAPTURE_FILE_BYTES']
+        self.max_files = app.config['CAPTURE_MAX_FILES']
+        self.flush_interval = app.config['CAPTURE_FLUSH_INTERVAL']
+        self.defaults = CaptureSettings(CaptureFilter(app.config['CAPTURE_FILTER']), app.config['CAPTURE_SAMPLE_RATE'])
+        self.settings = {}
+        self.rings = {}
+        self.counters = {}
+        self.pending = queue.Queue(maxsize=app.config['CAPTURE_QUEUE_SIZE'])
+        self.files = {}
+        self.sequence = 0
+        self.device_ids = {}
+        self.stopped = threading.Event()
+
+    def start(self):
+        """
+        Starts writing the sampled frames in a background daemon thread.
+
+        Returns:
+            Reference to the instance for further use.
+        """
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+            threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def stop(self):
+        """
+        Stops the writer thread once the pending frames are written.
+        """
+        self.stopped.set()
+
+    def configure(self, dpid, filter=None, sample_rate=None, mirror=None):
+        """
+        Sets the capture settings of a switch, unspecified settings keep their current value.
+
+        Raises:
+            ValueError: If the filter or the sample rate is invalid.
+        """
+        current = self.settings.get(dpid, self.defaults)
+        capture_filter = CaptureFilter(filter) if filter is not None else current.filter
+        sample_rate = current.sample_rate if sample_rate is None else float(sample_rate)
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError('sample_rate must be between 0 and 1.')
+        settings = CaptureSettings(capture_filter, sample_rate, current.mirror if mirror is None else bool(mirror))
+        self.settings[dpid] = settings
+        return settings
+
+    def reset(self, dpid):
+        """
+        Puts a switch back on the default settings.
+        """
+        self.settings.pop(dpid, None)
+
+    def feed(self, dpid, data):
+        """
+        Captures the frame of a PACKET_IN message. Runs in the reactor thread.
+
+        Args:
+            dpid: The switch the frame comes from.
+            data: PacketIn data, the switch metadata followed by the Ethernet frame.
+
+        Returns:
+            True if the switch's PACKET_IN messages are mirrored copies that must not be forwarded.
+        """
+        settings = self.settings.get(dpid, self.defaults)
+        if not self.enabled or len(data) < METADATA.size + 14:
+            return settings.mirror
+
+        counters = self.counters.get(dpid)
+        if counters is None:
+            counters = self.counters[dpid] = {'captured': 0, 'filtered': 0, 'persisted': 0, 'dropped': 0}
+            self.rings[dpid] = deque(maxlen=self.ring_size)
+        frame = memoryview(data)[METADATA.size:]
+        try:
+            summary = summarise(frame)
+        except struct.error:
+            return settings.mirror
+        if not settings.filter.matches(summary):
+            counters['filtered'] += 1
+            return settings.mirror
+
+        counters['captured'] += 1
+        _, sec, nsec, length = METADATA.unpack_from(data)
+        if not sec:
+            now = time.time_ns()
+            sec, nsec = now // 1000000000, now % 1000000000
+        # PacketIn data is immutable, the ring and the writer keep a reference instead of a copy
+        self.rings[dpid].append((sec, nsec, length, data, summary))
+        if settings.sample_rate >= 1.0 or random.random() < settings.sample_rate:
+            try:
+                self.pending.put_nowait((dpid, sec, nsec, length, data, summary))
+            except queue.Full:
+                counters['dropped'] += 1
+        return settings.mirror
+
+    def run(self):
+        """
+        Writes the sampled frames to the pcap files and their index rows to the database until stopped.
+        """
+        rows = []
+        flushed = time.monotonic()
+        while not (self.stopped.is_set() and self.pending.empty()):
+            try:
+                item = self.pending.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            if item is not None:
+                try:
+                    rows.append(self.write(*item))
+                except OSError as e:
+                    logging.error(f"Error writing captured packet of device {item[0]}: {e}")
+            if rows and (time.monotonic() - flushed >= self.flush_interval or len(rows) >= 1000 or self.stopped.is_set()):
+                self.flush(rows)
+                rows = []
+                flushed = time.monotonic()
+        for capture_file in self.files.values():
+            capture_file.close()
+
+    def write(self, dpid, sec, nsec, length, data, summary):
+        """
+        Appends a frame to the pcap file of its switch, rotating the file when it is full.
+
+        Returns:
+            The index row of the frame.
+        """
+        capture_file = self.files.get(dpid)
+        if capture_file is None or capture_file.size >= self.file_bytes:
+            if capture_file is not None:
+                capture_file.close()
+            self.sequence += 1
+            capture_file = self.files[dpid] = PcapFile(self.directory, dpid, self.sequence)
+            self.prune(dpid)
+        frame = memoryview(data)[METADATA.size:]
+        offset = capture_file.write(sec, nsec, frame, max(length, len(frame)))
+        self.counters[dpid]['persisted'] += 1
+        return {
+            'dpid': dpid,
+            'timestamp': datetime.fromtimestamp(sec + nsec / 1e9, timezone.utc).replace(tzinfo=None),
+            'source_ip': summary['src_ip'],
+            'destination_ip': summary['dst_ip'],
+            'source_mac': summary['src_mac'],
+            'destination_mac': summary['dst_mac'],
+            'protocol': summary['protocol'],
+            'file_name': capture_file.name,
+            'file_offset': offset,
+            'length': len(frame),
+        }
+
+    def prune(self, dpid):
+        """
+        Deletes the oldest pcap files of a switch beyond the number kept, with their index rows.
+        """
+        directory = os.path.join(self.directory, str(dpid))
+        names = sorted(name for name in os.listdir(directory) if name.endswith('.pcap'))
+        expired = [os.path.join(str(dpid), name) for name in names[:max(0, len(names) - self.max_files)]]
+        if not expired:
+            return
+        for name in expired:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError as e:
+                logging.error(f"Error deleting capture file {name}: {e}")
+        try:
+            with self.app.app_context():
+                PacketCapture.query.filter(PacketCapture.file_name.in_(expired)).delete(synchronize_session=False)
+                db.session.commit()
+        except Exception as e:
+            logging.error(f"Error deleting the index of capture files {expired}: {e}")
+        logging.info(f"Rotated capture files of device {dpid}, deleted {len(expired)} old files.")
+
+    def flush(self, rows):
+        """
+        Writes a batch of index rows, after making the frames they point to readable.
+        """
+        for capture_file in self.files.values():
+            capture_file.file.flush()
+        try:
+            with self.app.app_context():
+                missing = {row['dpid'] for row in rows} - set(self.device_ids)
+                if missing:
+                    for device in Device.query.filter(Device.dpid.in_(list(missing))).all():
+                        self.device_ids[device.dpid] = device.id
+                values = [
+                    {key: value for key, value in row.items() if key != 'dpid'} | {'device_id': self.device_ids[row['dpid']]}
+                    for row in rows if row['dpid'] in self.device_ids
+                ]
+                if values:
+                    db.session.execute(insert(PacketCapture), values)
+                    db.session.commit()
+        except Exception as e:
+            logging.error(f"Error storing the index of {len(rows)} captured packets: {e}")
+
+    def recent(self, dpid, capture_filter=None, limit=100):
+        """
+        Returns the most recent frames of a switch's ring, newest first.
+
+        Args:
+            dpid: The switch.
+            capture_filter: Optional CaptureFilter the frames must match.
+            limit: Maximum number of frames.
+
+        Returns:
+            List of (sec, nsec, length, data, summary) tuples.
+        """
+        frames = []
+        for frame in reversed(list(self.rings.get(dpid, ()))):
+            if capture_filter is None or capture_filter.matches(frame[4]):
+                frames.append(frame)
+                if len(frames) >= limit:
+                    break
+        return frames
+
+    def export(self, locations, capture_filter=None):
+        """
+        Streams the packets stored at the given locations as a pcap file.
+
+        Args:
+            locations: Iterable of (file name, offset) in the order the packets should appear.
+            capture_filter: Optional CaptureFilter the frames must match.
+
+        Yields:
+            Chunks of the pcap file.
+        """
+        yield pcap_header()
+        handles = {}
+        try:
+            for name, offset in locations:
+                handle = handles.get(name)
+                if handle is None:
+                    try:
+                        handle = handles[name] = open(os.path.join(self.directory, name), 'rb')
+                    except OSError:
+                        # Rotated away since the index was read
+                        continue
+                handle.seek(offset)
+                header = handle.read(PCAP_RECORD.size)
+                if len(header) < PCAP_RECORD.size:
+                    continue
+                captured = PCAP_RECORD.unpack(header)[2]
+                frame = handle.read(captured)
+                if capture_filter is not None:
+                    try:
+                        if not capture_filter.matches(summarise(frame)):
+                            continue
+                    except struct.error:
+                        continue
+                yield header + frame
+        finally:
+            for handle in handles.values():
+                handle.close()
+
+    def status(self):
+        """
+        Returns the capture settings and counters of each switch.
+        """
+        dpids = set(self.counters) | set(self.settings)
+        return {
+            'enabled': self.enabled,
+            'defaults': self.defaults.to_dict(),
+            'pending': self.pending.qsize(),
+            'switches': {
+                str(dpid): {
+                    'settings': self.settings.get(dpid, self.defaults).to_dict(),
+                    'ring': len(self.rings.get(dpid, ())),
+                    **self.counters.get(dpid, {}),
+                }
+                for dpid in sorted(dpids)
+            },
+        }
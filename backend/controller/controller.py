@@ -1,15 +1,31 @@
 import logging
 import struct
 import time
+from collections import Counter
 from datetime import datetime, timezone
-from threading import Thread
-from twisted.internet import reactor
+from threading import Lock, Thread
+from sqlalchemy.dialects.postgresql import insert
 
-from core import eBPFCoreApplication, set_event_handler
+from core import eBPFCoreApplication, set_event_handler, register_executor
 from core.packets import *
 
 from shared import db
-from shared.models import Device, DeviceFunction, EventLog, MonitoringData, AssetDiscovery
+from shared.models import Device, DeviceFunction, EventLog, MonitoringData, AssetDiscovery, AssetInventory
+from topology_cache import topology_cache
+from stream import broker
+from replies import ReplyTracker
+from reconciler import Reconciler
+from mitigation import MitigationEngine
+from tables import TableBrowser
+from learning import LearningSwitch
+from capture import CaptureEngine
+from goose import GooseAnalyser
+from snapshot import StateSnapshot
+from talkers import TopTalkers
+from sketches import BandwidthSketches
+from baselines import BaselineDetector
+from links import LinkUtilization
+from poller import MonitoringPoller
 
 class eBPFController(eBPFCoreApplication):
     """
@@ -19,36 +35,92 @@ class eBPFController(eBPFCoreApplication):
         app: Flask application instance for database context.
         connected_devices: Set to keep track of connected devices.
         connections: Dictionary to store device connections mapped by device ID (dpid).
-        monitoring_cache: Cache to hold monitoring data for bandwidth calculations.
+        monitoring_cache: Last byte counter of each MAC mapped by (dpid, MAC), for bandwidth calculations.
+        monitoring_polled: Time of the last monitoring sample of each switch, mapped by dpid.
         pending_functions: Dictionary to track pending function installation requests.
+        asset_cache: In-memory asset inventory mapped by dpid, mirroring the asset_inventory table.
+        asset_requests: Time of the last asset discovery table request mapped by dpid.
+        installed_artifacts: Content hash of the function installed at each stage, mapped by (dpid, index).
+        restored_functions: Function name of the stages restored from the state snapshot, until the switch is listed.
+        replies: Tracker matching switch replies to the requests waiting for them.
+        reconciler: Reconciler bringing the function pipeline of each switch in line with its desired state.
+        mitigation: DDoS mitigation engine fed with the monitoring samples.
+        tables: Browser reading switch tables on demand.
+        learning: Centralized learning switch handling PACKET_IN events.
+        capture: Packet capture fed with the frames of PACKET_IN events.
+        goose: GOOSE analyser tracking the stNum/sqNum of every publisher.
+        snapshots: Periodic on-disk snapshots of this state, restored on startup.
+        talkers: Streaming top-K talkers of each switch and of the network.
+        sketches: Bandwidth quantile sketches of every MAC and switch, per time bucket.
+        baselines: EWMA baselines of the per MAC rates, raising anomalies on large deviations.
+        links: Utilization of the topology's links, mapped from the per MAC counters.
+        poller: Poller of the monitor table of the switches running the monitoring function.
+        function_stages: Stages of the functions whose tables are polled or written, as the switches report them.
     """
     def __init__(self, app):
-        super().__init__()
+        super().__init__(app.config['SCHEDULER_BUDGET'], app.config['SCHEDULER_QUANTUM'], app.config['SCHEDULER_HIGH_WATER'],
+                         core=app.config['CONTROLLER_CORE'], use_uvloop=app.config['CONTROLLER_UVLOOP'])
+        register_executor('telemetry', 'thread', app.config['TELEMETRY_WORKERS'])
         self.app = app
         self.connected_devices = set()
         self.connections = {}
         self.monitoring_cache = {}
+        self.monitoring_polled = {}
         self.pending_functions ={}
+        self.stage_lock = Lock()
+        self.asset_cache = {}
+        self.asset_lock = Lock()
+        self.asset_requests = {}
+        self.installed_artifacts = {}
+        self.pending_artifacts = {}
+        self.restored_functions = {}
+        self.replies = ReplyTracker()
+        self.reconciler = Reconciler(app, self)
+        self.mitigation = MitigationEngine(app, self)
+        self.tables = TableBrowser(app, self)
+        self.learning = LearningSwitch(app, self)
+        self.capture = CaptureEngine(app)
+        self.goose = GooseAnalyser(app, self)
+        self.snapshots = StateSnapshot(app, self)
+        self.talkers = TopTalkers(app)
+        self.sketches = BandwidthSketches(app)
+        self.baselines = BaselineDetector(app, self)
+        self.links = LinkUtilization(app)
+        self.poller = MonitoringPoller(app, self)
+        self.function_stages = (self.poller.stages, self.mitigation.stages, self.goose.stages)
 
     def run(self):
         """
-        Starts the Twisted reactor in a separate daemon thread.
+        Starts the event loop of the core (Twisted reactor or asyncio) in a separate daemon thread.
 
         This allows the controller to handle asynchronous events without blocking the main applicaition.
 
         Returns:
             Reference to the instance for further use.
         """
-        Thread(target=reactor.run, kwargs={'installSignalHandlers': 0}, daemon=True).start()
-        logging.info("Twisted reactor started.")
+        # Restore the counter baselines, poll schedule and placement before the switches reconnect
+        self.snapshots.load()
+        Thread(target=self.runtime.run, kwargs={'install_signal_handlers': False}, daemon=True).start()
+        self.reconciler.start()
+        self.capture.start()
+        self.goose.start()
+        self.snapshots.start()
+        self.sketches.start()
+        self.poller.start()
+        logging.info(f"Controller core started on {self.runtime.name}.")
         return self
     
     def stop(self):
         """
-        Stops the controller and twisted reactor, and performs any necessary cleanup.
+        Stops the controller and its event loop, and performs any necessary cleanup.
         """
-        logging.info("Stopping controller and Twisted reactor.")
-        reactor.callFromThread(reactor.stop)
+        logging.info(f"Stopping controller and {self.runtime.name} event loop.")
+        super().stop()
+        self.capture.stop()
+        self.goose.stop()
+        self.snapshots.stop()
+        self.sketches.stop()
+        self.poller.stop()
 
     @staticmethod
     def get_switch_name(dpid, db_session):
@@ -92,12 +164,50 @@ class eBPFController(eBPFCoreApplication):
             logging.error(f"Error parsing value bytes and packets: {e}")
             return {"bytes": 0, "packets": 0}
 
+    @staticmethod
+    def serialise_event(event):
+        """
+        Serialises an EventLog entry for live dashboard clients.
+
+        Args:
+            event: The EventLog entry.
+
+        Returns:
+            A dictionary with the event data.
+        """
+        return {
+            'id': event.id,
+            'timestamp': event.timestamp.isoformat(),
+            'device_id': event.device_id,
+            'message': event.message,
+            'event_type': event.event_type,
+            'data': event.data
+        }
+
     @set_event_handler(Header.TABLE_LIST_REPLY)
     def table_list_reply(self, connection, pkt):
         """
-        Handles TABLE_LIST_REPLY events from connected devices.
+        Hands TABLE_LIST_REPLY events to the table browser request waiting for them.
 
-        Depending on the table name in the reply, it processes monitoring or asset discovery data.
+        Every table list request is registered with the reply tracker (see request_table), so the reply
+        goes to the request it answers. Replies of telemetry polls, and replies nobody waits for any
+        more, are left to table_list_data.
+
+        Args: 
+            connection: The conneciton object representing the device.
+            pkt: The packet containing the table list reply data.
+
+        Returns:
+            True if a request took the reply, which then is not processed as telemetry.
+        """
+        return self.replies.resolve(connection.dpid, Header.TABLE_LIST_REPLY, pkt, key=pkt.entry.table_name or None)
+
+    @set_event_handler(Header.TABLE_LIST_REPLY, executor='telemetry', ordered=True)
+    def table_list_data(self, connection, pkt):
+        """
+        Handles TABLE_LIST_REPLY events from connected devices on the telemetry pool, in order for each switch.
+
+        Depending on the table name in the reply, it processes monitoring, asset discovery or GOOSE analyser data.
 
         Args: 
             connection: The conneciton object representing the device.
@@ -112,8 +222,24 @@ class eBPFController(eBPFCoreApplication):
             elif pkt.entry.table_name == "assetdisc":
                 logging.info(f"Received asset discovery data reply from device {connection.dpid}, table: {pkt.entry.table_name}.")
                 self.asset_disc_list(connection.dpid, pkt)
+            elif pkt.entry.table_name == "goose_analyser":
+                self.goose_analyser_list(connection.dpid, pkt)
         except Exception as e:
             logging.error(f"Error in TABLE_LIST_REPLY: {e}")
+
+    def request_table(self, connection, index, table_name):
+        """
+        Requests the entries of a table for table_list_data. Safe to call from any thread.
+
+        The request is registered with the reply tracker like the table browser's, so the replies of a
+        switch are matched in the order the requests were sent and never taken by another request.
+
+        Args:
+            connection: The switch connection.
+            index: Stage of the function holding the table.
+            table_name: Name of the table.
+        """
+        self.replies.send(connection, TableListRequest(index=index, table_name=table_name), Header.TABLE_LIST_REPLY, handlers=True)
         
     def monitoring_list(self, dpid, pkt):
         """
@@ -131,6 +257,15 @@ class eBPFController(eBPFCoreApplication):
             item_size = pkt.entry.key_size + pkt.entry.value_size
             fmt = f"{pkt.entry.key_size}s{pkt.entry.value_size}s"
 
+            timestamp = datetime.now(timezone.utc)
+            now = time.time()
+            # Samples are bytes per second over the time since the previous poll of the switch
+            elapsed = now - self.monitoring_polled.get(dpid, now)
+            self.monitoring_polled[dpid] = now
+            samples = {}
+            rates = {}
+            deltas = {}
+            values = {}
             with self.app.app_context():
                 for i in range(pkt.n_items):
                     key, value = struct.unpack_from(fmt, pkt.items, i * item_size)
@@ -141,79 +276,206 @@ class eBPFController(eBPFCoreApplication):
                     value_data = self.parse_values_bytes_packets(value)
                     bytes_total = value_data['bytes']
 
-                    if mac_address not in self.monitoring_cache:
-                        self.monitoring_cache[mac_address] = 0
+                    # Counters are per switch, so is the previous value. A first reading is only a baseline
+                    previous = self.monitoring_cache.get((dpid, mac_address))
+                    self.monitoring_cache[(dpid, mac_address)] = bytes_total
+                    if previous is None:
+                        continue
+                    rates[mac_address] = deltas[key] = max(bytes_total - previous, 0)
 
-                    bandwidth = bytes_total - self.monitoring_cache[mac_address]
+                    bandwidth = bytes_total - previous
+                    if elapsed > 0:
+                        bandwidth = int(bandwidth / elapsed)
+                    if bandwidth >= 0:
+                        values[mac_address] = bandwidth
             
                     if bandwidth > 0:
                         monitoring_data = MonitoringData(
-                            timestamp=datetime.now(timezone.utc),
+                            timestamp=timestamp,
                             device_id=dpid,
                             mac_address=mac_address,
                             bandwidth=bandwidth
                         )
                         db.session.add(monitoring_data)
+                        samples[mac_address] = bandwidth
                         logging.debug(f"Stored bandwidth for {mac_address}: {bandwidth} bytes/sec")
 
-                    self.monitoring_cache[mac_address] = bytes_total
-
                 db.session.commit()
                 logging.info(f"Monitoring data stored for device {dpid}.")
+
+                # Block or release DDoS sources within the same poll, a first counter reading is not a rate
+                self.mitigation.observe(dpid, {mac: rate for mac, rate in rates.items() if rate})
+            self.talkers.observe(dpid, deltas, 'monitoring')
+            self.links.observe(dpid, deltas, elapsed)
+            self.sketches.observe(dpid, timestamp, samples)
+            self.baselines.observe(dpid, 'bandwidth', values)
+
+            # Push the new samples to live dashboard clients
+            broker.publish('bandwidth', {'device_id': dpid, 'timestamp': timestamp.isoformat(), 'bandwidth': samples}, key=dpid)
         
         except Exception as e:
             logging.error(f"Error processing monitoring data for device {dpid}: {e}")
             db.session.rollback()
 
+    def load_asset_inventory(self, dpid):
+        """
+        Returns the in-memory asset inventory of a switch, loading it from the database on first use.
+
+        Args:
+            dpid: The unique identifier of the switch.
+
+        Returns:
+            A dictionary with the switch's device ID and its assets mapped by MAC address, or None if
+            the switch is not in the database.
+        """
+        inventory = self.asset_cache.get(dpid)
+        if inventory is not None:
+            return inventory
+
+        device = Device.query.filter_by(dpid=dpid).first()
+        if not device:
+            return None
+        assets = {}
+        for asset in AssetInventory.query.filter_by(switch_id=device.id).all():
+            assets[asset.mac_address] = {
+                'first_seen': asset.first_seen,
+                'last_seen': asset.last_seen,
+                'bytes': asset.bytes,
+                'packets': asset.packets,
+                'present': asset.present,
+                # Counters at the last history row, assume the stored state was recorded
+                'history_bytes': asset.bytes,
+                'history_packets': asset.packets,
+            }
+        inventory = {'device_id': device.id, 'assets': assets}
+        with self.asset_lock:
+            self.asset_cache[dpid] = inventory
+        return inventory
+
     def asset_disc_list(self, dpid, pkt):
         """
-        Processes asset discovery data from a device and stores it in the database.
+        Processes asset discovery data from a device and updates the asset inventory.
+
+        The asset_inventory table keeps the current state of each (switch, MAC) and is upserted in one
+        statement per table dump. History rows are only added to asset_discovery when a MAC appears or
+        goes away, or when its counters moved past the configured deltas since its last history row.
+        MACs seen for the first time are classified by vendor and logged as counts per vendor.
         """
         try:
             logging.info(f"Processing asset discovery data for device {dpid}.")
             item_size = pkt.entry.key_size + pkt.entry.value_size
             fmt = f"{pkt.entry.key_size}s{pkt.entry.value_size}s"
+            bytes_delta = self.app.config['ASSET_HISTORY_BYTES_DELTA']
+            packets_delta = self.app.config['ASSET_HISTORY_PACKETS_DELTA']
+            now = datetime.now(timezone.utc)
             with self.app.app_context():
-                
-                device = Device.query.filter_by(dpid=dpid).first()
-                if not device:
+                inventory = self.load_asset_inventory(dpid)
+                if not inventory:
                     logging.error(f"Device with DPID {dpid} not found in the database.")
                     return
-                device_id = device.id
-                for i in range(pkt.n_items):
-                    key, value = struct.unpack_from(fmt, pkt.items, i * item_size)
-                    mac_address = ':'.join(f'{b:02x}' for b in key)
-                    logging.debug(f"Processing MAC address: {mac_address}")
-                    if len(value) != 8:
-                        logging.error(f"Invalid value size: expected 8 bytes, got {len(value)} bytes.")
-                        continue
-                    bytes_count, packets_count = struct.unpack('<II', value)
-                    logging.debug(f"Bytes: {bytes_count}, Packets: {packets_count}")
-                    asset_discovery = AssetDiscovery(
-                        timestamp=datetime.now(timezone.utc),
-                        switch_id=device_id,  
+                device_id = inventory['device_id']
+                assets = inventory['assets']
+                changed = {}
+                history = []
+                deltas = {}
+                discovered = Counter()
+
+                with self.asset_lock:
+                    for i in range(pkt.n_items):
+                        key, value = struct.unpack_from(fmt, pkt.items, i * item_size)
+                        mac_address = ':'.join(f'{b:02x}' for b in key)
+                        logging.debug(f"Processing MAC address: {mac_address}")
+                        if len(value) != 8:
+                            logging.error(f"Invalid value size: expected 8 bytes, got {len(value)} bytes.")
+                            continue
+                        bytes_count, packets_count = struct.unpack('<II', value)
+                        logging.debug(f"Bytes: {bytes_count}, Packets: {packets_count}")
+
+                        asset = assets.get(mac_address)
+                        if asset is None:
+                            asset = assets[mac_address] = {'first_seen': now, 'present': False}
+                            discovered[self.app.vendor_db.vendor(key)] += 1
+                        elif asset['present'] and bytes_count >= asset['bytes']:
+                            deltas[key] = bytes_count - asset['bytes']
+                        record = (
+                            not asset['present']
+                            or abs(bytes_count - asset['history_bytes']) >= bytes_delta
+                            or abs(packets_count - asset['history_packets']) >= packets_delta
+                        )
+                        asset.update(last_seen=now, bytes=bytes_count, packets=packets_count, present=True)
+                        if record:
+                            asset.update(history_bytes=bytes_count, history_packets=packets_count)
+                            history.append(mac_address)
+                        changed[mac_address] = asset
+
+                    # Assets no longer reported by the switch are gone
+                    for mac_address, asset in assets.items():
+                        if asset['present'] and mac_address not in changed:
+                            asset['present'] = False
+                            history.append(mac_address)
+                            changed[mac_address] = asset
+
+                    rows = [
+                        {
+                            'switch_id': device_id,
+                            'mac_address': mac_address,
+                            'first_seen': asset['first_seen'],
+                            'last_seen': asset['last_seen'],
+                            'bytes': asset['bytes'],
+                            'packets': asset['packets'],
+                            'present': asset['present'],
+                        }
+                        for mac_address, asset in changed.items()
+                    ]
+
+                if rows:
+                    stmt = insert(AssetInventory).values(rows)
+                    db.session.execute(stmt.on_conflict_do_update(
+                        index_elements=['switch_id', 'mac_address'],
+                        set_={
+                            'last_seen': stmt.excluded.last_seen,
+                            'bytes': stmt.excluded.bytes,
+                            'packets': stmt.excluded.packets,
+                            'present': stmt.excluded.present,
+                        }
+                    ))
+                for mac_address in history:
+                    asset = assets[mac_address]
+                    db.session.add(AssetDiscovery(
+                        timestamp=now,
+                        switch_id=device_id,
                         mac_address=mac_address,
-                        bytes=bytes_count,
-                        packets=packets_count
-                    )
-                    db.session.add(asset_discovery)
+                        bytes=asset['bytes'],
+                        packets=asset['packets']
+                    ))
                 db.session.commit()
-                logging.info(f"Asset discovery data stored for device {dpid}")
+                logging.info(f"Asset inventory updated for device {dpid}, {len(history)} history rows stored.")
+                if discovered:
+                    logging.info(f"New assets on device {dpid}: " + ', '.join(f"{count} {vendor}" for vendor, count in discovered.most_common()))
+            self.talkers.observe(dpid, deltas, 'assets')
+            self.baselines.observe(dpid, 'asset_bytes', {mac.hex(':'): delta for mac, delta in deltas.items()}, per_second=True)
         except Exception as e:
             logging.error(f"Error processing asset discovery data for device {dpid}: {e}")
             db.session.rollback()
+            # Reload the inventory from the database on the next dump
+            with self.asset_lock:
+                self.asset_cache.pop(dpid, None)
 
     def goose_analyser_list(self, dpid, pkt):
         """
-        Placeholder for GOOSE analyser functionality.
+        Processes the GOOSE analyser table of a device, storing counter changes and raising anomalies.
+
+        Args:
+            dpid: The device ID.
+            pkt: The packet containing the goose_analyser table.
         """
-        pass
+        self.goose.process(dpid, pkt)
 
     @set_event_handler(Header.NOTIFY)
     def notify_event(self, connection, pkt):
         """
-        Handles NOTIFY events by identifying the vendor based on packets data and requesting asset
-        discovery tables from the connected device.
+        Handles NOTIFY events by identifying the vendor of the reported MAC from the OUI registries and
+        requesting asset discovery tables from the connected device.
 
         Args:
             connection: Represents the device connection.
@@ -226,11 +488,7 @@ class eBPFController(eBPFCoreApplication):
         logging.info(f'[{connection.dpid}] Received notify event {pkt.id}, data length {len(pkt.data)}')
         logging.debug(f'Packet Data: {pkt.data.hex()}')
 
-        vendor_map = {
-            '30b216000004': 'Hitachi',
-            'b4b15a000001': 'Siemens'
-        }
-        vendor = vendor_map.get(pkt.data.hex(), 'unknown')
+        vendor = self.app.vendor_db.vendor(pkt.data)
         logging.info(f'IED device detected with MAC: {pkt.data.hex()} ({vendor})')
 
         # Log event in the database
@@ -240,30 +498,43 @@ class eBPFController(eBPFCoreApplication):
                 device_id=connection.dpid,
                 message=f'IED device detected with MAC: {pkt.data.hex()} ({vendor})',
                 event_type='INFO',
-                data={'vendor': vendor}
+                data={'vendor': vendor, 'mac_address': pkt.data.hex(':')}
             )
             db.session.add(new_event)
             try:
                 db.session.commit()
+                broker.publish('events', self.serialise_event(new_event))
             except Exception as e:
                 logging.error(f"Failed to log event: {e}")
                 db.session.rollback()
 
-        # Request table lists
+        # Request table lists, at most once per interval since notifications arrive per packet
+        now = time.monotonic()
+        if now - self.asset_requests.get(connection.dpid, 0) < self.app.config['ASSET_DUMP_MIN_INTERVAL']:
+            return
+        self.asset_requests[connection.dpid] = now
         try:
-            connection.send(TableListRequest(index=0, table_name="assetdisc"))
-            connection.send(TableListRequest(index=1, table_name="assetdisc"))
+            self.request_table(connection, 0, "assetdisc")
+            self.request_table(connection, 1, "assetdisc")
         except Exception as e:
             logging.error(f"Failed to send a TableListRequest: {e}")
 
     @set_event_handler(Header.PACKET_IN)
     def packet_in(self, connection, pkt):
         """
-        Placeholder for PACKET_IN events from the network.
+        Handles PACKET_IN events by capturing the frame, then learning the source MAC and forwarding
+        the frame with a PacketOut. Frames mirrored to the controller for capture are not forwarded.
 
-        Currently unimplemented.
+        Args:
+            connection: The device connection object.
+            pkt: Packet containing the switch metadata and the Ethernet frame.
         """
-        pass
+        try:
+            if self.capture.feed(connection.dpid, pkt.data):
+                return
+            self.learning.handle(connection, pkt)
+        except Exception as e:
+            logging.error(f"Error handling PACKET_IN from device {connection.dpid}: {e}")
 
     @set_event_handler(Header.FUNCTION_ADD_REPLY)
     def function_add_reply(self, connection, pkt):
@@ -284,10 +555,25 @@ class eBPFController(eBPFCoreApplication):
             logging.error("Unable to install this function")
         else:
             logging.info("Function has been installed")
+
+        dpid = connection.dpid
+        digest = self.pending_artifacts.pop((dpid, pkt.index), None)
+        if digest and pkt.status == FunctionAddReply.FunctionAddStatus.OK:
+            self.installed_artifacts[(dpid, pkt.index)] = digest
+        if pkt.status == FunctionAddReply.FunctionAddStatus.OK:
+            name = pkt.name or self.pending_functions.get((dpid, pkt.index))
+            self.learning.stage_added(dpid, pkt.index, name)
+            for stages in self.function_stages:
+                stages.stage_added(dpid, pkt.index, name)
+
+        # Replies awaited by a bulk rollout are persisted by the rollout in a single transaction
+        if self.replies.resolve(dpid, Header.FUNCTION_ADD_REPLY, pkt, key=pkt.index):
+            self.pending_functions.pop((dpid, pkt.index), None)
+            return
+
         try:
             with self.app.app_context():
                 status = pkt.status
-                dpid = connection.dpid
                 device = Device.query.filter_by(dpid=dpid).first()
                 device_id = device.id if device else None
 
@@ -303,24 +589,51 @@ class eBPFController(eBPFCoreApplication):
                         device_function = DeviceFunction(device_id=device_id, function_name=function_name, index=pkt.index, status="installed")
                         db.session.add(device_function)
                         db.session.commit()
+                        topology_cache.bump(device_id)
                         logging.info(f"Function {function_name} added succesfully to device {device_id}")
                     else:
                         logging.error(f"Function addition failed on device {device_id}, status: {status}")
 
                     self.pending_functions.pop((dpid, pkt.index), None)
                 else:
+                    self.pending_functions.pop((dpid, pkt.index), None)
                     logging.error(f"Function addition failed for device {device_id}, status: {status}")
                 
         except Exception as e:
             logging.error(f"Error handling function add reply: {e}")
 
-    def send_function_add_request(self, connection, request):
+    def reserve_stage(self, dpid, entries, function_name, digest=None):
+        """
+        Picks the stage a function is appended at on a switch and reserves it until the install is answered.
+
+        The stage follows the last one running on the switch and the stages of the installs still waiting
+        for their reply, so concurrent installs never pick the same stage and overwrite each other.
+
+        Args:
+            dpid: The switch.
+            entries: FunctionListReply entries of the switch's running pipeline.
+            function_name: Name of the function to install.
+            digest: Content hash of the function's ELF.
+
+        Returns:
+            The reserved stage index.
+        """
+        with self.stage_lock:
+            pending = [index + 1 for (device, index) in list(self.pending_functions) if device == dpid]
+            index = max([entry.index + 1 for entry in entries] + pending, default=0)
+            self.pending_functions[(dpid, index)] = function_name
+            if digest:
+                self.pending_artifacts[(dpid, index)] = digest
+        return index
+
+    def send_function_add_request(self, connection, request, digest=None):
         """
         Sends a request to add a function to the specified device.
 
         Args: 
             connection: Represents the device connection.
             request: The function addition request.
+            digest: Content hash of the function's ELF, recorded for the stage once the install succeeds.
 
         Logs:
             Request details and success messages.
@@ -332,6 +645,8 @@ class eBPFController(eBPFCoreApplication):
             index = request.index
 
             self.pending_functions[(dpid, index)] = function_name
+            if digest:
+                self.pending_artifacts[(dpid, index)] = digest
             connection.send(request)
             logging.info(f"Function add request sent: name={function_name}, index={index}")
         except Exception as e:
@@ -346,9 +661,20 @@ class eBPFController(eBPFCoreApplication):
             logging.error("Cannot remove a function from this index.")
         else:
             logging.info("Function has been removed successfully.")
+
+        dpid = connection.dpid
+        if pkt.status == FunctionRemoveReply.FunctionRemoveStatus.OK:
+            self.shift_artifacts(dpid, pkt.index)
+            self.learning.stage_removed(dpid, pkt.index)
+            for stages in self.function_stages:
+                stages.stage_removed(dpid, pkt.index)
+
+        # Replies awaited by a bulk rollout are persisted by the rollout in a single transaction
+        if self.replies.resolve(dpid, Header.FUNCTION_REMOVE_REPLY, pkt, key=pkt.index):
+            return
+
         try: 
             with self.app.app_context():
-                dpid = connection.dpid
                 status = pkt.status
                 index = pkt.index
 
@@ -374,12 +700,77 @@ class eBPFController(eBPFCoreApplication):
                             logging.info(f"Updated function {func.function_name} to index {func.index}.")
 
                         db.session.commit()
+                        topology_cache.bump(device_id)
                 else:
                     logging.error(f"Function removal failed on device {device_id} at index {index}, status: {status}.")
 
         except Exception as e:
             logging.error(f"Error handling Function_remove_reply: {e}")
 
+    @set_event_handler(Header.TABLE_ENTRY_INSERT_REPLY)
+    def table_entry_insert_reply(self, connection, pkt):
+        """
+        Handles TABLE_ENTRY_INSERT_REPLY events by handing the status to the request waiting for it.
+        """
+        if not self.replies.resolve(connection.dpid, Header.TABLE_ENTRY_INSERT_REPLY, pkt):
+            logging.info(f"Table entry insert on device {connection.dpid} replied with status {pkt.status}.")
+
+    @set_event_handler(Header.TABLE_ENTRY_DELETE_REPLY)
+    def table_entry_delete_reply(self, connection, pkt):
+        """
+        Handles TABLE_ENTRY_DELETE_REPLY events by handing the status to the request waiting for it.
+        """
+        if not self.replies.resolve(connection.dpid, Header.TABLE_ENTRY_DELETE_REPLY, pkt):
+            logging.info(f"Table entry delete on device {connection.dpid} replied with status {pkt.status}.")
+
+    @set_event_handler(Header.TABLES_LIST_REPLY)
+    def tables_list_reply(self, connection, pkt):
+        """
+        Handles TABLES_LIST_REPLY events by handing the table definitions to the request waiting for them.
+        """
+        if not self.replies.resolve(connection.dpid, Header.TABLES_LIST_REPLY, pkt):
+            logging.info(f"Unsolicited tables list from device {connection.dpid}.")
+
+    @set_event_handler(Header.TABLE_ENTRY_GET_REPLY)
+    def table_entry_get_reply(self, connection, pkt):
+        """
+        Handles TABLE_ENTRY_GET_REPLY events by handing the entry to the request waiting for it.
+        """
+        if not self.replies.resolve(connection.dpid, Header.TABLE_ENTRY_GET_REPLY, pkt, key=pkt.key or None):
+            logging.info(f"Unsolicited table entry from device {connection.dpid}.")
+
+    @set_event_handler(Header.FUNCTION_LIST_REPLY)
+    def function_list_reply(self, connection, pkt):
+        """
+        Handles FUNCTION_LIST_REPLY events by handing the running pipeline to the request waiting for it.
+        """
+        if not self.replies.resolve(connection.dpid, Header.FUNCTION_LIST_REPLY, pkt):
+            logging.info(f"Unsolicited function list from device {connection.dpid}: {[entry.name for entry in pkt.entries]}")
+
+    def verify_restored_functions(self, dpid, entries):
+        """
+        Checks the stages restored from the state snapshot against the functions a switch runs, dropping
+        the content hash of the stages now running another function.
+
+        Args:
+            dpid: The switch.
+            entries: FunctionListReply entries of the switch.
+        """
+        running = {entry.index: entry.name for entry in entries}
+        for stage in [stage for stage in self.restored_functions if stage[0] == dpid]:
+            if running.get(stage[1]) != self.restored_functions.pop(stage):
+                self.installed_artifacts.pop(stage, None)
+
+    def shift_artifacts(self, dpid, index):
+        """
+        Forgets the function removed from a stage and moves the following stages down by one,
+        as the switch does.
+        """
+        self.installed_artifacts.pop((dpid, index), None)
+        stages = sorted(stage for (device, stage) in self.installed_artifacts if device == dpid and stage > index)
+        for stage in stages:
+            self.installed_artifacts[(dpid, stage - 1)] = self.installed_artifacts.pop((dpid, stage))
+
     @set_event_handler(Header.HELLO)
     def hello(self, connection, pkt):
         """
@@ -435,40 +826,52 @@ class eBPFController(eBPFCoreApplication):
                 )
                 db.session.add(new_event)
                 db.session.commit()
+                topology_cache.bump(device.id)
+                broker.publish('events', self.serialise_event(new_event))
 
                 # Track connected devices and connections within the class
                 self.connected_devices.add(dpid)
                 self.connections[dpid] = connection
                 logging.info(f"Device {switch_name} (DPID: {dpid}) connected and tracked.")
+
+            # Restore the switch's function pipeline
+            self.reconciler.schedule(dpid)
         except Exception as e:
             logging.error(f"Error handling HELLO event: {e}")
 
-def start_monitoring(app, connections):
-    """
-    Starts a background thread to periodically send monitoring requests to devices.
-
-    Args:
-        app: Flask application instance for database context.
-        connections: Dictionary of device connections mapped by DPID.
-
-    Periodic Action: 
-        Sends monitoring requests to all connected devices every second.
+    @set_event_handler('disconnect')
+    def disconnect(self, connection, reason):
+        """
+        Handles device disconnections by marking the device as disconnected.
 
-    Logs:
-        Sent monitoring requests.
-        Errors during request sending.
-    """
-    def threaded_mon_timer():
-        while True:
-            with app.app_context():
-                for dpid, connection in connections.items():
-                    try:
-                        connection.send(TableListRequest(index=0, table_name="monitor"))
-                        logging.info(f"Sent monitoring request to device {dpid}.")
-                    except Exception as e:
-                        logging.error(f"Error sending monitoring request to device {dpid}: {e}")
-            time.sleep(1)
-
-    thread = Thread(target=threaded_mon_timer, daemon=True)
-    thread.start()
-    logging.info("Started periodic monitoring requests.")
+        Args:
+            connection: The device connection object.
+            reason: The reason the connection was lost.
+        """
+        dpid = getattr(connection, 'dpid', None)
+        if dpid is None:
+            return
+        self.connected_devices.discard(dpid)
+        # Stage contents are unknown until the switch is listed again
+        for stage in [stage for stage in self.installed_artifacts if stage[0] == dpid]:
+            del self.installed_artifacts[stage]
+        for stage in [stage for stage in self.restored_functions if stage[0] == dpid]:
+            del self.restored_functions[stage]
+        # Installs still waiting are lost with the connection, release their stages
+        with self.stage_lock:
+            for stage in [stage for stage in list(self.pending_functions) if stage[0] == dpid]:
+                del self.pending_functions[stage]
+                self.pending_artifacts.pop(stage, None)
+        self.replies.fail(dpid, 'connection lost')
+        self.learning.forget(dpid)
+        self.goose.forget(dpid)
+        logging.info(f"Device with DPID {dpid} disconnected.")
+        try:
+            with self.app.app_context():
+                device = Device.query.filter_by(dpid=dpid).first()
+                if device:
+                    device.status = 'disconnected'
+                    db.session.commit()
+                    topology_cache.bump(device.id)
+        except Exception as e:
+            logging.error(f"Error handling disconnect of device {dpid}: {e}")
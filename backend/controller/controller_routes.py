@@ -1,10 +1,25 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app
 import logging
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func
+from concurrent.futures import TimeoutError
 
-from controller import eBPFController, start_monitoring
+from controller import eBPFController
 from shared import db
-from shared.models import Device, Link, DeviceFunction, MonitoringData, AssetDiscovery
+from shared.models import Device, DeviceFunction, FunctionPipeline, PacketCapture, BandwidthSketch, MonitoringData, AssetDiscovery, AssetInventory, MonitoringRollup, AssetDiscoveryRollup
+from topology_cache import topology_cache
+from stream import broker
+from telemetry import AGGREGATES, BUCKETS, bucket_keyset, bucket_page, bucket_timestamp, bucketed, decode_bucket_cursor, filter_range, keyset_page, parse_timestamp, rollup_bucketed, union_buckets
+from rollups import choose_resolution, raw_expired
+from artifacts import ArtifactError, ArtifactNotFound
+from rollout import bulk_install, bulk_remove, list_pipelines, select_devices, timed
+from reconciler import save_pipeline, serialise_pipeline
+from tables import parse_bytes, write_entries
+from capture import CaptureFilter, pcap_header, pcap_record, METADATA
+from talkers import WINDOWS as TALKER_WINDOWS
+from sketches import SWITCH_SERIES, bucket_start, merged_quantiles
 
+from core import executor_status
 from core.packets import *
 
 controller_routes = Blueprint('controller_routes', __name__)
@@ -80,51 +95,71 @@ def get_topology():
     """
     Retrieves the network topology including devices and links.
 
+    The serialised topology is cached per topology version. Clients can revalidate with "If-None-Match"
+    to get a 304 response, or pass the version they already have to receive only what changed.
+
+    The ETag only follows the topology version and the epoch of the controller process, since versions
+    start over when it restarts. Link utilization changes with every poll and is not part of the full
+    topology; it is served in the deltas below and by /links.
+
+    Query parameters (optional):
+        since: Topology version the client already has. Only devices (with their functions) changed after
+            this version are returned, or the full topology if the version is too old. The utilization of
+            every link is included in link_utilization.
+        epoch: Epoch of the since version, as returned with it. The full topology is returned if it is
+            missing or from another controller process.
+
     Returns:
         JSON response containing serialised device and link data, or an error message.
     """
     try:
-        # Fetch devices and links from the database
-        devices = Device.query.all()
-        links = Link.query.all()
-
-        # Serialise devices into a structured dictionary
-        devices_data = []
-        for device in devices:
-            devices_data.append({
-                'id': str(device.id),
-                'name': device.name,
-                'device_type': device.device_type,
-                'status': device.status,
-                'dpid': device.dpid,
-                'ip_address': device.ip_address,
-                'mac_address': device.mac_address,
-                'functions': [
-                    {
-                        'id': func.id,
-                        'function_name': func.function_name,
-                        'status': func.status,
-                        'index': func.index
-                    } for func in device.functions
-                ]
-            })
-        # Serialise links into a structured dictionary
-        links_data = []
-        for link in links:
-            links_data.append({
-                'source_device_id': str(link.source_device_id),
-                'destination_device_id': str(link.destination_device_id),
-                'link_type': link.link_type,
-            })
-        
-        # Return the serialised topology data as a JSON response
-        return jsonify({'devices': devices_data, 'links': links_data}), 200
+        app = current_app._get_current_object()
+        links = app.eBPFApp.links if hasattr(app, 'eBPFApp') else None
+        since = request.args.get('since', type=int)
+        if since is not None:
+            delta = topology_cache.get_delta(since, request.args.get('epoch'), links)
+            if delta is not None:
+                delta['full'] = False
+                return jsonify(delta), 200
+
+        version, body = topology_cache.get_snapshot()
+        etag = f'topology-{topology_cache.epoch}-{version}'
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers={'ETag': f'"{etag}"'})
+
+        response = Response(body, status=200, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         # Error handling
         logging.error(f"Error getting topology: {e}")
         return jsonify({'error': 'Failed to retrieve topology data.'}), 500
 
 
+@controller_routes.route('/stream', methods=['GET'])
+def stream():
+    """
+    Streams live controller updates to the dashboard using Server-Sent Events.
+
+    Query parameters (optional):
+        topics: Comma separated list of topics to subscribe to (default="topology,events").
+            "bandwidth" subscribes to all devices, "bandwidth:<dpid>" to a single device.
+
+    Returns:
+        A text/event-stream response. Updates are coalesced per series for slow clients and a "lagged"
+        event is sent if some had to be dropped.
+    """
+    topics = [topic.strip() for topic in request.args.get('topics', 'topology,events').split(',') if topic.strip()]
+    if not topics:
+        return jsonify({'error': 'At least one topic is required.'}), 400
+
+    subscription = broker.subscribe(topics, max_pending=current_app.config['STREAM_MAX_PENDING'])
+    response = Response(broker.stream(subscription), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @controller_routes.route('/status', methods=['GET'])
 def get_status():
     """
@@ -139,8 +174,12 @@ def install_function():
     """
     Installs a specified eBPF function on a device.
 
+    The function object is served from the artifact store, which has already validated it. If the
+    same object (by content hash) is already installed at the target stage, nothing is sent.
+
     Expects:
-        JSON payload with "dpid" and "function_name" (name of the function to install).
+        JSON payload with "dpid" and "function_name" (name of the function to install), and optionally
+        "index" (stage to install at, defaults to the stage after the last one the switch lists as running).
 
     Returns:
         JSON response indicating the success or failure of the installation process.
@@ -171,32 +210,679 @@ def install_function():
         if not device:
             return jsonify({'error': f'Device {dpid} not found in the database.'}), 404
         
-        next_index = len(device.functions)
-
-        # Read the ELF file for the function
-        elf_file_path = f'../functions/{function_name}.o'
+        # Get the validated ELF of the function
         try:
-            with open(elf_file_path, 'rb') as f:
-                elf = f.read()
-        except FileNotFoundError:
-            return jsonify({'error': f'Function ELF file not found: {elf_file_path}'}), 404
-        
+            artifact = app.artifact_store.get(function_name)
+        except ArtifactNotFound as e:
+            return jsonify({'error': str(e)}), 404
+        except ArtifactError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if 'index' in data:
+            next_index = data['index']
+            current = [next_index] if controller.installed_artifacts.get((int(dpid), next_index)) == artifact.digest else []
+        else:
+            # The next free stage comes from the switch's running pipeline, not the database
+            entries, error = list_pipelines(controller, [int(dpid)], 1, app.config['ROLLOUT_TIMEOUT'])[int(dpid)]
+            if error:
+                return jsonify({'error': f'Failed to list the pipeline of device {dpid}: {error}'}), 504
+            current = [entry.index for entry in entries if entry.name == function_name
+                       and controller.installed_artifacts.get((int(dpid), entry.index)) == artifact.digest]
+
+        if current:
+            logging.info(f"Function {function_name} ({artifact.digest[:12]}) is already installed on device {dpid} at index {current[0]}.")
+            return jsonify({'message': f'Function already installed on device {dpid}', 'digest': artifact.digest}), 200
+
+        if 'index' not in data:
+            next_index = controller.reserve_stage(int(dpid), entries, function_name, artifact.digest)
+
         # Send the FunctionAddRequest
-        function_add_request = FunctionAddRequest(name=function_name, index=next_index, elf=elf)
-        connection.send(function_add_request)
+        function_add_request = FunctionAddRequest(name=function_name, index=next_index, elf=artifact.elf)
+        controller.send_function_add_request(connection, function_add_request, digest=artifact.digest)
         logging.info(f"Function installation request sent to device {dpid} for function {function_name}.")
 
-        # Start monitoring if the function is "monitoring"
-        if function_name == 'monitoring':
-            start_monitoring(app, controller.connections)
-            logging.info(f"Started monitoring requests after installating function {function_name} on device {dpid}.")
-
-        return jsonify({'message': f'Function installation initiated on device {dpid}'}), 200
+        return jsonify({'message': f'Function installation initiated on device {dpid}', 'digest': artifact.digest}), 200
     
     except Exception as e:
         logging.error(f"Error installing function: {e}")
         return jsonify({'error': 'Failed to initiate function installation'}), 500
 
+@controller_routes.route('/install_bulk', methods=['POST'])
+def install_function_bulk():
+    """
+    Installs a function on every switch matching a device selector, in parallel.
+
+    Expects:
+        JSON payload with "function_name" and optionally "selector" (with "dpids", "device_type" and/or
+        "name" glob pattern, defaults to all switches) and "timeout" (seconds to wait for each switch).
+
+    Returns:
+        JSON response with the result and timing of each switch and the total time taken.
+    """
+    try:
+        data = request.get_json() or {}
+        function_name = data.get('function_name')
+        if not function_name:
+            return jsonify({'error': 'function_name is required'}), 400
+
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+
+        try:
+            artifact = app.artifact_store.get(function_name)
+        except ArtifactNotFound as e:
+            return jsonify({'error': str(e)}), 404
+        except ArtifactError as e:
+            return jsonify({'error': str(e)}), 400
+
+        devices = select_devices(data.get('selector') or {})
+        timeout = float(data.get('timeout', app.config['ROLLOUT_TIMEOUT']))
+        response = timed(bulk_install, app.eBPFApp, artifact, devices, app.config['ROLLOUT_MAX_IN_FLIGHT'], timeout)
+        return jsonify(response), 200
+
+    except Exception as e:
+        logging.error(f"Error installing function in bulk: {e}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to install function in bulk'}), 500
+
+@controller_routes.route('/remove_bulk', methods=['POST'])
+def remove_function_bulk():
+    """
+    Removes a function from every switch matching a device selector, in parallel.
+
+    Expects:
+        JSON payload with "function_name" and optionally "selector" (see install_bulk) and "timeout".
+
+    Returns:
+        JSON response with the result and timing of each switch and the total time taken.
+    """
+    try:
+        data = request.get_json() or {}
+        function_name = data.get('function_name')
+        if not function_name:
+            return jsonify({'error': 'function_name is required'}), 400
+
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+
+        devices = select_devices(data.get('selector') or {})
+        timeout = float(data.get('timeout', app.config['ROLLOUT_TIMEOUT']))
+        response = timed(bulk_remove, app.eBPFApp, function_name, devices, app.config['ROLLOUT_MAX_IN_FLIGHT'], timeout)
+        return jsonify(response), 200
+
+    except Exception as e:
+        logging.error(f"Error removing function in bulk: {e}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to remove function in bulk'}), 500
+
+@controller_routes.route('/pipelines', methods=['GET'])
+def get_pipelines():
+    """
+    Lists the desired function pipelines.
+
+    Returns:
+        JSON response containing the pipelines set per switch (dpid) and per device group (device_type).
+    """
+    try:
+        pipelines = FunctionPipeline.query.order_by(FunctionPipeline.id).all()
+        return jsonify([serialise_pipeline(pipeline) for pipeline in pipelines]), 200
+    except Exception as e:
+        logging.error(f"Error retrieving pipelines: {e}")
+        return jsonify({'error': 'Failed to retrieve pipelines'}), 500
+
+@controller_routes.route('/pipelines', methods=['PUT'])
+def put_pipeline():
+    """
+    Sets the desired function pipeline of a switch or a device group, and reconciles the connected
+    switches it applies to.
+
+    Expects:
+        JSON payload with "functions" (ordered list of function names) and either "dpid" or "device_type".
+
+    Returns:
+        JSON response containing the saved pipeline.
+    """
+    try:
+        try:
+            pipeline = save_pipeline(request.get_json() or {})
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        app = current_app._get_current_object()
+        if hasattr(app, 'eBPFApp'):
+            selector = {'dpids': [pipeline.dpid]} if pipeline.dpid is not None else {'device_type': pipeline.device_type}
+            for device in select_devices(selector):
+                app.eBPFApp.reconciler.schedule(device.dpid)
+        return jsonify(serialise_pipeline(pipeline)), 200
+    except Exception as e:
+        logging.error(f"Error saving pipeline: {e}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to save pipeline'}), 500
+
+@controller_routes.route('/pipelines/<int:pipeline_id>', methods=['DELETE'])
+def delete_pipeline(pipeline_id):
+    """
+    Deletes a desired function pipeline. Functions already running on the switches are left in place.
+    """
+    try:
+        pipeline = db.session.get(FunctionPipeline, pipeline_id)
+        if not pipeline:
+            return jsonify({'error': f'Pipeline {pipeline_id} not found.'}), 404
+        db.session.delete(pipeline)
+        db.session.commit()
+        return jsonify({'message': f'Pipeline {pipeline_id} deleted.'}), 200
+    except Exception as e:
+        logging.error(f"Error deleting pipeline: {e}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to delete pipeline'}), 500
+
+@controller_routes.route('/reconcile', methods=['POST'])
+def reconcile_pipelines():
+    """
+    Reconciles the function pipelines of the switches matching a device selector right away.
+
+    Expects:
+        JSON payload with an optional "selector" (see install_bulk), defaults to all switches.
+
+    Returns:
+        JSON response with the result of each switch and the total time taken.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+
+        dpids = {device.dpid for device in select_devices(data.get('selector') or {})}
+        return jsonify(timed(app.eBPFApp.reconciler.reconcile, dpids)), 200
+    except Exception as e:
+        logging.error(f"Error reconciling pipelines: {e}")
+        db.session.rollback()
+        return jsonify({'error': 'Failed to reconcile pipelines'}), 500
+
+@controller_routes.route('/mitigation', methods=['GET'])
+def get_mitigation_status():
+    """
+    Retrieves the state of the DDoS mitigation engine.
+
+    Returns:
+        JSON response with the blocked source MACs and the recent block/release decisions, including the
+        time from attack start to the switches confirming each block.
+    """
+    try:
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+        return jsonify(app.eBPFApp.mitigation.status()), 200
+    except Exception as e:
+        logging.error(f"Error retrieving mitigation status: {e}")
+        return jsonify({'error': 'Failed to retrieve mitigation status'}), 500
+
+@controller_routes.route('/packet_in', methods=['GET'])
+def get_packet_in_status():
+    """
+    Retrieves the state of the centralized learning switch.
+
+    Returns:
+        JSON response with the PACKET_IN counters and learned MACs of each switch, and the packet-in to
+        packet-out latency percentiles.
+    """
+    try:
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+        return jsonify(app.eBPFApp.learning.status()), 200
+    except Exception as e:
+        logging.error(f"Error retrieving PACKET_IN status: {e}")
+        return jsonify({'error': 'Failed to retrieve PACKET_IN status'}), 500
+
+@controller_routes.route('/queues', methods=['GET'])
+def get_queue_depths():
+    """
+    Retrieves the inbound message queues of the switch connections.
+
+    Returns:
+        JSON response with, per switch, the queued control and telemetry messages, its round-robin
+        weight, the messages handled so far and whether reading from it is paused.
+    """
+    try:
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+        return jsonify({str(dpid): queue for dpid, queue in app.eBPFApp.scheduler.status().items()}), 200
+    except Exception as e:
+        logging.error(f"Error retrieving queue depths: {e}")
+        return jsonify({'error': 'Failed to retrieve queue depths'}), 500
+
+@controller_routes.route('/executors', methods=['GET'])
+def get_executors():
+    """
+    Retrieves the state of the executors running event handlers off the reactor.
+
+    Returns:
+        JSON response with, per executor, its kind and size, the handlers running and queued (including
+        those held back to keep a switch's messages in order), and the time handlers waited to start.
+    """
+    try:
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+        return jsonify(executor_status()), 200
+    except Exception as e:
+        logging.error(f"Error retrieving executor status: {e}")
+        return jsonify({'error': 'Failed to retrieve executor status'}), 500
+
+@controller_routes.route('/goose', methods=['GET'])
+def get_goose_status():
+    """
+    Retrieves the state of the GOOSE analyser.
+
+    Returns:
+        JSON response with the last stNum/sqNum of every GOOSE publisher per switch and the recent
+        anomalies (resets, gaps, stNum jumps and replays).
+    """
+    try:
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+        return jsonify(app.eBPFApp.goose.status()), 200
+    except Exception as e:
+        logging.error(f"Error retrieving GOOSE analyser status: {e}")
+        return jsonify({'error': 'Failed to retrieve GOOSE analyser status'}), 500
+
+@controller_routes.route('/anomalies', methods=['GET'])
+def get_anomalies():
+    """
+    Retrieves the state of the baseline anomaly detector.
+
+    Returns:
+        JSON response with the detector settings, the per switch thresholds, the number of series
+        tracked and the recent anomalies.
+    """
+    try:
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+        return jsonify(app.eBPFApp.baselines.status()), 200
+    except Exception as e:
+        logging.error(f"Error retrieving anomaly detector status: {e}")
+        return jsonify({'error': 'Failed to retrieve anomaly detector status'}), 500
+
+@controller_routes.route('/anomalies/<int:dpid>', methods=['PUT', 'DELETE'])
+def configure_anomalies(dpid):
+    """
+    Sets (PUT) or resets to the default (DELETE) the anomaly sensitivity of a switch.
+
+    Expected JSON payload (PUT):
+        threshold: Deviation from the baseline, in standard deviations, raised as an anomaly. Lower
+            is more sensitive.
+
+    Returns:
+        JSON response with the threshold applied to the switch, or an error message.
+    """
+    try:
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+        baselines = app.eBPFApp.baselines
+        if request.method == 'DELETE':
+            return jsonify({'dpid': dpid, 'threshold': baselines.set_threshold(dpid, None)}), 200
+
+        data = request.get_json(silent=True) or {}
+        if data.get('threshold') is None:
+            return jsonify({'error': 'threshold is required'}), 400
+        try:
+            threshold = baselines.set_threshold(dpid, data['threshold'])
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        logging.info(f"Anomaly threshold of device {dpid} set to {threshold}.")
+        return jsonify({'dpid': dpid, 'threshold': threshold}), 200
+    except Exception as e:
+        logging.error(f"Error configuring anomaly detection of device {dpid}: {e}")
+        return jsonify({'error': 'Failed to configure anomaly detection'}), 500
+
+@controller_routes.route('/links', methods=['GET'])
+def get_link_utilization():
+    """
+    Retrieves the utilization of every link computed from the per MAC counters of the switches.
+
+    Returns:
+        JSON response with each link's endpoints, bits per second in each direction, capacity and
+        current and peak utilization, the busiest first, and the bytes that could not be placed on a link.
+    """
+    try:
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+        return jsonify(app.eBPFApp.links.status()), 200
+    except Exception as e:
+        logging.error(f"Error retrieving link utilization: {e}")
+        return jsonify({'error': 'Failed to retrieve link utilization'}), 500
+
+@controller_routes.route('/top_talkers', methods=['GET'])
+def get_top_talkers():
+    """
+    Retrieves the heaviest talkers from the in-memory top-K summaries, without scanning monitoring_data.
+
+    Query parameters:
+        scope: "global" for the whole network (default) or "device" for each switch.
+        window: One of 10s, 1m (default) or 10m.
+        dpid: With scope=device, only return the talkers of this switch.
+        k: Number of talkers, up to the summary capacity.
+
+    Returns:
+        JSON response with the talkers, heaviest first, their bytes over the window, average rate and
+        maximum overestimation. With scope=device the talkers are mapped by DPID.
+    """
+    try:
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+        scope = request.args.get('scope', 'global')
+        window = request.args.get('window', '1m')
+        dpid = request.args.get('dpid', type=int)
+        k = request.args.get('k', type=int)
+        if scope not in ('global', 'device'):
+            return jsonify({'error': 'scope must be global or device'}), 400
+        if window not in TALKER_WINDOWS:
+            return jsonify({'error': f"window must be one of {', '.join(TALKER_WINDOWS)}"}), 400
+        if k is not None and k <= 0:
+            return jsonify({'error': 'k must be positive'}), 400
+
+        talkers = app.eBPFApp.talkers
+        if scope == 'global':
+            result = talkers.top(None, window, k)
+        else:
+            dpids = [dpid] if dpid is not None else talkers.devices()
+            result = {str(dpid): talkers.top(dpid, window, k) for dpid in dpids}
+        return jsonify({'scope': scope, 'window': window, 'talkers': result}), 200
+    except Exception as e:
+        logging.error(f"Error retrieving top talkers: {e}")
+        return jsonify({'error': 'Failed to retrieve top talkers'}), 500
+
+@controller_routes.route('/captures', methods=['GET'])
+def get_capture_status():
+    """
+    Retrieves the packet capture settings and counters of each switch.
+
+    Returns:
+        JSON response with the default settings, the number of frames waiting to be written and, per
+        switch, its settings, the frames in its ring and its captured/filtered/persisted/dropped counters.
+    """
+    try:
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+        return jsonify(app.eBPFApp.capture.status()), 200
+    except Exception as e:
+        logging.error(f"Error retrieving capture status: {e}")
+        return jsonify({'error': 'Failed to retrieve capture status'}), 500
+
+@controller_routes.route('/captures/<int:dpid>', methods=['PUT', 'DELETE'])
+def configure_capture(dpid):
+    """
+    Sets (PUT) or resets to the defaults (DELETE) the packet capture settings of a switch.
+
+    Expected JSON payload (PUT, all optional):
+        filter: Capture filter, e.g. "goose or (tcp and port 102)".
+        sample_rate: Fraction (0 to 1) of the captured frames persisted to disk.
+        mirror: True if the switch runs a mirror function sending copies to the controller, its
+            PACKET_IN frames are then only captured and never forwarded.
+
+    Returns:
+        JSON response with the settings of the switch, or an error message.
+    """
+    try:
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+        capture = app.eBPFApp.capture
+        if request.method == 'DELETE':
+            capture.reset(dpid)
+            return jsonify(capture.defaults.to_dict()), 200
+
+        data = request.get_json(silent=True) or {}
+        try:
+            settings = capture.configure(dpid, data.get('filter'), data.get('sample_rate'), data.get('mirror'))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        logging.info(f"Capture settings of device {dpid} set to {settings.to_dict()}.")
+        return jsonify(settings.to_dict()), 200
+    except Exception as e:
+        logging.error(f"Error configuring capture of device {dpid}: {e}")
+        return jsonify({'error': 'Failed to configure capture'}), 500
+
+@controller_routes.route('/captures/<int:dpid>/recent', methods=['GET'])
+def get_recent_captures(dpid):
+    """
+    Retrieves the most recent frames of a switch from its in-memory capture ring.
+
+    Query parameters (optional):
+        filter: Capture filter the frames must match.
+        limit (default=100): Maximum number of frames.
+        format (default=json): "json" for the decoded headers, "pcap" for a pcap file.
+
+    Returns:
+        JSON list of frames (newest first) or a pcap file (oldest first), or an error message.
+    """
+    try:
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+        limit = request.args.get('limit', 100, type=int)
+        output = request.args.get('format', 'json')
+        try:
+            capture_filter = CaptureFilter(request.args['filter']) if request.args.get('filter') else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if output not in ('json', 'pcap'):
+            return jsonify({'error': 'format must be either json or pcap.'}), 400
+
+        frames = app.eBPFApp.capture.recent(dpid, capture_filter, limit)
+        if output == 'pcap':
+            def generate():
+                yield pcap_header()
+                for sec, nsec, length, data, _ in reversed(frames):
+                    frame = memoryview(data)[METADATA.size:]
+                    yield pcap_record(sec, nsec, frame, max(length, len(frame)))
+            response = Response(generate(), mimetype='application/vnd.tcpdump.pcap')
+            response.headers['Content-Disposition'] = f'attachment; filename="recent-{dpid}.pcap"'
+            return response
+
+        results = [
+            {
+                'timestamp': datetime.fromtimestamp(sec + nsec / 1e9, timezone.utc).isoformat(),
+                'length': len(data) - METADATA.size,
+                **summary,
+            }
+            for sec, nsec, length, data, summary in frames
+        ]
+        return jsonify(results), 200
+    except Exception as e:
+        logging.error(f"Error retrieving recent captures of device {dpid}: {e}")
+        return jsonify({'error': 'Failed to retrieve recent captures'}), 500
+
+@controller_routes.route('/captures/export', methods=['GET'])
+def export_captures():
+    """
+    Streams the persisted packets matching the given filters as a pcap file.
+
+    The packet index is filtered in the database, the frames are then read from the pcap files on disk
+    and streamed without being loaded in memory.
+
+    Query parameters (optional):
+        dpid: Only packets captured on this switch.
+        start / end: Time range, as ISO 8601 timestamps or seconds since the epoch.
+        host: Only packets from or to this IPv4 address.
+        protocol: Only packets of this protocol, as indexed (e.g. "TCP", "GOOSE").
+        filter: Capture filter the frames must also match.
+        limit (default=CAPTURE_EXPORT_LIMIT): Maximum number of packets, at most CAPTURE_EXPORT_LIMIT.
+
+    Returns:
+        A pcap file (application/vnd.tcpdump.pcap) with the packets in time order, or an error message.
+    """
+    try:
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+        max_limit = app.config['CAPTURE_EXPORT_LIMIT']
+        dpid = request.args.get('dpid', type=int)
+        host = request.args.get('host')
+        protocol = request.args.get('protocol')
+        limit = min(request.args.get('limit', max_limit, type=int), max_limit)
+        try:
+            start = parse_timestamp(request.args.get('start'))
+            end = parse_timestamp(request.args.get('end'))
+        except ValueError:
+            return jsonify({'error': 'start and end must be ISO 8601 timestamps or seconds since the epoch.'}), 400
+        try:
+            capture_filter = CaptureFilter(request.args['filter']) if request.args.get('filter') else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        query = db.session.query(PacketCapture.file_name, PacketCapture.file_offset).filter(PacketCapture.file_name.isnot(None))
+        if dpid is not None:
+            query = query.join(Device, PacketCapture.device_id == Device.id).filter(Device.dpid == dpid)
+        if host:
+            query = query.filter((PacketCapture.source_ip == host) | (PacketCapture.destination_ip == host))
+        if protocol:
+            query = query.filter(PacketCapture.protocol == protocol)
+        query = filter_range(query, PacketCapture.timestamp, start, end)
+        locations = query.order_by(PacketCapture.timestamp, PacketCapture.id).limit(limit).all()
+
+        response = Response(app.eBPFApp.capture.export(locations, capture_filter), mimetype='application/vnd.tcpdump.pcap')
+        response.headers['Content-Disposition'] = 'attachment; filename="capture.pcap"'
+        return response
+    except Exception as e:
+        logging.error(f"Error exporting captures: {e}")
+        return jsonify({'error': 'Failed to export captures'}), 500
+
+@controller_routes.route('/tables/<int:dpid>', methods=['GET'])
+def list_tables(dpid):
+    """
+    Lists the tables of every function running on a switch.
+
+    Concurrent requests for the same switch share one switch request, and the result is cached for
+    TABLE_CACHE_TTL seconds.
+
+    Returns:
+        JSON response with each stage, its function and its table definitions.
+    """
+    try:
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+        if dpid not in app.eBPFApp.connections:
+            return jsonify({'error': f'Device {dpid} is not connected'}), 400
+
+        stages, shared = app.eBPFApp.tables.list_tables(dpid)
+        return jsonify({'dpid': dpid, 'stages': stages, 'cached': shared}), 200
+    except TimeoutError:
+        return jsonify({'error': f'Device {dpid} did not reply in time'}), 504
+    except Exception as e:
+        logging.error(f"Error listing tables of device {dpid}: {e}")
+        return jsonify({'error': 'Failed to list tables'}), 500
+
+@controller_routes.route('/tables/<int:dpid>/<int:stage>/<table_name>', methods=['GET'])
+def get_table(dpid, stage, table_name):
+    """
+    Reads the entries of a switch table, decoded with the table's schema when it is known.
+
+    Concurrent requests for the same table share one switch request, and the result is cached for
+    TABLE_CACHE_TTL seconds.
+
+    Query parameters (optional):
+        key: Hex key (MAC separators allowed) to read a single entry instead of the whole table.
+
+    Returns:
+        JSON response with the table definition and its entries, or the single entry.
+    """
+    try:
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+        if dpid not in app.eBPFApp.connections:
+            return jsonify({'error': f'Device {dpid} is not connected'}), 400
+
+        key = request.args.get('key')
+        if key is not None:
+            try:
+                key = parse_bytes(key)
+            except ValueError:
+                return jsonify({'error': 'key must be a hex string.'}), 400
+            result, shared = app.eBPFApp.tables.get_entry(dpid, stage, table_name, key)
+        else:
+            result, shared = app.eBPFApp.tables.dump_table(dpid, stage, table_name)
+
+        status = 200 if result['status'] == 'SUCCESS' else 404
+        return jsonify({**result, 'cached': shared}), status
+    except TimeoutError:
+        return jsonify({'error': f'Device {dpid} did not reply in time'}), 504
+    except Exception as e:
+        logging.error(f"Error reading table {table_name} of device {dpid}: {e}")
+        return jsonify({'error': 'Failed to read table'}), 500
+
+@controller_routes.route('/tables/<int:dpid>/<int:stage>/<table_name>/entries', methods=['POST', 'DELETE'])
+def write_table_entries(dpid, stage, table_name):
+    """
+    Inserts (POST) or deletes (DELETE) a batch of entries in a switch table.
+
+    Expects:
+        JSON payload with "entries", a list of {"key": hex, "value": hex} objects (only "key" is needed
+        when deleting, plain hex strings are accepted too), and optionally "window" (maximum number of
+        requests waiting for a reply) and "timeout" (seconds to wait for each reply).
+
+    Returns:
+        JSON response with the number of entries written, the failed entries with their status and the
+        time taken.
+    """
+    try:
+        data = request.get_json() or {}
+        app = current_app._get_current_object()
+        if not hasattr(app, 'eBPFApp'):
+            return jsonify({'error': 'Controller is not running'}), 400
+        if dpid not in app.eBPFApp.connections:
+            return jsonify({'error': f'Device {dpid} is not connected'}), 400
+
+        delete = request.method == 'DELETE'
+        try:
+            entries = []
+            for entry in data.get('entries') or []:
+                if isinstance(entry, str):
+                    entry = {'key': entry}
+                value = b'' if delete else parse_bytes(entry['value'])
+                entries.append((parse_bytes(entry['key']), value))
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': 'entries must be a list of {"key": hex, "value": hex} objects.'}), 400
+        if not entries:
+            return jsonify({'error': 'entries must not be empty.'}), 400
+
+        window = int(data.get('window', app.config['TABLE_WRITE_WINDOW']))
+        timeout = float(data.get('timeout', app.config['TABLE_WRITE_TIMEOUT']))
+        result = write_entries(app.eBPFApp, dpid, stage, table_name, entries, delete=delete, window=max(window, 1), timeout=timeout)
+        return jsonify(result), 200
+
+    except Exception as e:
+        logging.error(f"Error writing entries to table {table_name} on device {dpid}: {e}")
+        return jsonify({'error': 'Failed to write table entries'}), 500
+
+@controller_routes.route('/functions', methods=['GET'])
+def list_functions():
+    """
+    Lists the function objects available for installation.
+
+    Returns:
+        JSON response with the name, content hash and map definitions of each valid function, and the
+        validation errors of the rejected ones.
+    """
+    try:
+        return jsonify(current_app.artifact_store.list()), 200
+    except Exception as e:
+        logging.error(f"Error listing functions: {e}")
+        return jsonify({'error': 'Failed to list functions'}), 500
+
 @controller_routes.route('/remove', methods=['POST'])
 def remove_function():
     """
@@ -257,68 +943,233 @@ def remove_function():
         logging.error(f"Error removing function: {e}")
         return jsonify({'error': 'Failed to initiate function removal'}), 500
 
+def paged_response(results, next_cursor):
+    """
+    Builds a JSON list response, passing the cursor for the next page (if any) in the X-Next-Cursor header.
+    """
+    response = jsonify(results)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
 @controller_routes.route('/monitoring_data', methods=['GET'])
 def get_monitoring_data():
     """
-    NEEDS WORK!
+    Retrieves monitoring data based on device ID and MAC address.
 
-    Retrieves monitoring data based on device ID and MAC address, with an optional limit.
+    Raw rows are returned newest first using keyset pagination. When a bucket is given, bandwidth is
+    aggregated in the database per device or per MAC address instead of returning every sample, from
+    the coarsest rollup table that can answer the query and the raw rows not rolled up yet. Device
+    averages and maxima need the raw samples, a range whose raw rows have expired is rejected.
 
     Query parameters (optional):
         device_id: The ID of the device for filtering.
         mac_address: MAC address for filtering.
+        start: Start of the time range (inclusive), ISO 8601 or seconds since the epoch.
+        end: End of the time range (exclusive), ISO 8601 or seconds since the epoch.
         limit (default=100): The maximum number of records to retieve.
+        cursor: Cursor from the X-Next-Cursor header of the previous page.
+        bucket: Bucket size for aggregation ("10s", "1m" or "1h").
+        agg (default=avg): Aggregate applied per bucket ("avg", "max", "sum" or "p95").
+        group (default=device, or mac if mac_address is given): Aggregate per "device" or per "mac".
 
     Returns: 
-        JSON response containing the filtered monitoring data or an error message.
+        JSON response containing the filtered monitoring data or an error message. The cursor for the
+        next page, if any, is returned in the X-Next-Cursor header.
     """
     try:
         # Extract query parameters
-        device_id = request.args.get('device_id')
+        device_id = request.args.get('device_id', type=int)
         mac_address = request.args.get('mac_address')
         limit = request.args.get('limit', 100, type=int)
+        cursor = request.args.get('cursor')
+        bucket = request.args.get('bucket')
+        agg = request.args.get('agg', 'avg')
+        group = request.args.get('group', 'mac' if mac_address else 'device')
+        try:
+            start = parse_timestamp(request.args.get('start'))
+            end = parse_timestamp(request.args.get('end'))
+        except ValueError:
+            return jsonify({'error': 'start and end must be ISO 8601 timestamps or seconds since the epoch.'}), 400
 
-        # Build the query based on filters
-        query = MonitoringData.query
-        if device_id:
-            query = query.filter(MonitoringData.device_id == int(device_id))
-        if mac_address:
-            query = query.filter(MonitoringData.mac_address == mac_address)
+        # Validate input
+        if bucket is not None and bucket not in BUCKETS:
+            return jsonify({'error': f'bucket must be one of {", ".join(BUCKETS)}.'}), 400
+        if agg not in AGGREGATES:
+            return jsonify({'error': f'agg must be one of {", ".join(AGGREGATES)}.'}), 400
+        if group not in ('device', 'mac'):
+            return jsonify({'error': 'group must be either device or mac.'}), 400
 
-        # Retrieve the filtered data
-        monitoring_data = query.order_by(MonitoringData.timestamp.desc()).limit(limit).all()
+        def apply_filters(query, range_start=start):
+            if device_id is not None:
+                query = query.filter(MonitoringData.device_id == device_id)
+            if mac_address:
+                query = query.filter(MonitoringData.mac_address == mac_address)
+            return filter_range(query, MonitoringData.timestamp, range_start, end)
 
-        # Serialise results
-        results = [
-            {
-                "timestamp": data.timestamp.isoformat(),
-                "device_id": data.device_id,
-                "mac_address": data.mac_address,
-                "bandwidth": data.bandwidth
-            }
-            for data in monitoring_data
-        ]
+        if bucket is None:
+            # Retrieve the filtered data
+            monitoring_data, next_cursor = keyset_page(apply_filters(MonitoringData.query), MonitoringData.timestamp, MonitoringData.id, cursor, limit)
 
-        return jsonify(results), 200
+            # Serialise results
+            results = [
+                {
+                    "timestamp": data.timestamp.isoformat(),
+                    "device_id": data.device_id,
+                    "mac_address": data.mac_address,
+                    "bandwidth": data.bandwidth
+                }
+                for data in monitoring_data
+            ]
+            return paged_response(results, next_cursor), 200
+
+        # Buckets after the one of the cursor are done, end the range with it to pick the rollups
+        if cursor:
+            cursor_bucket, _ = decode_bucket_cursor(cursor)
+            cursor_end = datetime.fromtimestamp(cursor_bucket + BUCKETS[bucket], timezone.utc).replace(tzinfo=None)
+            end = min(end, cursor_end) if end else cursor_end
+
+        # Device averages and maxima need per sample sums, so only device sums can use the rollups
+        resolution = tail = None
+        if group == 'mac' or agg == 'sum':
+            resolution, tail = choose_resolution(MonitoringData.__tablename__, BUCKETS[bucket], agg, start, end, current_app.config)
+        elif raw_expired(start, current_app.config):
+            return jsonify({'error': f'Device {agg} needs the raw samples, which have expired for this range. Use group=mac or agg=sum.'}), 400
+
+        def raw_query(range_start=start):
+            if group == 'device':
+                # Device bandwidth is the sum over all MAC addresses at each sample time
+                per_sample = apply_filters(db.session.query(
+                    MonitoringData.device_id,
+                    MonitoringData.timestamp,
+                    func.sum(MonitoringData.bandwidth).label('bandwidth')
+                ), range_start).group_by(MonitoringData.device_id, MonitoringData.timestamp).subquery()
+                return bucketed([per_sample.c.device_id], {'bandwidth': per_sample.c.bandwidth}, per_sample.c.timestamp, BUCKETS[bucket], agg)
+            return apply_filters(bucketed(
+                [MonitoringData.device_id, MonitoringData.mac_address],
+                {'bandwidth': MonitoringData.bandwidth},
+                MonitoringData.timestamp, BUCKETS[bucket], agg
+            ), range_start)
+
+        if resolution:
+            group_columns = [MonitoringRollup.device_id]
+            if group == 'mac':
+                group_columns.append(MonitoringRollup.mac_address)
+            query = rollup_bucketed(MonitoringRollup, group_columns, ['bandwidth'], resolution, BUCKETS[bucket], agg)
+            if device_id is not None:
+                query = query.filter(MonitoringRollup.device_id == device_id)
+            if mac_address:
+                query = query.filter(MonitoringRollup.mac_address == mac_address)
+            query = filter_range(query, MonitoringRollup.bucket, start, tail or end)
+            if tail:
+                # Buckets not fully rolled up yet come from the raw rows
+                query = union_buckets(query, raw_query(tail))
+        else:
+            query = raw_query()
+
+        keys = ['device_id', 'mac_address'] if group == 'mac' else ['device_id']
+        rows, next_cursor = bucket_page(bucket_keyset(query, keys, cursor).limit(limit + 1).all(), limit, keys)
+        results = []
+        for row in rows:
+            result = {
+                "timestamp": bucket_timestamp(row.bucket),
+                "device_id": row.device_id,
+                "bandwidth": float(row.bandwidth)
+            }
+            if group == 'mac':
+                result["mac_address"] = row.mac_address
+            results.append(result)
+        return paged_response(results, next_cursor), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logging.error(f"Error fetching monitoring data: {e}")
         return jsonify({"error": "Failed to retrieve monitoring data."}), 500
     
+@controller_routes.route('/bandwidth_quantiles', methods=['GET'])
+def get_bandwidth_quantiles():
+    """
+    Retrieves bandwidth quantiles from the per bucket sketches, without reading monitoring_data.
+
+    The sketches of the matching switches and buckets are merged, so quantiles of a MAC seen by
+    several switches or of a long time range cost one merge per stored sketch. Quantiles are within
+    the configured relative accuracy of the exact ones.
+
+    Query parameters (optional):
+        device_id: The ID of the device, all devices are merged if not given.
+        mac_address: MAC address of the series, the total bandwidth of the switch if not given.
+        start: Start of the time range (inclusive), ISO 8601 or seconds since the epoch. Defaults to one hour ago.
+        end: End of the time range (exclusive), ISO 8601 or seconds since the epoch.
+        quantiles (default=0.5,0.95,0.99): Comma separated quantiles between 0 and 1.
+
+    Returns:
+        JSON response with the number of samples, their mean and maximum, and the requested
+        quantiles in bytes per second.
+    """
+    try:
+        device_id = request.args.get('device_id', type=int)
+        mac_address = request.args.get('mac_address') or SWITCH_SERIES
+        try:
+            start = parse_timestamp(request.args.get('start'))
+            end = parse_timestamp(request.args.get('end'))
+        except ValueError:
+            return jsonify({'error': 'start and end must be ISO 8601 timestamps or seconds since the epoch.'}), 400
+        try:
+            quantiles = [float(q) for q in request.args.get('quantiles', '0.5,0.95,0.99').split(',')]
+        except ValueError:
+            return jsonify({'error': 'quantiles must be comma separated numbers.'}), 400
+        if any(q < 0 or q > 1 for q in quantiles):
+            return jsonify({'error': 'quantiles must be between 0 and 1.'}), 400
+        if start is None and end is None:
+            start = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=1)
+
+        app = current_app._get_current_object()
+        query = db.session.query(BandwidthSketch.sketch).filter(BandwidthSketch.mac_address == mac_address)
+        if device_id is not None:
+            query = query.filter(BandwidthSketch.device_id == device_id)
+        # The bucket containing the start of the range is included
+        query = filter_range(query, BandwidthSketch.bucket, start and bucket_start(start, current_app.config['SKETCH_BUCKET_SECONDS']), end)
+        stored = [row.sketch for row in query.all()]
+        pending = app.eBPFApp.sketches.open_sketches(device_id, mac_address, start, end) if hasattr(app, 'eBPFApp') else []
+
+        result = merged_quantiles(stored, pending, quantiles)
+        result.update(device_id=device_id, mac_address=mac_address,
+                      start=start.isoformat() if start else None, end=end.isoformat() if end else None)
+        return jsonify(result), 200
+    except Exception as e:
+        logging.error(f"Error retrieving bandwidth quantiles: {e}")
+        return jsonify({'error': 'Failed to retrieve bandwidth quantiles'}), 500
+
 @controller_routes.route('/asset_discovery_data', methods=['GET'])
 def get_asset_discovery_data():
     """
-    NEEDS IMPROVEMENTS!
+    Retrieves asset discovery data based on device ID, DPID, or MAC address.
+
+    By default the current asset inventory of the switch is returned, one row per MAC address, most
+    recently seen first. History rows (only stored when an asset changes) are returned instead when
+    history=true or a time range, cursor or bucket is given.
 
-    Retrieves asset discovery data based on device ID, DPID, or MAC address, with an optional limit.
+    History rows are returned newest first using keyset pagination. When a bucket is given, the byte and
+    packet counters are aggregated in the database per MAC address instead, from the coarsest rollup
+    table that can answer the query.
 
     Query parameters (optional):
         device_id: The ID of the device for filtering
         dpid: The DPID for filtering (if device ID is not provided)
         mac_address: MAC address for filtering
-        limit: Maximum number of records to retrieve
+        history (default=false): Return history rows instead of the current inventory.
+        start: Start of the time range (inclusive), ISO 8601 or seconds since the epoch.
+        end: End of the time range (exclusive), ISO 8601 or seconds since the epoch.
+        limit (default=100): Maximum number of records to retrieve
+        cursor: Cursor from the X-Next-Cursor header of the previous page.
+        bucket: Bucket size for aggregation ("10s", "1m" or "1h").
+        agg (default=max): Aggregate applied per bucket ("avg", "max", "sum" or "p95").
+
+    Every row carries the vendor of its MAC address, classified from the OUI registries.
 
     Returns: 
-        JSON response containing the filtered asset discovery data or an error message.
+        JSON response containing the filtered asset discovery data or an error message. The cursor for
+        the next page, if any, is returned in the X-Next-Cursor header.
     """
     try:
         # Extract query parameters
@@ -326,10 +1177,25 @@ def get_asset_discovery_data():
         dpid = request.args.get('dpid', type=int)
         mac_address = request.args.get('mac_address')
         limit = request.args.get('limit', default=100, type=int)
+        cursor = request.args.get('cursor')
+        bucket = request.args.get('bucket')
+        agg = request.args.get('agg', 'max')
+        history = request.args.get('history', 'false').lower() == 'true'
+        try:
+            start = parse_timestamp(request.args.get('start'))
+            end = parse_timestamp(request.args.get('end'))
+        except ValueError:
+            return jsonify({'error': 'start and end must be ISO 8601 timestamps or seconds since the epoch.'}), 400
         
+        vendor_db = current_app.vendor_db
+
         # Validate input
         if not device_id and not dpid:
             return jsonify({'error': 'Either device_id or dpid must be provided.'}), 400
+        if bucket is not None and bucket not in BUCKETS:
+            return jsonify({'error': f'bucket must be one of {", ".join(BUCKETS)}.'}), 400
+        if agg not in AGGREGATES:
+            return jsonify({'error': f'agg must be one of {", ".join(AGGREGATES)}.'}), 400
         
         # Resolve device ID using DPID if not provided
         if dpid and not device_id:
@@ -338,26 +1204,128 @@ def get_asset_discovery_data():
                 device_id = device.id
             else:
                 return jsonify({'error': f'Device with dpid {dpid} not found.'}), 404
+
+        if not (history or start or end or cursor or bucket):
+            # Current inventory, a single indexed lookup per switch
+            query = AssetInventory.query.filter(AssetInventory.switch_id == device_id)
+            if mac_address:
+                query = query.filter(AssetInventory.mac_address == mac_address)
+            assets = query.order_by(AssetInventory.last_seen.desc(), AssetInventory.id.desc()).limit(limit).all()
+            results = [
+                {
+                    'timestamp': asset.last_seen.isoformat(),
+                    'switch_id': asset.switch_id,
+                    'mac_address': asset.mac_address,
+                    'vendor': vendor_db.vendor(asset.mac_address),
+                    'bytes': asset.bytes,
+                    'packets': asset.packets,
+                    'first_seen': asset.first_seen.isoformat(),
+                    'last_seen': asset.last_seen.isoformat(),
+                    'present': asset.present
+                }
+                for asset in assets
+            ]
+            return jsonify(results), 200
+
+        def apply_filters(query, range_start=start):
+            query = query.filter(AssetDiscovery.switch_id == device_id)
+            if mac_address:
+                query = query.filter(AssetDiscovery.mac_address == mac_address)
+            return filter_range(query, AssetDiscovery.timestamp, range_start, end)
+
+        if bucket is None:
+            # Retrieve the filtered data
+            asset_data, next_cursor = keyset_page(apply_filters(AssetDiscovery.query), AssetDiscovery.timestamp, AssetDiscovery.id, cursor, limit)
         
-        # Build query for asset discovery data
-        query = AssetDiscovery.query.filter_by(switch_id=device_id)
-        
-        # Retrieve the filtered data
-        asset_data = query.order_by(AssetDiscovery.timestamp.desc()).limit(limit).all()
-        
-        # Serialise results
+            # Serialise results
+            results = [
+                {
+                    'timestamp': data.timestamp.isoformat(),
+                    'switch_id': data.switch_id,
+                    'mac_address': data.mac_address,
+                    'vendor': vendor_db.vendor(data.mac_address),
+                    'bytes': data.bytes,
+                    'packets': data.packets
+                }
+                for data in asset_data
+            ]
+            return paged_response(results, next_cursor), 200
+
+        # Buckets after the one of the cursor are done, end the range with it to pick the rollups
+        if cursor:
+            cursor_bucket, _ = decode_bucket_cursor(cursor)
+            cursor_end = datetime.fromtimestamp(cursor_bucket + BUCKETS[bucket], timezone.utc).replace(tzinfo=None)
+            end = min(end, cursor_end) if end else cursor_end
+
+        def raw_query(range_start=start):
+            return apply_filters(bucketed(
+                [AssetDiscovery.switch_id, AssetDiscovery.mac_address],
+                {'bytes': AssetDiscovery.bytes, 'packets': AssetDiscovery.packets},
+                AssetDiscovery.timestamp, BUCKETS[bucket], agg
+            ), range_start)
+
+        resolution, tail = choose_resolution(AssetDiscovery.__tablename__, BUCKETS[bucket], agg, start, end, current_app.config)
+        if resolution:
+            query = rollup_bucketed(
+                AssetDiscoveryRollup,
+                [AssetDiscoveryRollup.switch_id, AssetDiscoveryRollup.mac_address],
+                ['bytes', 'packets'], resolution, BUCKETS[bucket], agg
+            ).filter(AssetDiscoveryRollup.switch_id == device_id)
+            if mac_address:
+                query = query.filter(AssetDiscoveryRollup.mac_address == mac_address)
+            query = filter_range(query, AssetDiscoveryRollup.bucket, start, tail or end)
+            if tail:
+                # Buckets not fully rolled up yet come from the raw rows
+                query = union_buckets(query, raw_query(tail))
+        else:
+            query = raw_query()
+        keys = ['switch_id', 'mac_address']
+        rows, next_cursor = bucket_page(bucket_keyset(query, keys, cursor).limit(limit + 1).all(), limit, keys)
         results = [
             {
-                'timestamp': data.timestamp.isoformat(),
-                'switch_id': data.switch_id,
-                'mac_address': data.mac_address,
-                'bytes': data.bytes,
-                'packets': data.packets
+                'timestamp': bucket_timestamp(row.bucket),
+                'switch_id': row.switch_id,
+                'mac_address': row.mac_address,
+                'vendor': vendor_db.vendor(row.mac_address),
+                'bytes': float(row.bytes),
+                'packets': float(row.packets)
             }
-            for data in asset_data
+            for row in rows
         ]
-        return jsonify(results), 200
+        return paged_response(results, next_cursor), 200
     
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.error(f"Error fetching asset discovery data: {e}")
-        return jsonify({'error': 'Failed to retrieve asset discovery data.'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Failed to retrieve asset discovery data.'}), 500
+
+@controller_routes.route('/vendors', methods=['GET'])
+def get_vendors():
+    """
+    Classifies MAC addresses by vendor using the offline OUI registries.
+
+    Query parameters (optional):
+        mac_address: MAC address to classify, can be repeated.
+
+    Returns:
+        JSON response with the state of the vendor index and the vendor and matching prefix length of
+        each MAC address.
+    """
+    try:
+        vendor_db = current_app.vendor_db
+        results = []
+        for mac_address in request.args.getlist('mac_address'):
+            try:
+                match = vendor_db.lookup(mac_address)
+            except ValueError:
+                return jsonify({'error': f'Invalid MAC address: {mac_address}'}), 400
+            results.append({
+                'mac_address': mac_address,
+                'vendor': match[0] if match else 'unknown',
+                'prefix_bits': match[1] if match else None,
+            })
+        return jsonify(dict(vendor_db.status(), results=results)), 200
+    except Exception as e:
+        logging.error(f"Error classifying MAC vendors: {e}")
+        return jsonify({'error': 'Failed to classify MAC vendors'}), 500
@@ -1,3 +1,5 @@
 from .application import eBPFCoreApplication
 from .events import set_event_handler
-from .protocol import FLOOD, CONTROLLER, DROP
+from .executors import register_executor, submit, executor_status
+from .connection import FLOOD, CONTROLLER, DROP
+from .runtime import call_from_thread
@@ -0,0 +1,45 @@
+import asyncio
+
+from .connection import eBPFConnection
+
+class eBPFAsyncioProtocol(eBPFConnection, asyncio.BufferedProtocol):
+    """
+        Switch connection served by an asyncio event loop.
+
+        The loop reads straight into a receive buffer allocated once per
+        connection (asyncio.BufferedProtocol) instead of handing over a new
+        bytes object for every read, the received bytes are then framed
+        like on the Twisted core.
+    """
+    RECEIVE_BUFFER_SIZE = 256 * 1024
+
+    def __init__(self, application):
+        eBPFConnection.__init__(self, application)
+        self.transport = None
+        self.received = memoryview(bytearray(eBPFAsyncioProtocol.RECEIVE_BUFFER_SIZE))
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.on_open()
+
+    def get_buffer(self, sizehint):
+        return self.received
+
+    def buffer_updated(self, nbytes):
+        self.on_data(self.received[:nbytes])
+
+    def eof_received(self):
+        # Close the transport, connection_lost follows
+        return False
+
+    def connection_lost(self, exc):
+        self.on_close(exc)
+
+    def write(self, data):
+        self.transport.write(data)
+
+    def pause_reading(self):
+        self.transport.pause_reading()
+
+    def resume_reading(self):
+        self.transport.resume_reading()
@@ -1,19 +1,23 @@
 import time
 
-from twisted.internet import reactor
-
 from .events import set_event_handler
-from .protocol import eBPFFactory
+from .executors import shutdown_executors
+from .runtime import use_runtime
+from .scheduler import Scheduler
 from .packets import *
 
 class eBPFCoreApplication(object):
-    def __init__(self):
+    def __init__(self, budget=0.01, quantum=32, high_water=10000, core='twisted', use_uvloop=False, port=9000):
         self.connections = {}
-        reactor.listenTCP(9000, eBPFFactory(self))
+        self.scheduler = Scheduler(budget, quantum, high_water)
+        # Twisted reactor or asyncio event loop, both serve the same handlers
+        self.runtime = use_runtime(core, use_uvloop)
+        self.runtime.listen(port, self)
 
     @set_event_handler('disconnect')
     def connection_closed(self, connection, reason):
-        del self.connections[connection.dpid]
+        # Connections closed before a HELLO was received have no dpid
+        self.connections.pop(getattr(connection, 'dpid', None), None)
 
     @set_event_handler(Header.HELLO)
     def hello_request(self, connection, pkt):
@@ -28,8 +32,10 @@ class eBPFCoreApplication(object):
         connection.send(Hello(version=1, dpid=0))
 
     def run(self):
-        reactor.run()
+        self.runtime.run()
 
     def stop(self):
+        self.runtime.stop()
+        shutdown_executors()
         # Close all the connections
         self.connections.clear()
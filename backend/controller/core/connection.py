@@ -0,0 +1,147 @@
+from collections import namedtuple
+import struct
+
+from .packets import *
+from .events import _handlers
+from .executors import run_handler
+
+FLOOD      = 0xfffffffd
+CONTROLLER = 0xfffffffe
+DROP       = 0xffffffff
+
+PORT = 0x00
+FLOOD = 0x01 << 32
+CONTROLLER = 0x02 << 32
+DROP = 0x03 << 32
+NEXT = 0x04 << 32
+
+PacketHeader = namedtuple('PacketHeader', ['type', 'length'])
+
+class eBPFConnection(object):
+    """
+        Framing and dispatching of the messages of a switch connection,
+        shared by the Twisted and asyncio protocols. Subclasses feed the
+        received bytes to on_data and implement write, pause_reading and
+        resume_reading on top of their transport.
+    """
+    _message_type_to_object = {
+        Header.HELLO: Hello,
+
+        Header.FUNCTION_ADD_REQUEST: FunctionAddRequest,
+        Header.FUNCTION_ADD_REPLY: FunctionAddReply,
+        Header.FUNCTION_REMOVE_REQUEST: FunctionRemoveRequest,
+        Header.FUNCTION_REMOVE_REPLY: FunctionRemoveReply,
+        Header.FUNCTION_LIST_REQUEST: FunctionListRequest,
+        Header.FUNCTION_LIST_REPLY: FunctionListReply,
+
+        Header.TABLES_LIST_REQUEST: TablesListRequest,
+        Header.TABLES_LIST_REPLY: TablesListReply,
+        Header.TABLE_LIST_REQUEST: TableListRequest,
+        Header.TABLE_LIST_REPLY: TableListReply,
+        Header.TABLE_ENTRY_GET_REQUEST: TableEntryGetRequest,
+        Header.TABLE_ENTRY_GET_REPLY: TableEntryGetReply,
+        Header.TABLE_ENTRY_INSERT_REQUEST: TableEntryInsertRequest,
+        Header.TABLE_ENTRY_INSERT_REPLY: TableEntryInsertReply,
+        Header.TABLE_ENTRY_DELETE_REQUEST: TableEntryDeleteRequest,
+        Header.TABLE_ENTRY_DELETE_REPLY: TableEntryDeleteReply,
+        Header.PACKET_IN: PacketIn,
+        Header.PACKET_OUT: PacketOut,
+        Header.NOTIFY: Notify,
+    }
+
+    _message_object_to_type = { v: k for k,v in _message_type_to_object.items() }
+
+    HEADER_FMT = '>HH'
+    HEADER_LENGTH = struct.calcsize(HEADER_FMT)
+
+    def __init__(self, application):
+        self.application = application
+        self.buffer = bytearray()
+        self.header = None
+
+    def _read_packets(self):
+        """
+            Generator to read the incoming packets, yield a tuple with the
+            header as the first element and the raw payload as second element.
+            Payloads are only deserialized when their handlers run, see
+            dispatch. The generator is stopped if a full packet (header and
+            payload) is not available.
+        """
+        offset = 0
+        try:
+            while True:
+                if not self.header:
+                    if len(self.buffer) - offset < eBPFConnection.HEADER_LENGTH:
+                        break
+                    self.header = PacketHeader(*struct.unpack_from(eBPFConnection.HEADER_FMT, self.buffer, offset))
+                    offset += eBPFConnection.HEADER_LENGTH
+
+                if len(self.buffer) - offset < self.header.length:
+                    break
+
+                # read the payload of the packet
+                payload = bytes(self.buffer[offset:offset + self.header.length])
+                offset += self.header.length
+                header, self.header = self.header, None
+                yield (header, payload)
+        finally:
+            # Drop the consumed bytes once instead of after every packet
+            del self.buffer[:offset]
+
+    def _run_handlers(self, event, *args):
+        """
+            Execute all the handlers (if any) for the event type provided.
+        """
+        for handler in _handlers.get(event, []):
+            if run_handler(handler, self.application, self, args) is True:
+                break
+
+    def dispatch(self, event, payload):
+        """
+            Deserialize a queued packet to its associated object if the message
+            type is known, and run its handlers. Called by the scheduler.
+        """
+        if event == 'disconnect':
+            self._run_handlers(event, payload)
+            return
+
+        cls = eBPFConnection._message_type_to_object.get(event)
+        if cls:
+            inst = cls()
+            inst.ParseFromString(payload)
+            self._run_handlers(event, inst)
+        else:
+            # No handler for
+            self._run_handlers(event, payload)
+
+    def on_open(self):
+        self.application.scheduler.register(self)
+
+    def on_data(self, data):
+        # append the newly received data to the buffer
+        self.buffer.extend(data)
+
+        # Queue the packets received, the scheduler calls the associated handlers
+        for header, payload in self._read_packets():
+            self.application.scheduler.enqueue(self, header.type, payload)
+
+    def on_close(self, reason):
+        self.application.scheduler.close(self, reason)
+
+    def send(self, pkt):
+        """
+            Serialize and send a message to a switch. Must be called in the
+            thread running the event loop.
+        """
+        payload = pkt.SerializeToString()
+        header = struct.pack('>HH', eBPFConnection._message_object_to_type[type(pkt)], len(payload))
+        self.write(header + payload)
+
+    def write(self, data):
+        raise NotImplementedError
+
+    def pause_reading(self):
+        raise NotImplementedError
+
+    def resume_reading(self):
+        raise NotImplementedError
@@ -1,7 +1,26 @@
 _handlers = {}
 
-def set_event_handler(opcode):
+def set_event_handler(opcode, executor='inline', ordered=False, prepare=None):
+    """
+        Registers a function as a handler of an event.
+
+        Args:
+            opcode: Header type of the message, or 'disconnect'.
+            executor: Execution policy, "inline" to run on the event loop or the
+                name of an executor (see core.executors.register_executor).
+            ordered: Run the handler calls of a switch one at a time, in the
+                order the messages were received.
+            prepare: For process executors, picklable function run in the
+                pool on the message. The handler then runs on the event loop
+                with its result as an extra argument.
+
+        Handlers of an event run in the order they were registered. An
+        inline handler returning True consumes the event, the handlers
+        after it are not run (e.g. a reply taken by a waiting request).
+    """
     def set_event_handler_decorator(func):
+        if executor != 'inline' or prepare is not None:
+            func._execution = (executor, ordered, prepare)
         _handlers.setdefault(opcode, []).append(func)
         return func
     return set_event_handler_decorator
@@ -0,0 +1,178 @@
+import logging
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from .runtime import call_from_thread
+
+INLINE = 'inline'
+
+_executors = {}
+
+def _timed_call(func, args):
+    """
+        Runs a function in a worker and returns its result with the time it
+        started. CLOCK_MONOTONIC is shared by the processes of the machine.
+    """
+    started = time.monotonic()
+    return func(*args), started
+
+class Executor(object):
+    """
+        Named bounded pool running event handlers off the event loop.
+
+        Thread pools run the handler itself. Process pools run a picklable
+        function on the message (e.g. CPU-heavy decoding) and hand its
+        result back to the event loop thread. Work submitted with a key (e.g.
+        the dpid) runs in submission order, one at a time per key, while
+        different keys run concurrently.
+    """
+    def __init__(self, name, kind='thread', max_workers=4):
+        if kind not in ('thread', 'process'):
+            raise ValueError('Unknown executor kind {}'.format(kind))
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        if kind == 'thread':
+            self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        else:
+            self.pool = ProcessPoolExecutor(max_workers=max_workers)
+        self.chains = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.waits = deque(maxlen=1024)
+
+    def submit(self, func, args, key=None):
+        """
+            Runs func(*args) in the pool. Must be called in the event loop
+            thread, the returned Future is resolved in that thread too.
+        """
+        task = (func, args, Future(), time.monotonic())
+        if key is not None:
+            chain = self.chains.get(key)
+            if chain is not None:
+                chain.append(task)
+                return task[2]
+            self.chains[key] = deque()
+        self._start(task, key)
+        return task[2]
+
+    def _start(self, task, key):
+        func, args, future, queued_at = task
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        running = self.pool.submit(_timed_call, func, args)
+        running.add_done_callback(lambda running: call_from_thread(self._finished, task, key, running))
+
+    def _finished(self, task, key, running):
+        future, queued_at = task[2], task[3]
+        self.in_flight -= 1
+        self._next(key)
+        try:
+            result, started = running.result()
+        except Exception as e:
+            self.failed += 1
+            future.set_exception(e)
+            return
+        self.completed += 1
+        self.waits.append(started - queued_at)
+        future.set_result(result)
+
+    def _next(self, key):
+        if key is None:
+            return
+        chain = self.chains[key]
+        if chain:
+            self._start(chain.popleft(), key)
+        else:
+            del self.chains[key]
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
+    def status(self):
+        waits = sorted(self.waits)
+        return {
+            'kind': self.kind,
+            'max_workers': self.max_workers,
+            'active': min(self.in_flight, self.max_workers),
+            'queued': max(0, self.in_flight - self.max_workers) + sum(len(chain) for chain in self.chains.values()),
+            'peak_in_flight': self.peak_in_flight,
+            'completed': self.completed,
+            'failed': self.failed,
+            'wait_ms': {
+                'avg': round(sum(waits) / len(waits) * 1000, 3) if waits else None,
+                'p95': round(waits[min(len(waits) - 1, int(0.95 * len(waits)))] * 1000, 3) if waits else None,
+                'max': round(waits[-1] * 1000, 3) if waits else None,
+            },
+        }
+
+def register_executor(name, kind='thread', max_workers=4):
+    """
+        Creates a named executor handlers can be bound to, replacing the
+        executor already registered under that name.
+    """
+    _executors[name] = Executor(name, kind, max_workers)
+    return _executors[name]
+
+def submit(executor, func, *args, key=None):
+    """
+        Runs func(*args) with the named executor, inline if executor is
+        "inline". Must be called in the event loop thread.
+
+        Returns:
+            Future resolved in the event loop thread with the result.
+    """
+    if executor == INLINE:
+        future = Future()
+        future.set_result(func(*args))
+        return future
+    return _executors[executor].submit(func, args, key)
+
+def run_handler(handler, application, connection, args):
+    """
+        Runs an event handler according to the execution policy it was
+        registered with (see set_event_handler).
+
+        Returns:
+            The result of an inline handler, None for the other policies.
+    """
+    executor, ordered, prepare = getattr(handler, '_execution', (INLINE, False, None))
+    if executor == INLINE:
+        return handler(application, connection, *args)
+
+    key = getattr(connection, 'dpid', None) if ordered else None
+    if prepare is None:
+        future = _executors[executor].submit(handler, (application, connection) + tuple(args), key)
+    else:
+        future = Future()
+
+        def prepared(done):
+            try:
+                future.set_result(handler(application, connection, *args, done.result()))
+            except Exception as e:
+                future.set_exception(e)
+        _executors[executor].submit(prepare, tuple(args), key).add_done_callback(prepared)
+
+    def failed(done):
+        e = done.exception()
+        if e is not None:
+            logging.error('Error in handler {} for switch {}: {}'.format(
+                handler.__name__, getattr(connection, 'dpid', None), ''.join(traceback.format_exception(type(e), e, e.__traceback__))))
+    future.add_done_callback(failed)
+
+def shutdown_executors():
+    """
+        Stops the worker pools without waiting for the queued work.
+    """
+    for executor in _executors.values():
+        executor.shutdown()
+
+def executor_status():
+    """
+        Returns the concurrency and queue wait times of each executor.
+    """
+    return {name: executor.status() for name, executor in _executors.items()}
@@ -7,6 +7,6 @@ from Function_pb2 import FunctionAddRequest, FunctionAddReply, FunctionRemoveReq
 from Table_pb2 import TablesListRequest, TablesListReply, TableListRequest, \
     TableListReply, TableEntryGetRequest, TableEntryGetReply, \
     TableEntryInsertRequest, TableEntryInsertReply, TableEntryDeleteRequest, \
-    TableEntryDeleteReply, TableDefinition
+    TableEntryDeleteReply, TableDefinition, TableStatus
 from Packet_pb2 import PacketIn, PacketOut
 from Notify_pb2 import Notify
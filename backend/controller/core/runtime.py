@@ -0,0 +1,119 @@
+import asyncio
+import logging
+
+_runtime = None
+
+class TwistedRuntime(object):
+    """
+        Runs the core on the Twisted reactor.
+    """
+    name = 'twisted'
+
+    def __init__(self):
+        from twisted.internet import reactor
+        self.reactor = reactor
+
+    def listen(self, port, application):
+        from .protocol import eBPFFactory
+        self.reactor.listenTCP(port, eBPFFactory(application))
+
+    def run(self, install_signal_handlers=True):
+        self.reactor.run(installSignalHandlers=install_signal_handlers)
+
+    def stop(self):
+        self.reactor.callFromThread(self.reactor.stop)
+
+    def call_later(self, delay, func, *args):
+        return self.reactor.callLater(delay, func, *args)
+
+    def call_from_thread(self, func, *args):
+        self.reactor.callFromThread(func, *args)
+
+class AsyncioRuntime(object):
+    """
+        Runs the core on an asyncio event loop, uvloop's if requested and
+        installed. The loop is created up front so the server sockets are
+        bound before it runs, like with the reactor.
+    """
+    name = 'asyncio'
+
+    def __init__(self, use_uvloop=False):
+        self.loop = None
+        if use_uvloop:
+            try:
+                import uvloop
+                self.loop = uvloop.new_event_loop()
+                self.name = 'asyncio (uvloop)'
+            except ImportError:
+                logging.warning('uvloop is not installed, using the default asyncio event loop')
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        self.servers = []
+
+    def listen(self, port, application):
+        from .aio import eBPFAsyncioProtocol
+        server = self.loop.create_server(lambda: eBPFAsyncioProtocol(application), port=port)
+        self.servers.append(self.loop.run_until_complete(server))
+
+    def run(self, install_signal_handlers=True):
+        # Signals are only delivered to the main thread, where KeyboardInterrupt stops run_forever
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            asyncio.set_event_loop(None)
+
+    def stop(self):
+        def stop():
+            for server in self.servers:
+                server.close()
+            self.loop.stop()
+        self.loop.call_soon_threadsafe(stop)
+
+    def call_later(self, delay, func, *args):
+        return self.loop.call_later(delay, func, *args)
+
+    def call_from_thread(self, func, *args):
+        self.loop.call_soon_threadsafe(func, *args)
+
+def use_runtime(core='twisted', use_uvloop=False):
+    """
+        Selects the event loop the core runs on. Called once at startup,
+        before any connection is accepted.
+
+        Args:
+            core: "twisted" or "asyncio".
+            use_uvloop: Run the asyncio core on uvloop if it is installed.
+    """
+    global _runtime
+    if core == 'twisted':
+        _runtime = TwistedRuntime()
+    elif core == 'asyncio':
+        _runtime = AsyncioRuntime(use_uvloop)
+    else:
+        raise ValueError('Unknown controller core {}'.format(core))
+    return _runtime
+
+def current_runtime():
+    """
+        Returns the runtime selected at startup, the Twisted reactor if none
+        was selected.
+    """
+    global _runtime
+    if _runtime is None:
+        _runtime = TwistedRuntime()
+    return _runtime
+
+def call_later(delay, func, *args):
+    """
+        Schedules func(*args) on the event loop. Must be called in the event
+        loop thread.
+    """
+    return current_runtime().call_later(delay, func, *args)
+
+def call_from_thread(func, *args):
+    """
+        Runs func(*args) in the event loop thread. Safe to call from any
+        thread.
+    """
+    current_runtime().call_from_thread(func, *args)
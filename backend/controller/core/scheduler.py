@@ -0,0 +1,141 @@
+import logging
+import time
+from collections import deque
+
+
+from .packets import *
+from .runtime import call_later
+
+# Messages handled before any telemetry, whichever switch sent them
+CONTROL_MESSAGES = frozenset([
+    Header.HELLO,
+    Header.FUNCTION_ADD_REPLY,
+    Header.FUNCTION_REMOVE_REPLY,
+    Header.FUNCTION_LIST_REPLY,
+    'disconnect',
+])
+
+class InboundQueue(object):
+    """
+        Messages received on a connection and waiting for their handlers.
+    """
+    __slots__ = ('control', 'telemetry', 'weight', 'processed', 'paused', 'closed')
+
+    def __init__(self, weight=1):
+        self.control = deque()
+        self.telemetry = deque()
+        self.weight = weight
+        self.processed = 0
+        self.paused = False
+        self.closed = False
+
+class Scheduler(object):
+    """
+        Dispatches the messages received on all the connections fairly.
+
+        Each connection gets its own inbound queue, split into control
+        messages (HELLO, FUNCTION_*_REPLY, disconnect) and telemetry. Every
+        tick first handles the queued control messages, then serves the
+        telemetry queues in weighted round-robin, at most quantum * weight
+        messages per connection per turn, until the time budget of the tick
+        is used. The event loop then gets to run I/O before the next tick, so a
+        switch flooding NOTIFY or large table replies only delays its own
+        messages. A connection whose telemetry queue grows over high_water
+        stops being read until it drained to half of it.
+    """
+    def __init__(self, budget=0.01, quantum=32, high_water=10000):
+        self.budget = budget
+        self.quantum = quantum
+        self.high_water = high_water
+        self.queues = {}
+        self.ready = deque()
+        self.scheduled = False
+
+    def register(self, connection):
+        self.queues[connection] = InboundQueue()
+
+    def set_weight(self, connection, weight):
+        self.queues[connection].weight = max(1, int(weight))
+
+    def enqueue(self, connection, event, payload):
+        queue = self.queues[connection]
+        if event in CONTROL_MESSAGES:
+            queue.control.append((event, payload))
+        else:
+            if not queue.telemetry:
+                self.ready.append(connection)
+            queue.telemetry.append((event, payload))
+            if len(queue.telemetry) >= self.high_water and not queue.paused:
+                queue.paused = True
+                connection.pause_reading()
+        self._wake()
+
+    def close(self, connection, reason):
+        """
+            Queues the disconnect event after the pending control messages,
+            the telemetry of a lost connection is dropped.
+        """
+        queue = self.queues[connection]
+        queue.closed = True
+        queue.telemetry.clear()
+        queue.control.append(('disconnect', reason))
+        self._wake()
+
+    def _wake(self):
+        if not self.scheduled:
+            self.scheduled = True
+            call_later(0, self.tick)
+
+    def _dispatch(self, connection, queue, event, payload):
+        queue.processed += 1
+        try:
+            connection.dispatch(event, payload)
+        except Exception:
+            logging.exception('Error handling message {} from switch {}'.format(event, getattr(connection, 'dpid', None)))
+
+    def tick(self):
+        self.scheduled = False
+        deadline = time.perf_counter() + self.budget
+
+        # Control messages first, in the order the connections were accepted
+        for connection, queue in list(self.queues.items()):
+            while queue.control:
+                event, payload = queue.control.popleft()
+                self._dispatch(connection, queue, event, payload)
+            if queue.closed:
+                del self.queues[connection]
+
+        # Weighted round-robin over the connections with telemetry waiting
+        while self.ready and time.perf_counter() < deadline:
+            connection = self.ready.popleft()
+            queue = self.queues.get(connection)
+            if queue is None or not queue.telemetry:
+                continue
+            for _ in range(self.quantum * queue.weight):
+                event, payload = queue.telemetry.popleft()
+                self._dispatch(connection, queue, event, payload)
+                if not queue.telemetry or time.perf_counter() >= deadline:
+                    break
+            if queue.telemetry:
+                self.ready.append(connection)
+            if queue.paused and len(queue.telemetry) <= self.high_water // 2 and not queue.closed:
+                queue.paused = False
+                connection.resume_reading()
+
+        if self.ready or any(queue.control for queue in self.queues.values()):
+            self._wake()
+
+    def status(self):
+        """
+            Returns the queue depths of each connection, mapped by dpid.
+        """
+        return {
+            getattr(connection, 'dpid', None): {
+                'control': len(queue.control),
+                'telemetry': len(queue.telemetry),
+                'weight': queue.weight,
+                'processed': queue.processed,
+                'paused': queue.paused,
+            }
+            for connection, queue in list(self.queues.items())
+        }
@@ -0,0 +1,234 @@
+import logging
+import struct
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from sqlalchemy.dialects.postgresql import insert
+
+from shared import db
+from shared.models import Device, EventLog, GooseAnalysisData
+from stages import FunctionStages
+from stream import broker
+
+# Name of the data plane function and map tracking the last stNum/sqNum of each GOOSE publisher
+GOOSE_FUNCTION = 'goose_analyser'
+GOOSE_TABLE = 'goose_analyser'
+
+# Map entry: publisher MAC, stNum, sqNum. The switch stores -1 until it parsed a one byte counter
+GOOSE_ENTRY = struct.Struct('<6sii')
+
+# The switch only parses one byte counters, so they wrap at 256
+COUNTER_MODULO = 256
+HALF_RANGE = COUNTER_MODULO // 2
+
+# Kinds of changes raised as anomalies
+ANOMALIES = ('reset', 'gap', 'stnum_jump', 'replay')
+
+class Publisher:
+    """
+    Last known counters of a GOOSE publisher as seen by a switch.
+
+    Attributes:
+        st: Last stNum.
+        sq: Last sqNum.
+        alerted: Time the last event was raised for each anomaly kind.
+    """
+    __slots__ = ('st', 'sq', 'alerted')
+
+    def __init__(self, st, sq):
+        self.st = st
+        self.sq = sq
+        self.alerted = {}
+
+def classify(st, sq, new_st, new_sq, max_st_step):
+    """
+    Classifies the change of a publisher's counters between two polls.
+
+    Within a state, sqNum counts retransmissions up and a new state increments stNum and restarts sqNum,
+    both modulo 256. Several state changes can happen between two polls, up to max_st_step of them are
+    reported as a gap. A larger stNum increase is how injected (FDI) messages take over subscribers,
+    and counters moving backwards mean old messages are being replayed.
+
+    Args:
+        st: Previous stNum.
+        sq: Previous sqNum.
+        new_st: Current stNum.
+        new_sq: Current sqNum.
+        max_st_step: Largest stNum increase between two polls that is not a jump.
+
+    Returns:
+        One of "idle", "retransmit", "state_change", or an anomaly kind from ANOMALIES.
+    """
+    if new_st == st:
+        if new_sq == sq:
+            return 'idle'
+        return 'retransmit' if (new_sq - sq) % COUNTER_MODULO < HALF_RANGE else 'replay'
+    step = (new_st - st) % COUNTER_MODULO
+    if step == 1:
+        return 'state_change'
+    if step <= max_st_step:
+        return 'gap'
+    # A restarted publisher begins again from the first state
+    if new_st <= 1 and new_sq <= 1:
+        return 'reset'
+    return 'stnum_jump' if step < HALF_RANGE else 'replay'
+
+class GooseAnalyser:
+    """
+    Tracks the stNum/sqNum of every GOOSE publisher from the goose_analyser tables of the switches.
+
+    The tables are polled once per interval. Each reply is decoded in a single pass and every entry
+    costs one dictionary lookup and a comparison with the publisher's previous counters. Rows are only
+    stored when a publisher is first seen, changes state or shows an anomaly, and anomalies are raised
+    as events in the reply handling, so within one poll interval.
+
+    Attributes:
+        app: Flask application instance for database context.
+        controller: The running eBPFController.
+        interval: Seconds between polls.
+        max_st_step: Largest stNum increase between two polls that is not a jump.
+        cooldown: Seconds before the same anomaly of a publisher is raised again.
+        stages: Stages of goose_analyser, as the switches report them.
+        publishers: Publisher state mapped by (DPID, MAC).
+        anomalies: Most recent anomalies, newest last.
+    """
+    def __init__(self, app, controller):
+        self.app = app
+        self.controller = controller
+        self.interval = app.config['GOOSE_POLL_INTERVAL']
+        self.max_st_step = app.config['GOOSE_MAX_ST_STEP']
+        self.cooldown = app.config['GOOSE_ALERT_COOLDOWN']
+        self.lock = threading.Lock()
+        self.stages = FunctionStages(GOOSE_FUNCTION)
+        self.publishers = {}
+        self.anomalies = deque(maxlen=app.config['GOOSE_ANOMALY_HISTORY'])
+        self.stopped = threading.Event()
+
+    def start(self):
+        """
+        Starts polling the goose_analyser tables in a background daemon thread.
+
+        Returns:
+            Reference to the instance for further use.
+        """
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def stop(self):
+        """
+        Stops polling.
+        """
+        self.stopped.set()
+
+    def run(self):
+        """
+        Requests the goose_analyser table of every connected switch running it, once per interval.
+        """
+        while not self.stopped.wait(self.interval):
+            try:
+                for dpid, index in self.stages.items():
+                    connection = self.controller.connections.get(dpid)
+                    if connection is not None and dpid in self.controller.connected_devices:
+                        self.controller.request_table(connection, index, GOOSE_TABLE)
+            except Exception as e:
+                logging.error(f"Error polling the GOOSE analyser tables: {e}")
+
+    def process(self, dpid, pkt):
+        """
+        Updates the publishers of a switch from its goose_analyser table and stores the changes.
+
+        Args:
+            dpid: The switch the table comes from.
+            pkt: The TableListReply of the goose_analyser table.
+        """
+        now = time.time()
+        timestamp = datetime.fromtimestamp(now, timezone.utc)
+        changes = []
+        raised = []
+        with self.lock:
+            for mac, st, sq in GOOSE_ENTRY.iter_unpack(pkt.items[:pkt.n_items * GOOSE_ENTRY.size]):
+                if st < 0 or sq < 0:
+                    continue
+                publisher = self.publishers.get((dpid, mac))
+                if publisher is None:
+                    self.publishers[(dpid, mac)] = Publisher(st, sq)
+                    changes.append((mac, st, sq))
+                    continue
+
+                kind = classify(publisher.st, publisher.sq, st, sq, self.max_st_step)
+                previous = (publisher.st, publisher.sq)
+                publisher.st, publisher.sq = st, sq
+                if kind in ('idle', 'retransmit'):
+                    continue
+                changes.append((mac, st, sq))
+                if kind in ANOMALIES and now - publisher.alerted.get(kind, 0.0) >= self.cooldown:
+                    publisher.alerted[kind] = now
+                    raised.append((mac, kind, previous, (st, sq)))
+
+        if changes:
+            self.store(dpid, timestamp, changes, raised)
+
+    def store(self, dpid, timestamp, changes, raised):
+        """
+        Stores the changed counters and raises the anomalies of a poll in a single transaction.
+        """
+        try:
+            with self.app.app_context():
+                device = Device.query.filter_by(dpid=dpid).first()
+                if not device:
+                    logging.error(f"Device with DPID {dpid} not found in the database.")
+                    return
+                naive = timestamp.replace(tzinfo=None)
+                db.session.execute(insert(GooseAnalysisData).on_conflict_do_nothing(constraint='_goose_analysis_unique'), [
+                    {'timestamp': naive, 'device_id': device.id, 'mac_address': mac.hex(':'), 'stNum': str(st), 'sqNum': str(sq)}
+                    for mac, st, sq in changes
+                ])
+
+                events = []
+                for mac, kind, previous, current in raised:
+                    anomaly = {
+                        'dpid': dpid,
+                        'mac_address': mac.hex(':'),
+                        'anomaly': kind,
+                        'previous': {'stNum': previous[0], 'sqNum': previous[1]},
+                        'current': {'stNum': current[0], 'sqNum': current[1]},
+                        'timestamp': timestamp.isoformat(),
+                    }
+                    with self.lock:
+                        self.anomalies.append(anomaly)
+                    events.append(EventLog(
+                        timestamp=timestamp,
+                        device_id=device.id,
+                        message=f"GOOSE {kind} from {mac.hex(':')} on switch {dpid}: stNum {previous[0]} -> {current[0]}, sqNum {previous[1]} -> {current[1]}",
+                        event_type='WARNING',
+                        data=anomaly
+                    ))
+                db.session.add_all(events)
+                db.session.commit()
+                for event in events:
+                    logging.warning(event.message)
+                    broker.publish('events', self.controller.serialise_event(event))
+        except Exception as e:
+            logging.error(f"Error storing GOOSE analysis data for device {dpid}: {e}")
+            db.session.rollback()
+
+    def forget(self, dpid):
+        """
+        Forgets the publishers seen by a disconnected switch, its table restarts empty.
+        """
+        with self.lock:
+            for key in [key for key in self.publishers if key[0] == dpid]:
+                del self.publishers[key]
+
+    def status(self):
+        """
+        Returns the current counters of every publisher and the recent anomalies.
+        """
+        with self.lock:
+            publishers = [
+                {'dpid': dpid, 'mac_address': mac.hex(':'), 'stNum': publisher.st, 'sqNum': publisher.sq}
+                for (dpid, mac), publisher in self.publishers.items()
+            ]
+            return {'publishers': publishers, 'anomalies': list(self.anomalies)}
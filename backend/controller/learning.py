@@ -0,0 +1,249 @@
+import logging
+import struct
+import threading
+import time
+from collections import deque
+
+from core import FLOOD
+from core.packets import *
+
+from tables import table_status
+
+# Name of the data plane function sending unknown MACs to the controller and its MAC to port map
+LEARNING_FUNCTION = 'learningswitch_centralized'
+INPORTS_TABLE = 'inports'
+
+# Metadata the switch puts in front of the Ethernet frame: in_port, sec, nsec, length
+METADATA = struct.Struct('<IIIH')
+INPORTS_VALUE = struct.Struct('<I')
+
+# Offsets of the destination and source MACs in PacketIn data
+DST_OFFSET = METADATA.size
+SRC_OFFSET = METADATA.size + 6
+
+def percentile(samples, fraction):
+    """
+    Returns the nearest-rank percentile of sorted samples, or None if there are none.
+    """
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+class TokenBucket:
+    """
+    Token bucket limiting the rate of PACKET_IN messages handled for a switch.
+
+    Attributes:
+        rate: Tokens added per second.
+        burst: Maximum number of tokens.
+        tokens: Tokens currently available.
+        updated: Time the tokens were last refilled.
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, now):
+        """
+        Takes a token if one is available.
+
+        Returns:
+            True if the message may be handled.
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+class LearningSwitch:
+    """
+    Controller side of the centralized learning switch.
+
+    PACKET_IN messages are handled in the reactor thread without touching the database: the source MAC
+    is learned in memory, the frame is sent back out with a PacketOut to the learned port of the
+    destination (or flooded), and the source MAC is installed in the inports map of the switch running
+    learningswitch_centralized, so later frames between known MACs are forwarded by the switch itself.
+    PACKET_IN messages over the per-switch rate are dropped, and the time from receiving a PACKET_IN to
+    sending its PacketOut is sampled for percentiles.
+
+    Attributes:
+        controller: The running eBPFController.
+        rate: Sustained PACKET_IN messages per second handled for each switch.
+        burst: PACKET_IN messages a switch may send at once above the sustained rate.
+        macs: Learned port of each MAC (bytes), mapped by DPID.
+        installed: Port of each MAC installed in the inports map of the switch, mapped by DPID.
+        stages: Stage running learningswitch_centralized on each switch, or None if it does not run it. Set
+            from the pipeline the switch lists when it connects, then followed from the function replies.
+        buckets: TokenBucket of each switch.
+        counters: PACKET_IN counters of each switch.
+        latencies: Most recent packet-in to packet-out latencies in seconds.
+    """
+    def __init__(self, app, controller):
+        self.controller = controller
+        self.rate = app.config['PACKET_IN_RATE']
+        self.burst = app.config['PACKET_IN_BURST']
+        self.lock = threading.Lock()
+        self.macs = {}
+        self.installed = {}
+        self.stages = {}
+        self.buckets = {}
+        self.counters = {}
+        self.latencies = deque(maxlen=app.config['PACKET_IN_LATENCY_SAMPLES'])
+
+    def handle(self, connection, pkt):
+        """
+        Learns the source of a PACKET_IN and forwards its frame.
+
+        Args:
+            connection: The device connection the packet came from.
+            pkt: The PacketIn message.
+        """
+        started = time.perf_counter()
+        dpid = connection.dpid
+        counters = self.counters.get(dpid)
+        if counters is None:
+            counters = self.counters[dpid] = {'received': 0, 'rate_limited': 0, 'forwarded': 0, 'flooded': 0, 'dropped': 0, 'installed': 0}
+            self.buckets[dpid] = TokenBucket(self.rate, self.burst)
+        counters['received'] += 1
+        if not self.buckets[dpid].take(time.monotonic()):
+            counters['rate_limited'] += 1
+            return
+
+        data = pkt.data
+        if len(data) < SRC_OFFSET + 6:
+            counters['dropped'] += 1
+            return
+        # Only the two MACs are copied out of the frame, the data itself is sent back as is
+        view = memoryview(data)
+        in_port = METADATA.unpack_from(view)[0]
+        dst = bytes(view[DST_OFFSET:DST_OFFSET + 6])
+        src = bytes(view[SRC_OFFSET:SRC_OFFSET + 6])
+
+        macs = self.macs.setdefault(dpid, {})
+        # Group addresses are never a source, and only show up as a destination to be flooded
+        if not src[0] & 1:
+            macs[src] = in_port
+            if self.installed.setdefault(dpid, {}).get(src) != in_port and self.install(connection, src, in_port):
+                counters['installed'] += 1
+
+        port = macs.get(dst) if not dst[0] & 1 else None
+        if port is None:
+            out_port = FLOOD
+            counters['flooded'] += 1
+        elif port == in_port:
+            # Both ends are behind the same port, the frame already reached its destination
+            counters['dropped'] += 1
+            return
+        else:
+            out_port = port
+            counters['forwarded'] += 1
+
+        try:
+            connection.send(PacketOut(data=data, out_port=out_port))
+        except Exception as e:
+            logging.error(f"Failed to send a PacketOut to device {dpid}: {e}")
+            return
+        with self.lock:
+            self.latencies.append(time.perf_counter() - started)
+
+    def install(self, connection, mac, port):
+        """
+        Inserts a learned MAC in the inports map of the switch, if it runs learningswitch_centralized.
+
+        Returns:
+            True if the insert was sent.
+        """
+        dpid = connection.dpid
+        # Unknown until the switch listed its pipeline
+        stage = self.stages.get(dpid)
+        if stage is None:
+            return False
+        installed = self.installed[dpid]
+        # Recorded before the reply so a busy MAC does not trigger one insert per frame
+        installed[mac] = port
+        future = self.controller.replies.expect(dpid, Header.TABLE_ENTRY_INSERT_REPLY)
+        connection.send(TableEntryInsertRequest(index=stage, table_name=INPORTS_TABLE, key=mac, value=INPORTS_VALUE.pack(port)))
+        future.add_done_callback(lambda future: self.installed_reply(dpid, mac, future))
+        return True
+
+    def installed_reply(self, dpid, mac, future):
+        """
+        Logs inports inserts the switch did not confirm. The MAC stays recorded, its frames keep being
+        forwarded by the controller instead of retrying the insert for each of them.
+        """
+        if future.cancelled() or future.exception():
+            logging.warning(f"Insert of {mac.hex(':')} in {INPORTS_TABLE} on switch {dpid} was not confirmed.")
+        elif future.result().status != TableStatus.Value('SUCCESS'):
+            logging.warning(f"Insert of {mac.hex(':')} in {INPORTS_TABLE} on switch {dpid} failed with status {table_status(future.result().status)}.")
+
+    def stage_added(self, dpid, index, name):
+        """
+        Follows a function installed at a stage, which replaces whatever ran there.
+        """
+        if name == LEARNING_FUNCTION:
+            if self.stages.get(dpid) != index:
+                self.stages[dpid] = index
+                self.installed.pop(dpid, None)
+        elif self.stages.get(dpid) == index:
+            self.reset(dpid)
+
+    def stages_listed(self, dpid, entries):
+        """
+        Sets the stage of a switch from the FunctionListReply entries of its running pipeline. Runs in
+        the reactor thread.
+        """
+        stage = min((entry.index for entry in entries if entry.name == LEARNING_FUNCTION), default=None)
+        if dpid not in self.stages or self.stages[dpid] != stage:
+            self.stages[dpid] = stage
+            self.installed.pop(dpid, None)
+
+    def stage_removed(self, dpid, index):
+        """
+        Follows a function removed from a stage, the following stages move down by one.
+        """
+        stage = self.stages.get(dpid)
+        if stage == index:
+            self.reset(dpid)
+        elif stage is not None and stage > index:
+            self.stages[dpid] = stage - 1
+
+    def reset(self, dpid):
+        """
+        Records that a switch no longer runs learningswitch_centralized and forgets its installed entries.
+        Learned MACs are kept and installed again as their frames come in once it runs again.
+        """
+        self.stages[dpid] = None
+        self.installed.pop(dpid, None)
+
+    def forget(self, dpid):
+        """
+        Forgets everything about a disconnected switch.
+        """
+        self.stages.pop(dpid, None)
+        self.installed.pop(dpid, None)
+        self.macs.pop(dpid, None)
+
+    def status(self):
+        """
+        Returns the learned MACs and PACKET_IN counters of each switch, and the latency percentiles in milliseconds.
+        """
+        with self.lock:
+            samples = sorted(self.latencies)
+        latency = {
+            name: round(value * 1000, 3) if value is not None else None
+            for name, value in (('p50', percentile(samples, 0.5)), ('p95', percentile(samples, 0.95)), ('p99', percentile(samples, 0.99)))
+        }
+        latency['samples'] = len(samples)
+        switches = {
+            str(dpid): {
+                **counters,
+                'learned': len(self.macs.get(dpid, {})),
+                'stage': self.stages.get(dpid),
+            }
+            for dpid, counters in list(self.counters.items())
+        }
+        return {'latency_ms': latency, 'switches': switches}
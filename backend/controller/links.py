@@ -0,0 +1,196 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from shared import db
+from shared.models import Device, Link
+from topology_cache import topology_cache
+
+# Seconds between checks of the stored topology for links written by the simulation
+GRAPH_REFRESH_INTERVAL = 10
+
+class LinkState:
+    """
+    Utilization of one direction of a link.
+
+    Attributes:
+        rate: Bytes per second over the last poll.
+        peak: Highest rate within the peak window.
+        peak_at: Time the peak was reached.
+    """
+    __slots__ = ('rate', 'peak', 'peak_at')
+
+    def __init__(self):
+        self.rate = 0.0
+        self.peak = 0.0
+        self.peak_at = 0.0
+
+class LinkUtilization:
+    """
+    Maps the per MAC byte counters of the switches onto the links of the stored topology.
+
+    The monitoring function counts the bytes each switch receives per source MAC, so the bytes of a
+    MAC counted by a switch entered it over the link leading back to the MAC's host. Next hops are
+    found once per host with a breadth-first search over the link graph and kept until the topology
+    changes. A poll of a switch then only updates the links into that switch: its deltas are summed
+    per incoming link, one dictionary lookup per MAC, and links without traffic drop to zero.
+
+    Hosts are located by the MAC address stored with their device. MACs with no host device (e.g.
+    spoofed sources) cannot be placed and are counted as unmapped.
+
+    Attributes:
+        app: Flask application instance for database context.
+        default_capacity: Capacity in Mbit/s of links with no bandwidth attribute, 0 if unknown.
+        peak_window: Seconds a peak is kept before it decays to the current rate.
+        states: State of each link direction, mapped by (link ID, "forward" or "reverse").
+        unmapped: Bytes of MACs that could not be placed on a link.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.default_capacity = app.config['LINK_DEFAULT_CAPACITY_MBPS']
+        self.peak_window = app.config['LINK_PEAK_WINDOW']
+        self.lock = threading.Lock()
+        self.version = None
+        self.checked = 0.0
+        self.links = {}
+        self.adjacency = {}
+        self.hosts = {}
+        self.switches = {}
+        self.next_hops = {}
+        self.states = {}
+        self.unmapped = 0
+
+    def refresh(self):
+        """
+        Reloads the link graph if the stored topology changed. Checked at most every GRAPH_REFRESH_INTERVAL
+        seconds, unless the controller itself moved the topology version.
+        """
+        now = time.monotonic()
+        if self.version == topology_cache.version and now - self.checked < GRAPH_REFRESH_INTERVAL:
+            return
+        self.checked = now
+        with self.app.app_context():
+            version = topology_cache.refresh()
+            if version == self.version:
+                return
+            devices = db.session.query(Device.id, Device.device_type, Device.dpid, Device.mac_address).all()
+            links = db.session.query(Link.id, Link.source_device_id, Link.destination_device_id, Link.attributes).all()
+
+        adjacency = {}
+        capacities = {}
+        for link_id, source, destination, attributes in links:
+            adjacency.setdefault(source, []).append((destination, link_id))
+            adjacency.setdefault(destination, []).append((source, link_id))
+            capacities[link_id] = (source, destination, (attributes or {}).get('bandwidth_mbps') or self.default_capacity)
+
+        with self.lock:
+            self.links = capacities
+            self.adjacency = adjacency
+            self.hosts = {bytes.fromhex(mac.replace(':', '')): device_id for device_id, device_type, _, mac in devices if device_type == 'host' and mac}
+            self.switches = {dpid: device_id for device_id, _, dpid, _ in devices if dpid is not None}
+            self.next_hops = {}
+            self.states = {key: state for key, state in self.states.items() if key[0] in capacities}
+            self.version = version
+        logging.info(f"Link utilization graph loaded at topology version {version}: {len(links)} links.")
+
+    def hops_towards(self, host):
+        """
+        Returns, for every device, the link through which traffic from a host arrives, mapped by device ID.
+        Must be called with the lock held.
+        """
+        hops = self.next_hops.get(host)
+        if hops is None:
+            hops = {}
+            queue = deque([host])
+            seen = {host}
+            while queue:
+                device = queue.popleft()
+                for neighbour, link_id in self.adjacency.get(device, ()):
+                    if neighbour not in seen:
+                        seen.add(neighbour)
+                        hops[neighbour] = link_id
+                        queue.append(neighbour)
+            self.next_hops[host] = hops
+        return hops
+
+    def observe(self, dpid, deltas, elapsed):
+        """
+        Updates the links into a switch from the bytes it received from each MAC since its previous poll.
+
+        Args:
+            dpid: The switch the deltas come from.
+            deltas: Bytes received since the previous poll, mapped by raw source MAC address.
+            elapsed: Seconds since the previous poll.
+        """
+        if elapsed <= 0:
+            return
+        try:
+            self.refresh()
+        except Exception as e:
+            logging.error(f"Error loading the link graph: {e}")
+            return
+
+        now = time.time()
+        with self.lock:
+            switch = self.switches.get(dpid)
+            if switch is None:
+                return
+            totals = {link_id: 0 for _, link_id in self.adjacency.get(switch, ())}
+            for mac, delta in deltas.items():
+                host = self.hosts.get(mac)
+                link_id = self.hops_towards(host).get(switch) if host is not None else None
+                if link_id is None:
+                    self.unmapped += delta
+                else:
+                    totals[link_id] += delta
+
+            for link_id, total in totals.items():
+                source, destination, _ = self.links[link_id]
+                key = (link_id, 'forward' if destination == switch else 'reverse')
+                state = self.states.get(key)
+                if state is None:
+                    state = self.states[key] = LinkState()
+                state.rate = total / elapsed
+                if state.rate >= state.peak or now - state.peak_at > self.peak_window:
+                    state.peak, state.peak_at = state.rate, now
+
+    def serialise(self, link_id):
+        """
+        Returns the utilization of a link: bits per second in each direction, and the current and peak
+        utilization (of the busiest direction) as a fraction of the capacity, None if the capacity is unknown.
+        Must be called with the lock held.
+        """
+        _, _, capacity = self.links.get(link_id, (None, None, self.default_capacity))
+        forward = self.states.get((link_id, 'forward')) or LinkState()
+        reverse = self.states.get((link_id, 'reverse')) or LinkState()
+        rate = max(forward.rate, reverse.rate) * 8
+        peak = max(forward.peak, reverse.peak) * 8
+        return {
+            'capacity_mbps': capacity or None,
+            'forward_bps': round(forward.rate * 8),
+            'reverse_bps': round(reverse.rate * 8),
+            'utilization': round(rate / (capacity * 1e6), 4) if capacity else None,
+            'peak_bps': round(peak),
+            'peak_utilization': round(peak / (capacity * 1e6), 4) if capacity else None,
+        }
+
+    def snapshot(self):
+        """
+        Returns the utilization of every link, mapped by link ID.
+        """
+        with self.lock:
+            return {link_id: self.serialise(link_id) for link_id in self.links}
+
+    def status(self):
+        """
+        Returns the utilization of every link with its endpoints, the busiest first.
+        """
+        with self.lock:
+            links = [
+                dict(self.serialise(link_id), link_id=link_id, source_device_id=str(source), destination_device_id=str(destination))
+                for link_id, (source, destination, _) in self.links.items()
+            ]
+            unmapped = self.unmapped
+        links.sort(key=lambda link: max(link['forward_bps'], link['reverse_bps']), reverse=True)
+        return {'links': links, 'unmapped_bytes': unmapped}
@@ -0,0 +1,237 @@
+import logging
+import struct
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from core.packets import *
+
+from shared import db
+from shared.models import Device, EventLog
+from stages import FunctionStages
+from stream import broker
+
+# Name of the data plane function and map dropping blacklisted source MACs
+MITIGATION_FUNCTION = 'ddos_auto_mitigation'
+BLACKLIST_TABLE = 'blacklist'
+
+# Value stored in the blacklist map: smoothed rate in bytes per second and block time in epoch seconds
+BLACKLIST_VALUE = struct.Struct('<QQ')
+
+class MacState:
+    """
+    Rate tracking and mitigation state of a single source MAC.
+
+    Attributes:
+        rates: Smoothed rate in bytes per second as seen by each switch, mapped by DPID.
+        exceeded_at: Time the raw rate first went over the block threshold in the current episode.
+        blocked_at: Time the MAC was blocked, or None if it is not blocked.
+        blocked_on: DPIDs whose blacklist holds the MAC.
+        calm_since: Time the smoothed rate went under the release threshold while blocked.
+        unmitigated: True once it was reported that no switch on the MAC's path can block it.
+    """
+    def __init__(self):
+        self.rates = {}
+        self.exceeded_at = None
+        self.blocked_at = None
+        self.blocked_on = set()
+        self.calm_since = None
+        self.unmitigated = False
+
+    @property
+    def rate(self):
+        return max(self.rates.values(), default=0.0)
+
+class MitigationEngine:
+    """
+    Closed-loop DDoS mitigation driven by the per-MAC bandwidth computed from the monitor tables.
+
+    Every monitoring sample updates an EWMA of each source MAC's rate per switch. A MAC whose smoothed
+    rate goes over the block threshold is inserted in the blacklist map of every switch running
+    ddos_auto_mitigation that sees its traffic. It is deleted again once its rate stayed under the
+    (lower) release threshold for the cooldown period. Decisions are logged as events, and the time from
+    the first sample over the threshold to the switch confirming the block is reported.
+
+    Runs on the telemetry pool as part of the monitoring reply handling and never waits on replies.
+
+    Attributes:
+        controller: The running eBPFController.
+        block_rate: Smoothed rate in bytes per second at which a MAC is blocked.
+        release_rate: Smoothed rate in bytes per second under which a blocked MAC starts cooling down.
+        alpha: EWMA smoothing factor of new samples.
+        cooldown: Seconds a blocked MAC has to stay under the release rate before it is released.
+        stages: Stages of ddos_auto_mitigation, as the switches report them.
+        macs: MacState of each tracked source MAC.
+        decisions: Most recent decisions, newest last.
+    """
+    def __init__(self, app, controller):
+        self.app = app
+        self.controller = controller
+        self.enabled = app.config['DDOS_MITIGATION_ENABLED']
+        self.block_rate = app.config['DDOS_BLOCK_RATE']
+        self.release_rate = app.config['DDOS_RELEASE_RATE']
+        self.alpha = app.config['DDOS_EWMA_ALPHA']
+        self.cooldown = app.config['DDOS_COOLDOWN']
+        self.lock = threading.Lock()
+        self.stages = FunctionStages(MITIGATION_FUNCTION)
+        self.macs = {}
+        self.last_poll = {}
+        self.decisions = deque(maxlen=app.config['DDOS_DECISION_HISTORY'])
+
+    def observe(self, dpid, samples):
+        """
+        Feeds the bandwidth samples of one monitoring poll into the detector and acts on its decisions.
+
+        Args:
+            dpid: The switch the samples come from.
+            samples: Bytes seen since the previous poll, mapped by source MAC (hex string). MACs without
+                traffic are absent.
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        elapsed = now - self.last_poll.get(dpid, now - 1.0)
+        self.last_poll[dpid] = now
+        if elapsed <= 0:
+            return
+
+        to_block, to_release = [], []
+        with self.lock:
+            tracked = {mac for mac, state in self.macs.items() if dpid in state.rates}
+            for mac in tracked | set(samples):
+                raw = samples.get(mac, 0) / elapsed
+                state = self.macs.setdefault(mac, MacState())
+                previous = state.rates.get(dpid, raw)
+                state.rates[dpid] = self.alpha * raw + (1 - self.alpha) * previous
+
+                if raw >= self.block_rate and state.exceeded_at is None:
+                    state.exceeded_at = now
+                rate = state.rate
+
+                if state.blocked_at is None:
+                    if rate >= self.block_rate:
+                        to_block.append((mac, state, rate))
+                    elif raw < self.release_rate:
+                        state.exceeded_at = None
+                elif rate < self.release_rate:
+                    state.calm_since = state.calm_since or now
+                    if now - state.calm_since >= self.cooldown:
+                        to_release.append((mac, state, rate))
+                else:
+                    state.calm_since = None
+
+            # Forget quiet MACs that are not blocked
+            for mac in [mac for mac, state in self.macs.items() if state.blocked_at is None and state.rate < 1.0]:
+                del self.macs[mac]
+
+        if to_block or to_release:
+            stages = self.stages.copy()
+            for mac, state, rate in to_block:
+                self.block(mac, state, rate, stages, now)
+            for mac, state, rate in to_release:
+                self.release(mac, state, rate, stages, now)
+
+    def block(self, mac, state, rate, stages, now):
+        """
+        Inserts a MAC in the blacklist of the switches seeing its traffic.
+        """
+        targets = [dpid for dpid, switch_rate in state.rates.items() if switch_rate > 0 and dpid in stages and dpid in self.controller.connections]
+        if not targets:
+            if not state.unmitigated:
+                logging.warning(f"DDoS source {mac} detected at {rate:.0f} B/s but no switch on its path runs {MITIGATION_FUNCTION}.")
+                state.unmitigated = True
+            return
+
+        state.blocked_at = now
+        state.calm_since = None
+        value = BLACKLIST_VALUE.pack(int(rate), int(now))
+        for dpid in targets:
+            connection = self.controller.connections[dpid]
+            request = TableEntryInsertRequest(index=stages[dpid], table_name=BLACKLIST_TABLE, key=bytes.fromhex(mac), value=value)
+            future = self.controller.replies.send(connection, request, Header.TABLE_ENTRY_INSERT_REPLY)
+            future.add_done_callback(lambda future, dpid=dpid: self.confirmed(mac, dpid, future, state.exceeded_at or now))
+            state.blocked_on.add(dpid)
+
+        self.record('block', mac, rate, targets, f"Blocked DDoS source {mac} ({rate:.0f} B/s) on switches {targets}.", 'WARNING', now)
+
+    def release(self, mac, state, rate, stages, now):
+        """
+        Deletes a MAC from the blacklists it was inserted in.
+        """
+        targets = sorted(state.blocked_on)
+        for dpid in targets:
+            connection = self.controller.connections.get(dpid)
+            if connection is None or dpid not in stages:
+                continue
+            request = TableEntryDeleteRequest(index=stages[dpid], table_name=BLACKLIST_TABLE, key=bytes.fromhex(mac))
+            self.controller.replies.send(connection, request, Header.TABLE_ENTRY_DELETE_REPLY)
+
+        with self.lock:
+            self.macs.pop(mac, None)
+        self.record('release', mac, rate, targets, f"Released DDoS source {mac} after {now - state.blocked_at:.0f}s, rate back to {rate:.0f} B/s.", 'INFO', now)
+
+    def confirmed(self, mac, dpid, future, exceeded_at):
+        """
+        Reports the reaction time once a switch confirmed a block.
+        """
+        if future.cancelled() or future.exception():
+            logging.error(f"Blacklist insert of {mac} on switch {dpid} was not confirmed.")
+            return
+        if future.result().status != TableStatus.Value('SUCCESS'):
+            logging.error(f"Blacklist insert of {mac} on switch {dpid} failed with status {future.result().status}.")
+            return
+        reaction = time.time() - exceeded_at
+        logging.info(f"DDoS source {mac} dropped on switch {dpid}, {reaction * 1000:.0f} ms after the attack started.")
+        with self.lock:
+            for decision in reversed(self.decisions):
+                if decision['action'] == 'block' and decision['mac_address'] == mac:
+                    decision['reaction_ms'][str(dpid)] = round(reaction * 1000)
+                    break
+
+    def record(self, action, mac, rate, dpids, message, event_type, now):
+        """
+        Logs a decision, stores it as an event and keeps it in the recent decisions.
+        """
+        logging.info(message)
+        decision = {
+            'action': action,
+            'mac_address': mac,
+            'rate': round(rate),
+            'switches': dpids,
+            'timestamp': datetime.fromtimestamp(now, timezone.utc).isoformat(),
+            'reaction_ms': {},
+        }
+        with self.lock:
+            self.decisions.append(decision)
+        try:
+            device = Device.query.filter_by(dpid=dpids[0]).first() if dpids else None
+            event = EventLog(
+                timestamp=datetime.now(timezone.utc),
+                device_id=device.id if device else None,
+                message=message,
+                event_type=event_type,
+                data={key: decision[key] for key in ('action', 'mac_address', 'rate', 'switches')}
+            )
+            db.session.add(event)
+            db.session.commit()
+            broker.publish('events', self.controller.serialise_event(event))
+        except Exception as e:
+            logging.error(f"Error storing mitigation decision for {mac}: {e}")
+            db.session.rollback()
+
+    def status(self):
+        """
+        Returns the blocked MACs and the recent decisions.
+        """
+        with self.lock:
+            blocked = [
+                {
+                    'mac_address': mac,
+                    'rate': round(state.rate),
+                    'switches': sorted(state.blocked_on),
+                    'blocked_at': datetime.fromtimestamp(state.blocked_at, timezone.utc).isoformat(),
+                }
+                for mac, state in self.macs.items() if state.blocked_at is not None
+            ]
+            return {'blocked': blocked, 'decisions': list(self.decisions)}
@@ -0,0 +1,77 @@
+import logging
+import threading
+
+from stages import FunctionStages
+
+# Function whose table is polled for the per MAC byte counters
+MONITORING_FUNCTION = 'monitoring'
+MONITOR_TABLE = 'monitor'
+
+class MonitoringPoller:
+    """
+    Polls the monitor table of every switch running the monitoring function, once per interval.
+
+    A single thread, started with the controller, polls all the switches, so installing the monitoring
+    function again (e.g. by repeated rollouts) never adds polls. The stage of the function on each
+    switch is followed as the switches report it (see FunctionStages).
+
+    Attributes:
+        controller: The running eBPFController.
+        interval: Seconds between two polls of a switch.
+        stages: Stages of the monitoring function.
+    """
+    def __init__(self, app, controller):
+        self.controller = controller
+        self.interval = app.config['MONITORING_POLL_INTERVAL']
+        self.lock = threading.Lock()
+        self.stages = FunctionStages(MONITORING_FUNCTION)
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        """
+        Starts polling in a background daemon thread, unless already started.
+
+        Returns:
+            Reference to the instance for further use.
+        """
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.stopped.clear()
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+                logging.info("Started periodic monitoring requests.")
+        return self
+
+    def stop(self):
+        """
+        Stops polling.
+        """
+        self.stopped.set()
+
+    def run(self):
+        """
+        Polls the switches every interval until stopped.
+        """
+        while not self.stopped.wait(self.interval):
+            self.poll()
+
+    def poll(self):
+        """
+        Sends a monitor table request to every connected switch running the monitoring function.
+        """
+        for dpid, stage in self.stages.items():
+            connection = self.controller.connections.get(dpid)
+            if connection is None or dpid not in self.controller.connected_devices:
+                continue
+            try:
+                self.controller.request_table(connection, stage, MONITOR_TABLE)
+                logging.debug(f"Sent monitoring request to device {dpid}.")
+            except Exception as e:
+                logging.error(f"Error sending monitoring request to device {dpid}: {e}")
+
+    def status(self):
+        """
+        Returns the polled stage of each switch.
+        """
+        return {str(dpid): stage for dpid, stage in self.stages.items()}
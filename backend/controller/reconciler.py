@@ -0,0 +1,300 @@
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from core.packets import *
+
+from shared import db
+from shared.models import Device, DeviceFunction, FunctionPipeline
+from artifacts import ArtifactError
+from replies import combine, gather
+from rollout import list_pipelines
+from topology_cache import topology_cache
+
+def desired_pipelines(devices):
+    """
+    Resolves the desired function pipeline of each device.
+
+    A pipeline set for the device's DPID wins over the one set for its device type.
+
+    Args:
+        devices: The devices to resolve.
+
+    Returns:
+        Dictionary of DPID to the ordered list of function names, or None if no pipeline applies.
+    """
+    pipelines = FunctionPipeline.query.all()
+    by_dpid = {pipeline.dpid: pipeline.functions for pipeline in pipelines if pipeline.dpid is not None}
+    by_type = {pipeline.device_type: pipeline.functions for pipeline in pipelines if pipeline.dpid is None}
+    return {device.dpid: by_dpid.get(device.dpid, by_type.get(device.device_type)) for device in devices}
+
+def plan(actual, desired, same):
+    """
+    Computes the smallest list of operations turning the running pipeline of a switch into the desired one.
+
+    A FunctionAddRequest replaces the function at its stage and a FunctionRemoveRequest shifts the
+    following stages down, so the plan is an edit distance where stages can be kept, replaced or removed,
+    and new stages can only be appended at the end.
+
+    Args:
+        actual: Running stages in order.
+        desired: Desired function names in order.
+        same: Callable telling whether a running stage already runs a desired function.
+
+    Returns:
+        List of ("add", index, name) and ("remove", index) operations, to be applied in order.
+    """
+    n, m = len(actual), len(desired)
+    cost = [[0] * (m + 1) for _ in range(n + 1)]
+    for i in range(n, -1, -1):
+        for j in range(m, -1, -1):
+            if i == n:
+                cost[i][j] = m - j
+            elif j == m:
+                cost[i][j] = n - i
+            else:
+                cost[i][j] = 1 + min(cost[i + 1][j], cost[i + 1][j + 1])
+                if same(actual[i], desired[j]):
+                    cost[i][j] = min(cost[i][j], cost[i + 1][j + 1])
+
+    operations = []
+    i = j = position = 0
+    while i < n or j < m:
+        if i == n:
+            operations.append(('add', position, desired[j]))
+            j += 1
+            position += 1
+        elif j == m:
+            # Remove the trailing stages from the end so nothing has to shift
+            operations.extend(('remove', position + k) for k in range(n - i - 1, -1, -1))
+            break
+        elif cost[i][j] == 1 + cost[i + 1][j]:
+            operations.append(('remove', position))
+            i += 1
+        elif same(actual[i], desired[j]) and cost[i][j] == cost[i + 1][j + 1]:
+            i += 1
+            j += 1
+            position += 1
+        else:
+            operations.append(('add', position, desired[j]))
+            i += 1
+            j += 1
+            position += 1
+    return operations
+
+class Reconciler:
+    """
+    Brings the function pipeline of each switch in line with its desired state.
+
+    A switch is reconciled when it connects (HELLO) or when its desired pipeline changes. The running
+    pipeline is listed with a FunctionListRequest, the minimal add/remove plan is sent back to back,
+    and the DeviceFunction rows of all reconciled switches are rewritten in a single transaction.
+    Reconnect storms are absorbed by batching the switches scheduled within a short delay, and the
+    switches of a batch are reconciled in parallel with bounded concurrency.
+
+    Attributes:
+        app: Flask application instance for database context.
+        controller: The running eBPFController.
+        delay: Seconds to wait for more switches before reconciling a batch.
+        max_in_flight: Maximum number of switches waited on at the same time.
+        timeout: Seconds each switch may take to reply.
+        scheduled: DPIDs waiting to be reconciled.
+    """
+    def __init__(self, app, controller):
+        self.app = app
+        self.controller = controller
+        self.delay = app.config['RECONCILE_DELAY']
+        self.max_in_flight = app.config['ROLLOUT_MAX_IN_FLIGHT']
+        self.timeout = app.config['ROLLOUT_TIMEOUT']
+        self.lock = threading.Lock()
+        self.scheduled = set()
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+
+    def start(self):
+        """
+        Starts reconciling scheduled switches in a background daemon thread.
+
+        Returns:
+            Reference to the instance for further use.
+        """
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def stop(self):
+        """
+        Stops the background thread.
+        """
+        self.stopped.set()
+        self.wakeup.set()
+
+    def schedule(self, dpid):
+        """
+        Schedules a switch for reconciliation.
+        """
+        with self.lock:
+            self.scheduled.add(dpid)
+        self.wakeup.set()
+
+    def run(self):
+        """
+        Reconciles the scheduled switches in batches until stopped.
+        """
+        while not self.stopped.is_set():
+            self.wakeup.wait()
+            # Let the rest of a reconnect storm arrive
+            time.sleep(self.delay)
+            with self.lock:
+                self.wakeup.clear()
+                dpids, self.scheduled = self.scheduled, set()
+            if not dpids or self.stopped.is_set():
+                continue
+            with self.app.app_context():
+                try:
+                    self.reconcile(dpids)
+                except Exception as e:
+                    logging.error(f"Error reconciling function pipelines: {e}")
+                    db.session.rollback()
+
+    def reconcile(self, dpids):
+        """
+        Reconciles the function pipelines of the given switches.
+
+        Args:
+            dpids: DPIDs of the switches to reconcile.
+
+        Returns:
+            Dictionary of per-switch results mapped by DPID.
+        """
+        started = time.monotonic()
+        controller = self.controller
+        devices = {device.dpid: device for device in Device.query.filter(Device.dpid.in_(list(dpids))).all()}
+        desired = desired_pipelines(devices.values())
+        results = {}
+
+        connected = []
+        for dpid in dpids:
+            if dpid not in devices or not controller.connections.get(dpid):
+                results[dpid] = {'status': 'not_connected'}
+            else:
+                connected.append(dpid)
+
+        # List the running pipelines
+        plans = {}
+        final = {}
+        for dpid, (entries, error) in list_pipelines(controller, connected, self.max_in_flight, self.timeout).items():
+            if error:
+                results[dpid] = {'status': error}
+                continue
+            running = [(entry.name, controller.installed_artifacts.get((dpid, entry.index))) for entry in entries]
+            wanted = desired.get(dpid)
+            if wanted is None:
+                # No desired state, only bring the database in line with the switch
+                final[dpid] = [name for name, _ in running]
+                results[dpid] = {'status': 'unmanaged', 'operations': 0}
+                continue
+            try:
+                artifacts = {name: controller.app.artifact_store.get(name) for name in set(wanted)}
+            except ArtifactError as e:
+                results[dpid] = {'status': str(e)}
+                continue
+
+            def same(stage, name):
+                # Stages installed before the controller started have no known hash, trust their name
+                return stage[0] == name and stage[1] in (None, artifacts[name].digest)
+            plans[dpid] = (plan(running, wanted, same), artifacts)
+            final[dpid] = list(wanted)
+
+        # Apply the plans, each switch gets its operations back to back
+        operations = {}
+        for dpid, (steps, artifacts) in plans.items():
+            if not steps:
+                results[dpid] = {'status': 'in_sync', 'operations': 0}
+                continue
+
+            def send(dpid=dpid, steps=steps, artifacts=artifacts):
+                connection = controller.connections[dpid]
+                futures = []
+                for step in steps:
+                    if step[0] == 'add':
+                        _, index, name = step
+                        controller.pending_functions[(dpid, index)] = name
+                        controller.pending_artifacts[(dpid, index)] = artifacts[name].digest
+                        request = FunctionAddRequest(name=name, index=index, elf=artifacts[name].elf)
+                        futures.append(controller.replies.send(connection, request, Header.FUNCTION_ADD_REPLY, key=index))
+                    else:
+                        futures.append(controller.replies.send(connection, FunctionRemoveRequest(index=step[1]), Header.FUNCTION_REMOVE_REPLY, key=step[1]))
+                return combine(futures)
+            operations[dpid] = send
+
+        for dpid, (replies, error, elapsed) in gather(operations, self.max_in_flight, self.timeout).items():
+            failed = error or next((reply for reply in replies if reply.status != 0), None)
+            if failed:
+                # Leave the database untouched, the next reconciliation lists the switch again
+                final.pop(dpid, None)
+                results[dpid] = {'status': error or 'failed', 'operations': len(plans[dpid][0])}
+            else:
+                results[dpid] = {'status': 'reconciled', 'operations': len(plans[dpid][0]), 'elapsed_ms': round(elapsed * 1000, 1)}
+
+        # Rewrite the function rows of the switches whose pipeline is known
+        changed = []
+        for dpid, names in final.items():
+            device = devices[dpid]
+            if sorted((function.index, function.function_name) for function in device.functions) == list(enumerate(names)):
+                continue
+            for function in list(device.functions):
+                db.session.delete(function)
+            for index, name in enumerate(names):
+                db.session.add(DeviceFunction(device_id=device.id, function_name=name, index=index, status='installed'))
+            changed.append(device.id)
+        db.session.commit()
+        for device_id in changed:
+            topology_cache.bump(device_id)
+
+        logging.info(f"Reconciled {len(dpids)} switches in {time.monotonic() - started:.2f}s: "
+                     f"{sum(result.get('operations', 0) for result in results.values())} operations.")
+        return results
+
+def save_pipeline(data):
+    """
+    Creates or replaces the desired pipeline of a switch (by "dpid") or of a device group (by "device_type").
+
+    Args:
+        data: Dictionary with "functions" and either "dpid" or "device_type".
+
+    Returns:
+        The saved FunctionPipeline.
+
+    Raises:
+        ValueError: If the payload is invalid.
+    """
+    functions = data.get('functions')
+    dpid = data.get('dpid')
+    device_type = data.get('device_type')
+    if not isinstance(functions, list) or not all(isinstance(name, str) for name in functions):
+        raise ValueError('functions must be a list of function names.')
+    if (dpid is None) == (device_type is None):
+        raise ValueError('Exactly one of dpid or device_type must be provided.')
+
+    if dpid is not None:
+        pipeline = FunctionPipeline.query.filter_by(dpid=int(dpid)).first() or FunctionPipeline(dpid=int(dpid))
+    else:
+        pipeline = FunctionPipeline.query.filter_by(dpid=None, device_type=device_type).first() or FunctionPipeline(device_type=device_type)
+    pipeline.functions = functions
+    pipeline.updated_at = datetime.now(timezone.utc)
+    db.session.add(pipeline)
+    db.session.commit()
+    return pipeline
+
+def serialise_pipeline(pipeline):
+    """
+    Serialises a pipeline into a dictionary.
+    """
+    return {
+        'id': pipeline.id,
+        'dpid': pipeline.dpid,
+        'device_type': pipeline.device_type,
+        'functions': pipeline.functions,
+        'updated_at': pipeline.updated_at.isoformat(),
+    }
@@ -0,0 +1,208 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+
+from core import call_from_thread
+
+class ReplyTracker:
+    """
+    Matches replies from the switches to the requests waiting for them.
+
+    Requests are sent from Flask threads while replies are handled in the reactor thread, so each
+    request registers a Future before it is sent. Replies are matched per (dpid, reply type), on a key
+    when the reply carries one (e.g. the stage index of a function reply) and in send order otherwise,
+    since a switch answers the requests of a connection in order. This only holds if every request of
+    a reply type is registered, including those whose replies go to the regular handlers.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+
+    def expect(self, dpid, opcode, key=None, future=None, handlers=False):
+        """
+        Registers a request waiting for a reply. Must be called in the reactor thread right before the
+        request is sent, so requests are registered in the order they go out on the wire.
+
+        Args:
+            dpid: The switch the request is sent to.
+            opcode: Header type of the expected reply.
+            key: Value identifying the reply among the pending ones, or None to match in send order.
+            future: Future to register, a new one is created if not given.
+            handlers: Leave the reply to the regular handlers. The request is only registered to keep
+                the replies of the other requests matched in send order.
+
+        Returns:
+            The Future receiving the reply, or None if it is left to the regular handlers.
+        """
+        future = None if handlers else future or Future()
+        with self.lock:
+            self.pending.setdefault((dpid, opcode), deque()).append((key, future))
+        return future
+
+    def send(self, connection, request, opcode, key=None, handlers=False):
+        """
+        Registers a request and sends it from the reactor thread. Safe to call from any thread.
+
+        Args:
+            connection: The switch connection.
+            request: The request message.
+            opcode: Header type of the expected reply.
+            key: Value identifying the reply, see expect.
+            handlers: Leave the reply to the regular handlers, see expect.
+
+        Returns:
+            The Future receiving the reply, or None if it is left to the regular handlers.
+        """
+        future = None if handlers else Future()
+
+        def send():
+            self.expect(connection.dpid, opcode, key, future, handlers)
+            connection.send(request)
+        call_from_thread(send)
+        return future
+
+    def resolve(self, dpid, opcode, pkt, key=None):
+        """
+        Hands a reply to the oldest request waiting for it.
+
+        The switch answers in order, so the oldest matching request owns the reply even if it already
+        gave up waiting (timed out); the reply is then left to the regular handlers. A reply without a
+        key (e.g. an error status, which carries no table entry) only goes to the oldest request, and
+        only if that request does not expect a key.
+
+        Args:
+            dpid: The switch the reply comes from.
+            opcode: Header type of the reply.
+            pkt: The reply message.
+            key: Key carried by the reply, or None.
+
+        Returns:
+            True if a waiting request took the reply, False if it is left to the regular handlers.
+        """
+        with self.lock:
+            waiting = self.pending.get((dpid, opcode))
+            if not waiting:
+                return False
+            if key is None:
+                entry = waiting[0]
+                if entry[0] is not None:
+                    return False
+            else:
+                for entry in waiting:
+                    if entry[0] is None or entry[0] == key:
+                        break
+                else:
+                    return False
+            waiting.remove(entry)
+            if not waiting:
+                del self.pending[(dpid, opcode)]
+        future = entry[1]
+        if future is None or not future.set_running_or_notify_cancel():
+            return False
+        future.set_result(pkt)
+        return True
+
+    def fail(self, dpid, reason):
+        """
+        Fails every request waiting on a switch, e.g. when its connection is lost.
+        """
+        with self.lock:
+            entries = [entry for (device, _), waiting in self.pending.items() if device == dpid for entry in waiting]
+            self.pending = {stage: waiting for stage, waiting in self.pending.items() if stage[0] != dpid}
+        for _, future in entries:
+            if future is not None and future.set_running_or_notify_cancel():
+                future.set_exception(ConnectionError(reason))
+
+def combine(futures):
+    """
+    Combines the Futures of requests sent back to back into one Future.
+
+    The combined Future receives the list of replies once all of them are in, or the first error.
+    Cancelling it (e.g. on timeout) cancels the requests still waiting.
+    """
+    combined = Future()
+    if not futures:
+        combined.set_running_or_notify_cancel()
+        combined.set_result([])
+        return combined
+
+    lock = threading.Lock()
+    remaining = [len(futures)]
+
+    def child_done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        if not combined.set_running_or_notify_cancel():
+            return
+        for future in futures:
+            if future.cancelled():
+                combined.set_exception(ConnectionError('request cancelled'))
+                return
+            if future.exception():
+                combined.set_exception(future.exception())
+                return
+        combined.set_result([future.result() for future in futures])
+
+    def combined_done(future):
+        if future.cancelled():
+            for child in futures:
+                child.cancel()
+
+    combined.add_done_callback(combined_done)
+    for future in futures:
+        future.add_done_callback(child_done)
+    return combined
+
+def gather(operations, max_in_flight, timeout):
+    """
+    Runs request/reply operations with bounded concurrency.
+
+    Args:
+        operations: Dictionary of name to a callable sending a request and returning the Future of its reply.
+        max_in_flight: Maximum number of requests waiting for a reply at the same time.
+        timeout: Seconds each request may wait for its reply.
+
+    Returns:
+        Dictionary of name to (reply or None, error message or None, elapsed seconds).
+    """
+    results = {}
+    queue = deque(operations.items())
+    in_flight = {}
+
+    def collect(future):
+        name, started = in_flight.pop(future)
+        elapsed = time.monotonic() - started
+        if future.cancelled():
+            results[name] = (None, 'timeout', elapsed)
+        elif future.exception():
+            results[name] = (None, str(future.exception()), elapsed)
+        else:
+            results[name] = (future.result(), None, elapsed)
+
+    while queue or in_flight:
+        while queue and len(in_flight) < max_in_flight:
+            name, operation = queue.popleft()
+            started = time.monotonic()
+            try:
+                in_flight[operation()] = (name, started)
+            except Exception as e:
+                logging.error(f"Error sending request {name}: {e}")
+                results[name] = (None, str(e), time.monotonic() - started)
+
+        if not in_flight:
+            continue
+        deadline = min(started for _, started in in_flight.values()) + timeout
+        done, _ = wait(list(in_flight), timeout=max(deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+        for future in done:
+            collect(future)
+
+        # Give up on requests past their deadline, replies arriving later go to the regular handlers
+        now = time.monotonic()
+        for future, (_, started) in list(in_flight.items()):
+            if now - started >= timeout and future.cancel():
+                collect(future)
+    return results
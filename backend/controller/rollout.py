@@ -0,0 +1,220 @@
+import fnmatch
+import logging
+import time
+
+from core import call_from_thread
+from core.packets import *
+
+from shared import db
+from shared.models import Device, DeviceFunction
+from replies import gather
+from topology_cache import topology_cache
+
+def select_devices(selector):
+    """
+    Selects the devices targeted by a bulk operation.
+
+    Args:
+        selector: Dictionary with any of "dpids" (list of DPIDs), "device_type" and "name" (glob pattern,
+            e.g. "s*"). An empty selector matches every device with a DPID.
+
+    Returns:
+        List of the matching devices, ordered by DPID.
+    """
+    query = Device.query.filter(Device.dpid.isnot(None))
+    if selector.get('dpids'):
+        query = query.filter(Device.dpid.in_([int(dpid) for dpid in selector['dpids']]))
+    if selector.get('device_type'):
+        query = query.filter(Device.device_type == selector['device_type'])
+    devices = query.order_by(Device.dpid).all()
+    if selector.get('name'):
+        devices = [device for device in devices if fnmatch.fnmatch(device.name or '', selector['name'])]
+    return devices
+
+def stage_result(status, index=None, elapsed=None):
+    """
+    Builds the result entry of a single switch.
+    """
+    result = {'status': status}
+    if index is not None:
+        result['index'] = index
+    if elapsed is not None:
+        result['elapsed_ms'] = round(elapsed * 1000, 1)
+    return result
+
+def list_pipelines(controller, dpids, max_in_flight, timeout):
+    """
+    Lists the running pipeline of connected switches with FunctionListRequests.
+
+    Stage state restored from a snapshot, the poller's monitoring stage and the learning switch's stage
+    are checked against each listing on the way.
+
+    Args:
+        controller: The running eBPFController.
+        dpids: DPIDs of the switches to list, all connected.
+        max_in_flight: Maximum number of switches waited on at the same time.
+        timeout: Seconds each switch may take to reply.
+
+    Returns:
+        Dictionary of (running stages ordered by index or None, error or None) mapped by DPID.
+    """
+    listings = {
+        dpid: lambda connection=controller.connections[dpid]: controller.replies.send(connection, FunctionListRequest(), Header.FUNCTION_LIST_REPLY)
+        for dpid in dpids
+    }
+    pipelines = {}
+    for dpid, (reply, error, _) in gather(listings, max_in_flight, timeout).items():
+        if error:
+            pipelines[dpid] = (None, error)
+            continue
+        entries = sorted(reply.entries, key=lambda entry: entry.index)
+        controller.verify_restored_functions(dpid, entries)
+        for stages in controller.function_stages:
+            stages.stages_listed(dpid, entries)
+        # The learning switch state is only touched in the reactor thread
+        call_from_thread(controller.learning.stages_listed, dpid, entries)
+        pipelines[dpid] = (entries, None)
+    return pipelines
+
+def bulk_install(controller, artifact, devices, max_in_flight, timeout):
+    """
+    Installs a function on many switches at once and waits for their replies.
+
+    The running pipeline of each switch is listed first, and the function gets the stage after the
+    last running one, unless an install still waiting for its reply already reserved it (see
+    eBPFController.reserve_stage). Switches already running the same object (by content hash) are
+    skipped. The DeviceFunction rows of all successful installs are written in a single transaction
+    once the replies are in.
+
+    Args:
+        controller: The running eBPFController.
+        artifact: The Artifact of the function to install.
+        devices: Devices to install the function on.
+        max_in_flight: Maximum number of switches waited on at the same time.
+        timeout: Seconds each switch may take to reply.
+
+    Returns:
+        Dictionary of per-switch results mapped by DPID.
+    """
+    results = {}
+    connected = {}
+    for device in devices:
+        if controller.connections.get(device.dpid):
+            connected[device.dpid] = device
+        else:
+            results[device.dpid] = stage_result('not_connected')
+
+    operations = {}
+    targets = {}
+    for dpid, (entries, error) in list_pipelines(controller, connected, max_in_flight, timeout).items():
+        if error:
+            results[dpid] = stage_result(error)
+            continue
+        current = [entry.index for entry in entries if entry.name == artifact.name
+                   and controller.installed_artifacts.get((dpid, entry.index)) == artifact.digest]
+        if current:
+            results[dpid] = stage_result('already_installed', current[0])
+            continue
+
+        index = controller.reserve_stage(dpid, entries, artifact.name, artifact.digest)
+        targets[dpid] = (connected[dpid], index)
+
+        def send(connection=controller.connections[dpid], index=index):
+            request = FunctionAddRequest(name=artifact.name, index=index, elf=artifact.elf)
+            return controller.replies.send(connection, request, Header.FUNCTION_ADD_REPLY, key=index)
+        operations[dpid] = send
+
+    for dpid, (reply, error, elapsed) in gather(operations, max_in_flight, timeout).items():
+        device, index = targets[dpid]
+        if error:
+            results[dpid] = stage_result(error, index, elapsed)
+        elif reply.status != FunctionAddReply.FunctionAddStatus.OK:
+            results[dpid] = stage_result(FunctionAddReply.FunctionAddStatus.Name(reply.status).lower(), index, elapsed)
+        else:
+            # The function replaces whatever the database still recorded at that stage
+            for function in device.functions:
+                if function.index == reply.index:
+                    db.session.delete(function)
+            db.session.add(DeviceFunction(device_id=device.id, function_name=artifact.name, index=reply.index, status='installed'))
+            results[dpid] = stage_result('installed', reply.index, elapsed)
+
+    installed = [targets[dpid][0].id for dpid, result in results.items() if result['status'] == 'installed']
+    if installed:
+        db.session.commit()
+        for device_id in installed:
+            topology_cache.bump(device_id)
+    logging.info(f"Bulk install of {artifact.name}: {len(installed)} of {len(devices)} switches installed.")
+    return results
+
+def bulk_remove(controller, function_name, devices, max_in_flight, timeout):
+    """
+    Removes a function from many switches at once and waits for their replies.
+
+    The function is removed from the lowest stage running it on each switch. The DeviceFunction rows
+    of all successful removals (and the index shift of the following stages) are written in a single
+    transaction once the replies are in.
+
+    Args:
+        controller: The running eBPFController.
+        function_name: Name of the function to remove.
+        devices: Devices to remove the function from.
+        max_in_flight: Maximum number of removals waiting for a reply at the same time.
+        timeout: Seconds each switch may take to reply.
+
+    Returns:
+        Dictionary of per-switch results mapped by DPID.
+    """
+    results = {}
+    operations = {}
+    targets = {}
+    for device in devices:
+        dpid = device.dpid
+        connection = controller.connections.get(dpid)
+        if not connection:
+            results[dpid] = stage_result('not_connected')
+            continue
+        functions = sorted((function for function in device.functions if function.function_name == function_name), key=lambda function: function.index)
+        if not functions:
+            results[dpid] = stage_result('not_installed')
+            continue
+
+        index = functions[0].index
+        targets[dpid] = (device, index)
+
+        def send(connection=connection, index=index):
+            request = FunctionRemoveRequest(index=index)
+            return controller.replies.send(connection, request, Header.FUNCTION_REMOVE_REPLY, key=index)
+        operations[dpid] = send
+
+    for dpid, (reply, error, elapsed) in gather(operations, max_in_flight, timeout).items():
+        device, index = targets[dpid]
+        if error:
+            results[dpid] = stage_result(error, index, elapsed)
+        elif reply.status != FunctionRemoveReply.FunctionRemoveStatus.OK:
+            results[dpid] = stage_result(FunctionRemoveReply.FunctionRemoveStatus.Name(reply.status).lower(), index, elapsed)
+        else:
+            for function in device.functions:
+                if function.index == index:
+                    db.session.delete(function)
+                elif function.index > index:
+                    function.index -= 1
+            results[dpid] = stage_result('removed', index, elapsed)
+
+    removed = [targets[dpid][0].id for dpid, result in results.items() if result['status'] == 'removed']
+    if removed:
+        db.session.commit()
+        for device_id in removed:
+            topology_cache.bump(device_id)
+    logging.info(f"Bulk removal of {function_name}: {len(removed)} of {len(devices)} switches removed.")
+    return results
+
+def timed(operation, *args):
+    """
+    Runs a bulk operation and returns its results with the total time taken.
+    """
+    started = time.monotonic()
+    results = operation(*args)
+    return {
+        'results': {str(dpid): result for dpid, result in results.items()},
+        'elapsed_ms': round((time.monotonic() - started) * 1000, 1),
+    }
@@ -0,0 +1,329 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from threading import Event, Thread
+
+from sqlalchemy import delete, func, literal, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.dialects.postgresql import insert
+
+from shared import db
+from shared.partitions import drop_expired_partitions, ensure_partitions, is_partitioned
+from shared.models import MonitoringData, AssetDiscovery, MonitoringRollup, AssetDiscoveryRollup, RollupState
+
+# Rollup resolutions in seconds (1 minute and 1 hour)
+RESOLUTIONS = (60, 3600)
+
+# Aggregates that can be answered from rollups
+ROLLUP_AGGREGATES = ('avg', 'max', 'sum')
+
+class RollupSource:
+    """
+    Describes how a raw telemetry table is rolled up.
+
+    Attributes:
+        name: Name of the raw table, used as key in the rollup state.
+        model: Model of the raw table.
+        rollup: Model of the rollup table.
+        keys: Names of the columns identifying a series (shared by both tables).
+        values: Dictionary of rollup column name to (merge function, aggregate builder over the raw model).
+    """
+    def __init__(self, model, rollup, keys, values):
+        self.name = model.__tablename__
+        self.model = model
+        self.rollup = rollup
+        self.keys = keys
+        self.values = values
+
+MONITORING = RollupSource(MonitoringData, MonitoringRollup, ('device_id', 'mac_address'), {
+    'samples': ('sum', lambda model: func.count()),
+    'bandwidth_sum': ('sum', lambda model: func.sum(model.bandwidth)),
+    'bandwidth_max': ('max', lambda model: func.max(model.bandwidth)),
+})
+
+ASSET_DISCOVERY = RollupSource(AssetDiscovery, AssetDiscoveryRollup, ('switch_id', 'mac_address'), {
+    'samples': ('sum', lambda model: func.count()),
+    'bytes_sum': ('sum', lambda model: func.sum(model.bytes)),
+    'bytes_max': ('max', lambda model: func.max(model.bytes)),
+    'packets_sum': ('sum', lambda model: func.sum(model.packets)),
+    'packets_max': ('max', lambda model: func.max(model.packets)),
+})
+
+SOURCES = {source.name: source for source in (MONITORING, ASSET_DISCOVERY)}
+
+def utcnow():
+    """
+    Returns the current time as a naive UTC datetime, matching the stored timestamps.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def retention_periods(config):
+    """
+    Returns the retention period per resolution (None for raw rows) from the application configuration.
+    """
+    return {
+        None: timedelta(days=config['RETENTION_RAW_DAYS']),
+        60: timedelta(days=config['RETENTION_1M_DAYS']),
+        3600: timedelta(days=config['RETENTION_1H_DAYS']),
+    }
+
+def raw_expired(start, config):
+    """
+    Returns True if the raw rows at the start of a query range have expired.
+    """
+    return start is not None and start < utcnow() - retention_periods(config)[None]
+
+def choose_resolution(source_name, bucket_seconds, agg, start, end, config):
+    """
+    Picks the coarsest rollup resolution that can answer a bucketed query.
+
+    Rollups are used when the aggregate can be computed from them, the bucket size is a multiple of the
+    resolution, and either the query range is already fully rolled up or the raw rows for its start have expired.
+    In the latter case the range may reach past the high-water mark: the buckets from the one holding it
+    on are then not fully rolled up, and are answered from the raw rows (the raw tail) instead.
+
+    Args:
+        source_name: Name of the raw table.
+        bucket_seconds: Requested bucket size in seconds.
+        agg: Requested aggregate.
+        start: Start of the query range, or None.
+        end: End of the query range, or None.
+        config: The application configuration.
+
+    Returns:
+        Tuple of (resolution in seconds, or None if the query has to be answered from raw rows only;
+        start of the raw tail, or None if the rollups cover the whole range).
+    """
+    if agg not in ROLLUP_AGGREGATES:
+        return None, None
+    state = db.session.get(RollupState, source_name)
+    if state is None or state.high_water_timestamp is None:
+        return None, None
+
+    now = utcnow()
+    retention = retention_periods(config)
+    rolled_up = end is not None and end <= state.high_water_timestamp
+    if not (raw_expired(start, config) or rolled_up):
+        return None, None
+
+    for resolution in sorted(RESOLUTIONS, reverse=True):
+        if bucket_seconds % resolution:
+            continue
+        if start is not None and start < now - retention[resolution]:
+            continue
+        if rolled_up:
+            return resolution, None
+        # Start of the requested bucket holding the high-water mark, so no bucket mixes both sources
+        high_water = state.high_water_timestamp.replace(tzinfo=timezone.utc).timestamp()
+        tail = datetime.fromtimestamp(high_water // bucket_seconds * bucket_seconds, timezone.utc).replace(tzinfo=None)
+        return resolution, tail
+    return None, None
+
+class RollupEngine:
+    """
+    Background engine keeping the 1 minute and 1 hour rollup tables up to date and applying retention.
+
+    Each pass rolls up the raw rows added since the high-water mark stored in the rollup_state table,
+    then deletes expired raw and rollup rows in bounded batches. Raw rows are only deleted once they
+    have been rolled up.
+
+    The telemetry workers insert concurrently, so IDs are not committed in order: a row may become
+    visible after rows with higher IDs. The high-water mark therefore never moves past the committed
+    bound of the table (see committed_bound), below which no insert is still in flight.
+
+    Raw tables that are partitioned by day (see shared/partitions.py) get their future partitions
+    created ahead of time, and expired partitions are dropped as a whole instead of deleting rows.
+
+    Attributes:
+        app: Flask application instance for database context.
+        interval: Seconds between two passes.
+        batch_size: Maximum number of raw row IDs rolled up in one transaction.
+        delete_batch: Maximum number of rows deleted in one transaction.
+        lock_timeout: Seconds to wait for the in-flight inserts when computing the committed bound.
+        retention: Retention period per resolution (None for raw rows).
+        days_ahead: Number of future daily partitions kept ready for partitioned raw tables.
+        detach_only: Detach expired partitions instead of dropping them.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config['ROLLUP_INTERVAL']
+        self.batch_size = app.config['ROLLUP_BATCH_SIZE']
+        self.delete_batch = app.config['RETENTION_DELETE_BATCH']
+        self.lock_timeout = app.config['ROLLUP_LOCK_TIMEOUT']
+        self.retention = retention_periods(app.config)
+        self.days_ahead = app.config['TELEMETRY_PARTITION_DAYS_AHEAD']
+        self.detach_only = app.config['TELEMETRY_PARTITION_DETACH_ONLY']
+        self.stopped = Event()
+
+    def start(self):
+        """
+        Starts the engine in a background daemon thread.
+
+        Returns:
+            Reference to the instance for further use.
+        """
+        Thread(target=self.run, daemon=True).start()
+        logging.info("Started telemetry rollup engine.")
+        return self
+
+    def stop(self):
+        """
+        Stops the engine after the current pass.
+        """
+        self.stopped.set()
+
+    def run(self):
+        """
+        Runs rollup and retention passes until stopped.
+        """
+        while not self.stopped.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    self.run_once()
+                except Exception as e:
+                    logging.error(f"Error in telemetry rollup pass: {e}")
+                    db.session.rollback()
+
+    def run_once(self):
+        """
+        Runs a single rollup and retention pass over all sources.
+        """
+        for source in SOURCES.values():
+            if is_partitioned(source.name):
+                ensure_partitions(source.name, self.days_ahead)
+
+            # Catch up in bounded transactions
+            bound = self.committed_bound(source)
+            if bound is not None:
+                while self.roll_up(source, bound) >= self.batch_size:
+                    pass
+            self.apply_retention(source)
+
+    def committed_bound(self, source):
+        """
+        Returns the highest raw row ID such that every row with a lower or equal ID is committed (or
+        rolled back), so no row can appear below it later.
+
+        Inserts hold a ROW EXCLUSIVE lock on the table until they commit and take their IDs while holding
+        it. Acquiring a SHARE lock waits for the inserts in flight to end, after which every ID handed
+        out is final. The lock is only held to read the highest ID and released right away; new inserts
+        wait at most lock_timeout for it.
+
+        Args:
+            source: The RollupSource of the raw table.
+
+        Returns:
+            The committed bound, or None if the in-flight inserts did not end within lock_timeout.
+        """
+        try:
+            db.session.execute(text(f"SET LOCAL lock_timeout = {int(self.lock_timeout * 1000)}"))
+            db.session.execute(text(f"LOCK TABLE {source.name} IN SHARE MODE"))
+            bound = db.session.query(func.max(source.model.id)).scalar() or 0
+            db.session.commit()
+            return bound
+        except OperationalError as e:
+            db.session.rollback()
+            logging.warning(f"Rollup of {source.name} postponed, inserts still in flight: {e}")
+            return None
+
+    def roll_up(self, source, bound):
+        """
+        Rolls up the raw rows added since the high-water mark of a source, for every resolution.
+
+        Args:
+            source: The RollupSource to roll up.
+            bound: Committed bound of the raw table, rows above it are left for a later pass.
+
+        Returns:
+            The number of raw row IDs covered by this step.
+        """
+        model = source.model
+        state = db.session.get(RollupState, source.name)
+        if state is None:
+            state = RollupState(source=source.name, high_water_id=0)
+            db.session.add(state)
+
+        low = state.high_water_id
+        first = db.session.query(func.min(model.id)).filter(model.id > low, model.id <= bound).scalar()
+        if first is None:
+            # The raw table was truncated and its IDs restarted (e.g. when the simulation is reset)
+            if low and (db.session.query(func.max(model.id)).scalar() or 0) < low:
+                logging.info(f"Raw table {source.name} was reset, restarting its rollup high-water mark.")
+                state.high_water_id = 0
+            db.session.commit()
+            return 0
+
+        # Skip over gaps in the IDs so a large gap never stalls the rollups
+        high, newest = db.session.query(func.max(model.id), func.max(model.timestamp)).filter(
+            model.id > low, model.id < first + self.batch_size, model.id <= bound
+        ).one()
+
+        rollup_table = source.rollup.__table__
+        for resolution in RESOLUTIONS:
+            bucket = func.timezone('UTC', func.to_timestamp(func.floor(func.extract('epoch', model.timestamp) / resolution) * resolution))
+            keys = [getattr(model, key) for key in source.keys]
+            rows = select(
+                literal(resolution),
+                bucket,
+                *keys,
+                *[aggregate(model) for _, aggregate in source.values.values()]
+            ).where(model.id > low, model.id <= high).group_by(bucket, *keys)
+
+            stmt = insert(rollup_table).from_select(['resolution', 'bucket', *source.keys, *source.values], rows)
+            merged = {}
+            for name, (merge, _) in source.values.items():
+                if merge == 'max':
+                    merged[name] = func.greatest(rollup_table.c[name], stmt.excluded[name])
+                else:
+                    merged[name] = rollup_table.c[name] + stmt.excluded[name]
+            db.session.execute(stmt.on_conflict_do_update(index_elements=['resolution', *source.keys, 'bucket'], set_=merged))
+
+        state.high_water_id = high
+        if state.high_water_timestamp is None or newest > state.high_water_timestamp:
+            state.high_water_timestamp = newest
+        db.session.commit()
+        logging.debug(f"Rolled up {source.name} rows {first} to {high}.")
+        return high - first + 1
+
+    def delete_expired(self, model, column, cutoff, *filters):
+        """
+        Deletes rows older than the cutoff in bounded batches, committing after each batch.
+
+        Args:
+            model: The model to delete from.
+            column: The timestamp column compared with the cutoff.
+            cutoff: Rows older than this are deleted.
+            filters: Extra conditions restricting the rows that may be deleted.
+
+        Returns:
+            The number of deleted rows.
+        """
+        deleted = 0
+        while True:
+            expired = select(model.id).where(column < cutoff, *filters).limit(self.delete_batch)
+            result = db.session.execute(delete(model).where(model.id.in_(expired)), execution_options={'synchronize_session': False})
+            db.session.commit()
+            deleted += result.rowcount
+            if result.rowcount < self.delete_batch or self.stopped.is_set():
+                return deleted
+
+    def apply_retention(self, source):
+        """
+        Deletes expired raw rows (only those already rolled up) and expired rollup rows of a source.
+        """
+        now = utcnow()
+        state = db.session.get(RollupState, source.name)
+        if state is not None and is_partitioned(source.name):
+            # Whole partitions are dropped once they are expired and rolled up
+            if state.high_water_timestamp is not None:
+                cutoff = min(now - self.retention[None], state.high_water_timestamp)
+                drop_expired_partitions(source.name, cutoff, detach_only=self.detach_only)
+        elif state is not None:
+            deleted = self.delete_expired(source.model, source.model.timestamp, now - self.retention[None], source.model.id <= state.high_water_id)
+            if deleted:
+                logging.info(f"Deleted {deleted} expired rows from {source.name}.")
+
+        for resolution in RESOLUTIONS:
+            rollup = source.rollup
+            deleted = self.delete_expired(rollup, rollup.bucket, now - self.retention[resolution], rollup.resolution == resolution)
+            if deleted:
+                logging.info(f"Deleted {deleted} expired {resolution}s rollups of {source.name}.")
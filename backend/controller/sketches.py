@@ -0,0 +1,340 @@
+import logging
+import math
+import struct
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.dialects.postgresql import insert
+
+from shared import db
+from shared.models import BandwidthSketch
+
+# Series holding the total bandwidth of a switch per poll
+SWITCH_SERIES = '*'
+
+# Relative accuracy, zero count, count, sum, min, max and number of bins
+SKETCH_HEADER = struct.Struct('<dQQdddI')
+
+def bucket_start(timestamp, seconds):
+    """
+    Returns the start of the bucket of the given size containing a naive UTC timestamp.
+    """
+    epoch = int(timestamp.replace(tzinfo=timezone.utc).timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, timezone.utc).replace(tzinfo=None)
+
+def write_varint(out, value):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(data, offset):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+class DDSketch:
+    """
+    Mergeable quantile sketch with relative accuracy guarantees (DDSketch).
+
+    Positive values are counted in logarithmic bins: bin k holds the values in (gamma^(k-1), gamma^k]
+    with gamma = (1 + a) / (1 - a), so any quantile is returned within a relative error a of the true
+    value. Two sketches with the same accuracy merge by adding their bins, which makes sketches of
+    different switches and time buckets combinable without the raw samples. When more than max_bins
+    bins are used, the lowest ones are collapsed, only losing accuracy on the lowest quantiles.
+
+    Attributes:
+        relative_accuracy: Relative error bound of the quantiles.
+        bins: Count of each bin, mapped by bin index.
+        zero_count: Number of values equal to zero.
+        count: Number of values added.
+    """
+    def __init__(self, relative_accuracy=0.01, max_bins=2048):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_bins = max_bins
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value, count=1):
+        """
+        Adds a non-negative value count times.
+        """
+        if value <= 0:
+            self.zero_count += count
+        else:
+            index = math.ceil(math.log(value) / self.log_gamma)
+            self.bins[index] = self.bins.get(index, 0) + count
+            if len(self.bins) > self.max_bins:
+                self.collapse()
+        self.count += count
+        self.sum += value * count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def collapse(self):
+        """
+        Folds the lowest bins into one until at most max_bins are used.
+        """
+        indexes = sorted(self.bins)
+        excess = len(indexes) - self.max_bins
+        if excess <= 0:
+            return
+        folded = sum(self.bins.pop(index) for index in indexes[:excess])
+        self.bins[indexes[excess]] += folded
+
+    def merge(self, other):
+        """
+        Adds the values of another sketch to this one.
+
+        Raises:
+            ValueError: If the sketches do not have the same accuracy.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError(f"Cannot merge sketches with accuracies {self.relative_accuracy} and {other.relative_accuracy}")
+        if not other.count:
+            return self
+        bins = self.bins
+        for index, count in other.bins.items():
+            bins[index] = bins.get(index, 0) + count
+        if len(bins) > self.max_bins:
+            self.collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        """
+        Returns the value at quantile q (0 <= q <= 1), or None if the sketch is empty.
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0
+        seen = self.zero_count
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                # Middle of the bin, within the relative accuracy of every value in it
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def to_bytes(self):
+        """
+        Serialises the sketch: a fixed header followed by the bins as varints, each bin index as the
+        zigzag encoded difference with the previous one.
+        """
+        out = bytearray(SKETCH_HEADER.pack(self.relative_accuracy, self.zero_count, self.count, self.sum,
+                                           self.min if self.count else 0.0, self.max if self.count else 0.0, len(self.bins)))
+        previous = 0
+        for index in sorted(self.bins):
+            delta = index - previous
+            write_varint(out, (delta << 1) ^ (delta >> 63))
+            write_varint(out, self.bins[index])
+            previous = index
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data, max_bins=2048):
+        """
+        Deserialises a sketch written by to_bytes.
+        """
+        relative_accuracy, zero_count, count, total, low, high, n_bins = SKETCH_HEADER.unpack_from(data)
+        sketch = cls(relative_accuracy, max_bins)
+        offset = SKETCH_HEADER.size
+        index = 0
+        for _ in range(n_bins):
+            delta, offset = read_varint(data, offset)
+            bin_count, offset = read_varint(data, offset)
+            index += (delta >> 1) ^ -(delta & 1)
+            sketch.bins[index] = bin_count
+        sketch.zero_count = zero_count
+        sketch.count = count
+        sketch.sum = total
+        if count:
+            sketch.min, sketch.max = low, high
+        return sketch
+
+class BandwidthSketches:
+    """
+    Bandwidth quantile sketches of every MAC and switch, per time bucket.
+
+    Each bandwidth sample stored by monitoring_list is also added to the sketch of its (switch, MAC)
+    series for the current bucket, and the total of each poll to the switch's series. Sketches of
+    closed buckets are written to the bandwidth_sketches table by a background thread, serialised in
+    a few hundred bytes, and expired after the retention period. Quantiles over any device, MAC and
+    time range are answered by merging the stored sketches with the open ones, without reading
+    monitoring_data.
+
+    Attributes:
+        app: Flask application instance for database context.
+        bucket: Seconds covered by each sketch.
+        relative_accuracy: Relative error bound of the quantiles.
+        retention: Period sketches are kept.
+        open: Sketches of the buckets not written yet, mapped by (bucket start, dpid, MAC).
+    """
+    def __init__(self, app):
+        self.app = app
+        self.bucket = app.config['SKETCH_BUCKET_SECONDS']
+        self.relative_accuracy = app.config['SKETCH_RELATIVE_ACCURACY']
+        self.retention = timedelta(days=app.config['SKETCH_RETENTION_DAYS'])
+        self.lock = threading.Lock()
+        self.open = {}
+        self.stopped = threading.Event()
+
+    def start(self):
+        """
+        Starts writing the closed buckets in a background daemon thread.
+
+        Returns:
+            Reference to the instance for further use.
+        """
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def stop(self):
+        """
+        Stops the writer and writes the open buckets.
+        """
+        self.stopped.set()
+        self.flush(everything=True)
+
+    def run(self):
+        """
+        Writes the closed buckets once per bucket until stopped.
+        """
+        while not self.stopped.wait(min(self.bucket, 60)):
+            self.flush()
+
+    def observe(self, dpid, timestamp, samples):
+        """
+        Adds the bandwidth samples of a monitoring poll.
+
+        Args:
+            dpid: The switch the samples come from.
+            timestamp: Time of the poll.
+            samples: Bandwidth in bytes per second, mapped by MAC address.
+        """
+        if not samples:
+            return
+        bucket = bucket_start(timestamp.replace(tzinfo=None), self.bucket)
+        with self.lock:
+            for mac_address, bandwidth in samples.items():
+                self.series(bucket, dpid, mac_address).add(bandwidth)
+            self.series(bucket, dpid, SWITCH_SERIES).add(sum(samples.values()))
+
+    def series(self, bucket, dpid, mac_address):
+        sketch = self.open.get((bucket, dpid, mac_address))
+        if sketch is None:
+            sketch = self.open[(bucket, dpid, mac_address)] = DDSketch(self.relative_accuracy)
+        return sketch
+
+    def flush(self, everything=False):
+        """
+        Writes the sketches of the closed buckets, merging them with sketches already stored for the
+        same bucket (e.g. written before a restart), and deletes the expired ones.
+
+        The closed sketches are taken out of the open ones before writing, so samples still arriving for
+        them start new sketches. If the write fails they are merged back and written by the next flush.
+
+        Args:
+            everything: Also write the bucket still open.
+        """
+        current = bucket_start(datetime.now(timezone.utc).replace(tzinfo=None), self.bucket)
+        with self.lock:
+            closed = {key: sketch for key, sketch in self.open.items() if everything or key[0] < current}
+            for key in closed:
+                del self.open[key]
+        if not closed:
+            return
+
+        with self.app.app_context():
+            try:
+                # The stored sketches are merged into copies, the closed ones are kept as they are until committed
+                merged = {key: DDSketch(self.relative_accuracy).merge(sketch) for key, sketch in closed.items()}
+                buckets = {bucket for bucket, _, _ in closed}
+                stored = db.session.query(BandwidthSketch).filter(BandwidthSketch.bucket.in_(buckets)).all()
+                for row in stored:
+                    sketch = merged.get((row.bucket, row.device_id, row.mac_address))
+                    if sketch is None:
+                        continue
+                    stored_sketch = DDSketch.from_bytes(row.sketch)
+                    if stored_sketch.relative_accuracy == self.relative_accuracy:
+                        sketch.merge(stored_sketch)
+                    else:
+                        # Written with another SKETCH_RELATIVE_ACCURACY, replaced rather than failing every flush
+                        logging.warning(f"Replacing the bandwidth sketch of {row.mac_address} on device {row.device_id} at {row.bucket}, its accuracy differs.")
+
+                rows = [
+                    {'bucket': bucket, 'device_id': dpid, 'mac_address': mac_address, 'samples': sketch.count, 'sketch': sketch.to_bytes()}
+                    for (bucket, dpid, mac_address), sketch in merged.items()
+                ]
+                stmt = insert(BandwidthSketch).values(rows)
+                db.session.execute(stmt.on_conflict_do_update(
+                    constraint='_bandwidth_sketch_unique',
+                    set_={'samples': stmt.excluded.samples, 'sketch': stmt.excluded.sketch}
+                ))
+                db.session.query(BandwidthSketch).filter(BandwidthSketch.bucket < current - self.retention).delete(synchronize_session=False)
+                db.session.commit()
+                logging.debug(f"Stored {len(rows)} bandwidth sketches.")
+            except Exception as e:
+                logging.error(f"Error storing bandwidth sketches, {len(closed)} kept for the next flush: {e}")
+                db.session.rollback()
+                with self.lock:
+                    for key, sketch in closed.items():
+                        if key in self.open:
+                            self.open[key].merge(sketch)
+                        else:
+                            self.open[key] = sketch
+
+    def open_sketches(self, device_id, mac_address, start, end):
+        """
+        Returns copies of the open sketches of a series within [start, end).
+        """
+        first = bucket_start(start, self.bucket) if start is not None else None
+        with self.lock:
+            return [
+                DDSketch(self.relative_accuracy).merge(sketch)
+                for (bucket, dpid, mac), sketch in self.open.items()
+                if (device_id is None or dpid == device_id) and mac == mac_address
+                and (first is None or bucket >= first) and (end is None or bucket < end)
+            ]
+
+def merged_quantiles(rows, extra, quantiles):
+    """
+    Merges stored and open sketches and returns the requested quantiles.
+
+    Args:
+        rows: Serialised sketches read from bandwidth_sketches.
+        extra: Sketches not stored yet.
+        quantiles: Quantiles to compute, between 0 and 1.
+
+    Returns:
+        A dictionary with the number of samples, their mean and maximum, and the value of each quantile.
+    """
+    merged = None
+    for sketch in [DDSketch.from_bytes(row) for row in rows] + extra:
+        merged = sketch if merged is None else merged.merge(sketch)
+    if merged is None or not merged.count:
+        return {'samples': 0, 'mean': None, 'max': None, 'quantiles': {str(q): None for q in quantiles}}
+    return {
+        'samples': merged.count,
+        'mean': round(merged.sum / merged.count, 1),
+        'max': merged.max,
+        'quantiles': {str(q): round(merged.quantile(q), 1) for q in quantiles},
+    }
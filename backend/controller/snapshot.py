@@ -0,0 +1,171 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from shared import db
+from shared.models import Device, DeviceFunction
+from goose import Publisher
+
+SNAPSHOT_VERSION = 1
+
+def copy_items(mapping):
+    """
+    Returns the items of a dictionary updated by other threads, retrying if it changed during the copy.
+    """
+    for _ in range(5):
+        try:
+            return list(mapping.items())
+        except RuntimeError:
+            continue
+    return []
+
+class StateSnapshot:
+    """
+    Periodic on-disk snapshot of the controller's in-memory state, for warm restarts.
+
+    Holds the monitoring counter baselines with the time of each switch's last poll, the poll schedule
+    (the stage of the monitoring function on each switch), the switches that were connected, the function placement (name and content hash of each stage), the GOOSE publisher
+    counters and the learned MACs. The snapshot is written as compact JSON to a temporary file that
+    atomically replaces the previous one, so a crash never leaves a partial snapshot behind.
+
+    On startup a snapshot younger than max_age is loaded before the reactor runs. Restored state is
+    checked against each switch when it reconnects: counter baselines larger than the switch's counters
+    are replaced by the first poll, and restored stage hashes are dropped when the reconciler finds a
+    different function running at that stage. The restored switches are polled as soon as they
+    reconnect, so bandwidth is computed against the baselines within one poll interval; the polled
+    stages are then confirmed or corrected by the reconciler's listing.
+
+    Attributes:
+        app: Flask application instance for database context.
+        controller: The running eBPFController.
+        path: Path of the snapshot file.
+        interval: Seconds between snapshots.
+        max_age: Age in seconds over which a snapshot is ignored on startup.
+    """
+    def __init__(self, app, controller):
+        self.app = app
+        self.controller = controller
+        self.path = app.config['SNAPSHOT_PATH']
+        self.interval = app.config['SNAPSHOT_INTERVAL']
+        self.max_age = app.config['SNAPSHOT_MAX_AGE']
+        self.stopped = threading.Event()
+
+    def start(self):
+        """
+        Starts taking snapshots in a background daemon thread.
+
+        Returns:
+            Reference to the instance for further use.
+        """
+        if self.interval > 0:
+            threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def stop(self):
+        """
+        Stops taking snapshots and writes a last one.
+        """
+        self.stopped.set()
+        self.save()
+
+    def run(self):
+        """
+        Writes a snapshot every interval until stopped.
+        """
+        while not self.stopped.wait(self.interval):
+            self.save()
+
+    def collect(self):
+        """
+        Returns the state to snapshot as a JSON serialisable dictionary.
+        """
+        controller = self.controller
+        artifacts = copy_items(controller.installed_artifacts)
+        names = {}
+        if artifacts:
+            with self.app.app_context():
+                rows = db.session.query(Device.dpid, DeviceFunction.index, DeviceFunction.function_name).join(
+                    DeviceFunction, DeviceFunction.device_id == Device.id
+                ).filter(Device.dpid.in_({dpid for (dpid, _), _ in artifacts})).all()
+                names = {(dpid, index): name for dpid, index, name in rows}
+
+        return {
+            'version': SNAPSHOT_VERSION,
+            'taken_at': time.time(),
+            'connected': sorted(controller.connected_devices),
+            'monitoring': [[dpid, mac, counter] for (dpid, mac), counter in copy_items(controller.monitoring_cache)],
+            'monitoring_polled': [[dpid, polled] for dpid, polled in copy_items(controller.monitoring_polled)],
+            'polled_stages': [[dpid, stage] for dpid, stage in controller.poller.stages.items()],
+            'functions': [[dpid, index, names[(dpid, index)], digest] for (dpid, index), digest in artifacts if (dpid, index) in names],
+            'goose': [[dpid, mac.hex(), publisher.st, publisher.sq] for (dpid, mac), publisher in copy_items(controller.goose.publishers)],
+            'learning': [[dpid, mac.hex(), port] for dpid, macs in copy_items(controller.learning.macs) for mac, port in copy_items(macs)],
+        }
+
+    def save(self):
+        """
+        Writes a snapshot atomically.
+
+        Returns:
+            True if the snapshot was written.
+        """
+        started = time.monotonic()
+        try:
+            state = self.collect()
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            temporary = f'{self.path}.tmp'
+            with open(temporary, 'w') as snapshot:
+                json.dump(state, snapshot, separators=(',', ':'))
+                snapshot.flush()
+                os.fsync(snapshot.fileno())
+            os.replace(temporary, self.path)
+            logging.debug(f"State snapshot written in {(time.monotonic() - started) * 1000:.1f} ms.")
+            return True
+        except Exception as e:
+            logging.error(f"Error writing the state snapshot: {e}")
+            return False
+
+    def load(self):
+        """
+        Restores the controller's state from the snapshot, if there is a recent enough one.
+
+        Returns:
+            True if the state was restored.
+        """
+        started = time.monotonic()
+        try:
+            with open(self.path) as snapshot:
+                state = json.load(snapshot)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logging.error(f"Error reading the state snapshot {self.path}: {e}")
+            return False
+
+        age = time.time() - state.get('taken_at', 0)
+        if state.get('version') != SNAPSHOT_VERSION or age > self.max_age:
+            logging.info(f"Ignoring the state snapshot taken {age:.0f}s ago.")
+            return False
+
+        controller = self.controller
+        controller.monitoring_cache.update({(dpid, mac): counter for dpid, mac, counter in state['monitoring']})
+        controller.monitoring_polled.update({dpid: polled for dpid, polled in state['monitoring_polled']})
+        # The mitigation engine turns the first samples into rates over the same gap
+        controller.mitigation.last_poll.update(controller.monitoring_polled)
+        for dpid, stage in state.get('polled_stages', []):
+            controller.poller.stages.restore(dpid, stage)
+        for dpid, index, name, digest in state['functions']:
+            controller.installed_artifacts[(dpid, index)] = digest
+            controller.restored_functions[(dpid, index)] = name
+        for dpid, mac, st, sq in state['goose']:
+            controller.goose.publishers[(dpid, bytes.fromhex(mac))] = Publisher(st, sq)
+        for dpid, mac, port in state['learning']:
+            controller.learning.macs.setdefault(dpid, {})[bytes.fromhex(mac)] = port
+
+        logging.info(f"Restored the state snapshot taken {age:.1f}s ago in {(time.monotonic() - started) * 1000:.1f} ms: "
+                     f"{len(state['monitoring'])} counter baselines, {len(state['functions'])} stages, "
+                     f"{len(state.get('polled_stages', []))} switches polled, "
+                     f"{len(state['connected'])} switches expected to reconnect.")
+        return True
@@ -0,0 +1,71 @@
+import threading
+
+class FunctionStages:
+    """
+    Stage of a data plane function on each switch, as the switches report it.
+
+    The stages are followed from the function add and remove replies, moving down with the following
+    stages as the switch does, and set from the pipelines listed by the reconciler. Safe to use from
+    any thread.
+
+    Attributes:
+        function: Name of the followed function.
+        stages: Stage of the function mapped by DPID.
+    """
+    def __init__(self, function):
+        self.function = function
+        self.lock = threading.Lock()
+        self.stages = {}
+
+    def stage_added(self, dpid, index, name):
+        """
+        Follows a function installed at a stage, which replaces whatever ran there.
+        """
+        with self.lock:
+            if name == self.function:
+                self.stages[dpid] = index
+            elif self.stages.get(dpid) == index:
+                del self.stages[dpid]
+
+    def stage_removed(self, dpid, index):
+        """
+        Follows a function removed from a stage, the following stages move down by one.
+        """
+        with self.lock:
+            stage = self.stages.get(dpid)
+            if stage == index:
+                del self.stages[dpid]
+            elif stage is not None and stage > index:
+                self.stages[dpid] = stage - 1
+
+    def stages_listed(self, dpid, entries):
+        """
+        Sets the stage of a switch from the FunctionListReply entries of its running pipeline.
+        """
+        stage = min((entry.index for entry in entries if entry.name == self.function), default=None)
+        with self.lock:
+            if stage is None:
+                self.stages.pop(dpid, None)
+            else:
+                self.stages[dpid] = stage
+
+    def restore(self, dpid, stage):
+        """
+        Sets the stage of a switch restored from the state snapshot, until the switch is listed.
+        """
+        with self.lock:
+            self.stages[dpid] = stage
+
+    def items(self):
+        """
+        Returns a copy of the (DPID, stage) pairs.
+        """
+        with self.lock:
+            return list(self.stages.items())
+
+    def copy(self):
+        """
+        Returns a copy of the stages mapped by DPID.
+        """
+        with self.lock:
+            return dict(self.stages)
@@ -0,0 +1,145 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+class Subscription:
+    """
+    A single dashboard client subscribed to one or more topics.
+
+    Pending updates are coalesced per (topic, key), so a slow client only ever receives the latest
+    value for each series instead of an ever growing backlog. If the number of distinct pending keys
+    goes over the limit, the oldest ones are dropped and the client is told it lagged behind.
+
+    Attributes:
+        topics: Set of topics the client is subscribed to.
+        max_pending: Maximum number of distinct pending updates kept for this client.
+        pending: Ordered dictionary of pending updates mapped by (topic, key).
+        dropped: Number of updates dropped since the last drain.
+    """
+    def __init__(self, topics, max_pending=256):
+        self.topics = set(topics)
+        self.max_pending = max_pending
+        self.pending = OrderedDict()
+        self.dropped = 0
+        self.condition = threading.Condition()
+
+    def matches(self, topic, key):
+        """
+        Checks whether an update for the given topic and key should be delivered to this client.
+        """
+        return topic in self.topics or (key is not None and f'{topic}:{key}' in self.topics)
+
+    def offer(self, topic, key, payload):
+        """
+        Queues an update for the client, replacing any pending update for the same (topic, key).
+        """
+        with self.condition:
+            self.pending.pop((topic, key), None)
+            self.pending[(topic, key)] = payload
+            while len(self.pending) > self.max_pending:
+                self.pending.popitem(last=False)
+                self.dropped += 1
+            self.condition.notify()
+
+    def drain(self, timeout):
+        """
+        Waits for pending updates and returns them.
+
+        Args:
+            timeout: Maximum number of seconds to wait for an update.
+
+        Returns:
+            Tuple of (list of (topic, payload), number of dropped updates).
+        """
+        with self.condition:
+            if not self.pending:
+                self.condition.wait(timeout)
+            updates = [(topic, payload) for (topic, _), payload in self.pending.items()]
+            dropped = self.dropped
+            self.pending.clear()
+            self.dropped = 0
+        return updates, dropped
+
+class EventBroker:
+    """
+    Fans out live controller updates (bandwidth samples, topology changes and events) to subscribed clients.
+
+    Publishing never blocks on a client: updates are handed to each matching subscription, which
+    coalesces them until the client's stream picks them up.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+
+    def subscribe(self, topics, max_pending=256):
+        """
+        Registers a new subscription for the given topics.
+
+        Args:
+            topics: Iterable of topics, e.g. "topology", "events", "bandwidth" or "bandwidth:<dpid>".
+            max_pending: Maximum number of distinct pending updates for the client.
+
+        Returns:
+            The new Subscription.
+        """
+        subscription = Subscription(topics, max_pending)
+        with self.lock:
+            self.subscriptions.add(subscription)
+        logging.info(f"Stream client subscribed to {sorted(subscription.topics)}.")
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        Removes a subscription.
+        """
+        with self.lock:
+            self.subscriptions.discard(subscription)
+        logging.info("Stream client unsubscribed.")
+
+    def publish(self, topic, payload, key=None):
+        """
+        Publishes an update to every subscription interested in it.
+
+        Args:
+            topic: Topic of the update ("bandwidth", "topology" or "events").
+            payload: JSON serialisable update data.
+            key: Series key within the topic (e.g. the dpid for bandwidth). Updates without a key are
+                never coalesced with each other.
+        """
+        with self.lock:
+            subscriptions = [s for s in self.subscriptions if s.matches(topic, key)]
+        if not subscriptions:
+            return
+        # Keyless updates (e.g. events) get a unique key so they are not coalesced
+        series = key if key is not None else time.monotonic_ns()
+        for subscription in subscriptions:
+            subscription.offer(topic, series, payload)
+
+    def stream(self, subscription, heartbeat=15.0):
+        """
+        Generator producing the Server-Sent Events stream for a subscription.
+
+        Args:
+            subscription: The client's subscription.
+            heartbeat: Seconds between keep-alive comments when there are no updates.
+
+        Yields:
+            Encoded SSE messages.
+        """
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                updates, dropped = subscription.drain(heartbeat)
+                if dropped:
+                    yield f'event: lagged\ndata: {json.dumps({"dropped": dropped})}\n\n'
+                if not updates:
+                    yield ': keep-alive\n\n'
+                for topic, payload in updates:
+                    yield f'event: {topic}\ndata: {json.dumps(payload)}\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+# Shared broker for the controller and its routes
+broker = EventBroker()
@@ -0,0 +1,297 @@
+import logging
+import struct
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from core.packets import *
+
+from replies import gather
+
+# Value layouts of the tables of the bundled functions, as (struct format, field names)
+SCHEMAS = {
+    'monitor': ('<II', ('bytes', 'packets')),
+    'assetdisc': ('<II', ('bytes', 'packets')),
+    'goose_analyser': ('<ii', ('stNum', 'sqNum')),
+    'blacklist': ('<QQ', ('rate', 'blocked_at')),
+    'inports': ('<I', ('port',)),
+}
+
+# Names of the map types of TableDefinition
+TABLE_TYPES = {0: 'unspec', 1: 'hash', 2: 'array', 11: 'lpm_trie'}
+
+def parse_bytes(value):
+    """
+    Parses a table key or value given as a hex string. Separators are allowed, so MAC addresses
+    ("00:00:00:00:00:03") can be passed as is.
+
+    Raises:
+        ValueError: If the value is not valid hex.
+    """
+    if not isinstance(value, str):
+        raise ValueError('Keys and values must be hex strings.')
+    return bytes.fromhex(value.replace(':', '').replace('-', '').replace(' ', ''))
+
+def table_status(status):
+    """
+    Returns the name of a table status, e.g. "ENTRY_NOT_FOUND".
+    """
+    return TableStatus.Name(status)
+
+def write_entries(controller, dpid, stage, table_name, entries, delete=False, window=64, timeout=5.0):
+    """
+    Inserts or deletes a batch of table entries on a switch.
+
+    The requests are pipelined over the switch connection with at most window of them waiting for a
+    reply, instead of one round trip per entry. Replies carry no key, they are matched in send order.
+
+    Args:
+        controller: The running eBPFController.
+        dpid: The switch to write to.
+        stage: Stage of the function owning the table.
+        table_name: Name of the table.
+        entries: List of (key, value) byte strings (value is ignored when deleting).
+        delete: Delete the keys instead of inserting the entries.
+        window: Maximum number of requests waiting for a reply at the same time.
+        timeout: Seconds each request may wait for its reply.
+
+    Returns:
+        Dictionary with the number of entries written and failed, the failed entries with their status,
+        and the time taken.
+    """
+    connection = controller.connections[dpid]
+    started = time.monotonic()
+
+    operations = {}
+    for position, (key, value) in enumerate(entries):
+        if delete:
+            request = TableEntryDeleteRequest(index=stage, table_name=table_name, key=key)
+            opcode = Header.TABLE_ENTRY_DELETE_REPLY
+        else:
+            request = TableEntryInsertRequest(index=stage, table_name=table_name, key=key, value=value)
+            opcode = Header.TABLE_ENTRY_INSERT_REPLY
+        operations[position] = lambda request=request, opcode=opcode: controller.replies.send(connection, request, opcode)
+
+    failed = []
+    for position, (reply, error, _) in sorted(gather(operations, window, timeout).items()):
+        if error:
+            failed.append({'key': entries[position][0].hex(), 'status': error})
+        elif reply.status != TableStatus.Value('SUCCESS'):
+            failed.append({'key': entries[position][0].hex(), 'status': table_status(reply.status)})
+
+    elapsed = time.monotonic() - started
+    action = 'Deleted' if delete else 'Inserted'
+    logging.info(f"{action} {len(entries) - len(failed)} of {len(entries)} entries in {table_name} on device {dpid} in {elapsed:.2f}s.")
+    return {
+        'written': len(entries) - len(failed),
+        'failed': failed,
+        'elapsed_ms': round(elapsed * 1000, 1),
+    }
+
+def decode_key(key):
+    """
+    Decodes a table key, MAC addresses are shown in their usual notation.
+    """
+    if len(key) == 6:
+        return ':'.join(f'{b:02x}' for b in key)
+    return key.hex()
+
+def decode_value(table_name, value):
+    """
+    Decodes a table value using the schema of the table, or as little-endian 32-bit words when unknown.
+    """
+    schema = SCHEMAS.get(table_name)
+    if schema and struct.calcsize(schema[0]) == len(value):
+        return dict(zip(schema[1], struct.unpack(schema[0], value)))
+    if value and len(value) % 4 == 0:
+        return {'words': list(struct.unpack(f'<{len(value) // 4}I', value))}
+    return {}
+
+def decode_entry(table_name, key, value):
+    """
+    Decodes a table entry into a dictionary with the raw and decoded key and value.
+    """
+    return {
+        'key': decode_key(key),
+        'raw_key': key.hex(),
+        'value': decode_value(table_name, value),
+        'raw_value': value.hex(),
+    }
+
+def decode_table(pkt):
+    """
+    Decodes a TableListReply into its definition and entries. Array tables only hold values, their keys
+    are the indexes.
+    """
+    definition = pkt.entry
+    name = definition.table_name
+    entries = []
+    if definition.table_type == TableDefinition.TableType.Value('ARRAY'):
+        for index in range(pkt.n_items):
+            value = pkt.items[index * definition.value_size:(index + 1) * definition.value_size]
+            entries.append(decode_entry(name, struct.pack('<I', index), value))
+    else:
+        item_size = definition.key_size + definition.value_size
+        for index in range(pkt.n_items):
+            item = pkt.items[index * item_size:(index + 1) * item_size]
+            entries.append(decode_entry(name, item[:definition.key_size], item[definition.key_size:]))
+    return {'table': serialise_definition(definition), 'entries': entries}
+
+def serialise_definition(definition):
+    """
+    Serialises a TableDefinition into a dictionary.
+    """
+    return {
+        'name': definition.table_name,
+        'type': TABLE_TYPES.get(definition.table_type, definition.table_type),
+        'key_size': definition.key_size,
+        'value_size': definition.value_size,
+        'max_entries': definition.max_entries,
+    }
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical reads into one switch request and caches the result for a short TTL.
+
+    Attributes:
+        ttl: Seconds a result is served from the cache.
+        cache: Tuple of (time, result) mapped by request key.
+        in_flight: Future of the request being made, mapped by request key.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.cache = {}
+        self.in_flight = {}
+
+    def get(self, key, loader, timeout):
+        """
+        Returns the cached result for a key, waits for the request already in flight, or runs the loader.
+
+        Args:
+            key: Identifies the request, e.g. (dpid, stage, table).
+            loader: Callable making the request and returning its result.
+            timeout: Seconds to wait for a request made by another caller.
+
+        Returns:
+            Tuple of (result, True if the result was shared or cached).
+        """
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached and time.monotonic() - cached[0] < self.ttl:
+                return cached[1], True
+            future = self.in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self.in_flight[key] = Future()
+
+        if not leader:
+            return future.result(timeout), True
+
+        try:
+            result = loader()
+        except Exception as e:
+            with self.lock:
+                del self.in_flight[key]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            del self.in_flight[key]
+            self.cache[key] = (time.monotonic(), result)
+            # Drop expired results so the cache does not grow with every table ever browsed
+            now = time.monotonic()
+            for expired in [k for k, (at, _) in self.cache.items() if now - at >= self.ttl]:
+                del self.cache[expired]
+        future.set_result(result)
+        return result, False
+
+class TableBrowser:
+    """
+    Reads switch tables on demand for the dashboard.
+
+    Identical reads made at the same time share one switch request, and results are cached for a short
+    TTL, so many dashboard users browsing the same table cannot overload the switch.
+
+    Attributes:
+        controller: The running eBPFController.
+        timeout: Seconds to wait for a switch reply.
+        flights: SingleFlight coalescing and caching the reads.
+    """
+    def __init__(self, app, controller):
+        self.controller = controller
+        self.timeout = app.config['TABLE_READ_TIMEOUT']
+        self.flights = SingleFlight(app.config['TABLE_CACHE_TTL'])
+
+    def request(self, dpid, request, opcode, key=None):
+        """
+        Sends a request to a switch and waits for its reply.
+
+        Raises:
+            KeyError: If the switch is not connected.
+            TimeoutError: If the switch does not reply in time.
+        """
+        connection = self.controller.connections[dpid]
+        future = self.controller.replies.send(connection, request, opcode, key)
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def list_tables(self, dpid):
+        """
+        Lists the tables of every stage running on a switch.
+
+        Returns:
+            Tuple of (list of stages with their function name and table definitions, True if shared or cached).
+        """
+        def load():
+            functions = self.request(dpid, FunctionListRequest(), Header.FUNCTION_LIST_REPLY)
+            connection = self.controller.connections[dpid]
+            operations = {
+                entry.index: lambda entry=entry: self.controller.replies.send(connection, TablesListRequest(index=entry.index), Header.TABLES_LIST_REPLY)
+                for entry in functions.entries
+            }
+            replies = gather(operations, len(operations) or 1, self.timeout)
+            stages = []
+            for entry in sorted(functions.entries, key=lambda entry: entry.index):
+                reply, error, _ = replies[entry.index]
+                stages.append({
+                    'stage': entry.index,
+                    'function': entry.name,
+                    'counter': entry.counter,
+                    'tables': [serialise_definition(definition) for definition in reply.entries] if reply else [],
+                    'error': error,
+                })
+            return stages
+        return self.flights.get((dpid,), load, self.timeout)
+
+    def dump_table(self, dpid, stage, table_name):
+        """
+        Reads all the entries of a table.
+
+        Returns:
+            Tuple of (decoded table or None with the status if it could not be read, True if shared or cached).
+        """
+        def load():
+            # Error replies carry no table name, the reply is matched in send order
+            reply = self.request(dpid, TableListRequest(index=stage, table_name=table_name), Header.TABLE_LIST_REPLY)
+            if reply.status != TableStatus.Value('SUCCESS'):
+                return {'status': table_status(reply.status)}
+            return {'status': 'SUCCESS', **decode_table(reply)}
+        return self.flights.get((dpid, stage, table_name), load, self.timeout)
+
+    def get_entry(self, dpid, stage, table_name, key):
+        """
+        Reads a single entry of a table.
+
+        Returns:
+            Tuple of (decoded entry with its status, True if shared or cached).
+        """
+        def load():
+            reply = self.request(dpid, TableEntryGetRequest(index=stage, table_name=table_name, key=key), Header.TABLE_ENTRY_GET_REPLY)
+            if reply.status != TableStatus.Value('SUCCESS'):
+                return {'status': table_status(reply.status)}
+            return {'status': 'SUCCESS', **decode_entry(table_name, key, reply.value)}
+        return self.flights.get((dpid, stage, table_name, key), load, self.timeout)
+
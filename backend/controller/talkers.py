@@ -0,0 +1,227 @@
+import heapq
+import threading
+import time
+from collections import deque
+
+# Query windows in seconds, each tracked by a ring of BUCKETS summaries
+WINDOWS = {'10s': 10, '1m': 60, '10m': 600}
+BUCKETS = 10
+
+# Seconds after the last monitoring poll of a switch during which its asset discovery deltas are ignored
+MONITORING_PRECEDENCE = 10
+
+class SpaceSaving:
+    """
+    Weighted Space-Saving summary keeping the heaviest keys of a stream in bounded memory.
+
+    At most capacity keys are counted. A new key arriving when the summary is full replaces the key
+    with the smallest count and inherits that count as its error, so a count is never below the key's
+    true weight and overestimates it by at most its error. The smallest count is found through a heap
+    of (count, key) entries; entries made stale by later increments are skipped when popped and the
+    heap is rebuilt from the live counts when it grows past four times the capacity.
+
+    Attributes:
+        capacity: Maximum number of keys counted.
+        counts: Count of each key.
+        errors: Maximum overestimation of each key's count.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.heap = []
+
+    def add(self, key, weight):
+        """
+        Adds weight to the count of a key.
+        """
+        counts = self.counts
+        count = counts.get(key)
+        if count is None:
+            if len(counts) < self.capacity:
+                count, error = weight, 0
+            else:
+                error = self.evict()
+                count = error + weight
+            self.errors[key] = error
+        else:
+            count += weight
+        counts[key] = count
+        heapq.heappush(self.heap, (count, key))
+        if len(self.heap) > 4 * self.capacity:
+            self.heap = [(count, key) for key, count in counts.items()]
+            heapq.heapify(self.heap)
+
+    def evict(self):
+        """
+        Removes the key with the smallest count.
+
+        Returns:
+            The count of the removed key.
+        """
+        while True:
+            count, key = heapq.heappop(self.heap)
+            if self.counts.get(key) == count:
+                del self.counts[key]
+                del self.errors[key]
+                return count
+
+    def floor(self):
+        """
+        Returns the largest weight a key missing from the summary may have had.
+        """
+        if len(self.counts) < self.capacity:
+            return 0
+        while self.counts.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return self.heap[0][0]
+
+class WindowRing:
+    """
+    Space-Saving summaries of consecutive buckets of a sliding window.
+
+    Attributes:
+        bucket: Seconds covered by each summary.
+        buckets: Summaries of the window mapped by bucket number, oldest first.
+    """
+    def __init__(self, window, capacity):
+        self.bucket = window / BUCKETS
+        self.capacity = capacity
+        self.buckets = deque()
+
+    def current(self, now):
+        """
+        Returns the summary of the bucket containing now, dropping the buckets out of the window.
+        """
+        number = int(now // self.bucket)
+        while self.buckets and self.buckets[0][0] <= number - BUCKETS:
+            self.buckets.popleft()
+        if not self.buckets or self.buckets[-1][0] != number:
+            self.buckets.append((number, SpaceSaving(self.capacity)))
+        return self.buckets[-1][1]
+
+    def top(self, now, k):
+        """
+        Merges the summaries of the window and returns its k heaviest keys.
+
+        Returns:
+            List of (key, count, error) tuples, heaviest first.
+        """
+        oldest = int(now // self.bucket) - BUCKETS
+        summaries = [summary for number, summary in self.buckets if number > oldest]
+        counts = {}
+        errors = {}
+        for summary in summaries:
+            for key, count in summary.counts.items():
+                counts[key] = counts.get(key, 0) + count
+                errors[key] = errors.get(key, 0) + summary.errors[key]
+        # A key missing from a full summary may have been evicted from it
+        for summary in summaries:
+            floor = summary.floor()
+            if floor:
+                for key in counts:
+                    if key not in summary.counts:
+                        counts[key] += floor
+                        errors[key] += floor
+        heaviest = heapq.nlargest(k, counts.items(), key=lambda item: item[1])
+        return [(key, count, errors[key]) for key, count in heaviest]
+
+class TopTalkers:
+    """
+    Streaming top-K talkers of each switch and of the whole network.
+
+    Fed with the byte deltas of each MAC decoded from the monitoring and asset discovery tables, so
+    the heaviest senders are known without scanning monitoring_data. Every (scope, window) pair keeps
+    a ring of Space-Saving summaries, so memory only depends on the capacity, the number of switches
+    and the windows, not on the number of MACs seen. Results are cached until the next update or
+    bucket, so repeated queries are dictionary lookups.
+
+    A switch running both functions reports the same traffic twice; its asset discovery deltas are
+    then ignored as long as monitoring deltas keep coming.
+
+    Attributes:
+        capacity: Keys counted by each summary.
+        default_k: Number of talkers returned when the query does not say.
+        rings: Window rings mapped by scope (a DPID, or None for the whole network) and window name.
+    """
+    def __init__(self, app):
+        self.capacity = app.config['TOP_TALKERS_CAPACITY']
+        self.default_k = app.config['TOP_TALKERS_K']
+        self.lock = threading.Lock()
+        self.rings = {}
+        self.monitored = {}
+        self.cache = {}
+
+    def rings_of(self, scope):
+        rings = self.rings.get(scope)
+        if rings is None:
+            rings = self.rings[scope] = {name: WindowRing(window, self.capacity) for name, window in WINDOWS.items()}
+        return rings
+
+    def observe(self, dpid, deltas, source='monitoring'):
+        """
+        Adds the bytes sent by each MAC since the previous poll of a switch.
+
+        Args:
+            dpid: The switch the deltas come from.
+            deltas: Bytes sent since the previous poll, mapped by raw MAC address.
+            source: "monitoring" or "assets", the table the deltas were decoded from.
+        """
+        now = time.time()
+        if source == 'monitoring':
+            self.monitored[dpid] = now
+        elif now - self.monitored.get(dpid, 0.0) < MONITORING_PRECEDENCE:
+            return
+        if not deltas:
+            return
+
+        with self.lock:
+            summaries = [ring.current(now) for scope in (dpid, None) for ring in self.rings_of(scope).values()]
+            for mac, delta in deltas.items():
+                if delta > 0:
+                    for summary in summaries:
+                        summary.add(mac, delta)
+            self.cache.clear()
+
+    def top(self, scope, window, k=None):
+        """
+        Returns the heaviest talkers of a scope over a window.
+
+        Args:
+            scope: A DPID, or None for the whole network.
+            window: Window name, one of WINDOWS.
+            k: Number of talkers, the configured default if None.
+
+        Returns:
+            List of talkers, heaviest first, with their bytes, average rate and the maximum
+            overestimation of their bytes.
+        """
+        k = min(k or self.default_k, self.capacity)
+        now = time.time()
+        key = (scope, window, k, int(now * BUCKETS // WINDOWS[window]))
+        talkers = self.cache.get(key)
+        if talkers is not None:
+            return talkers
+
+        with self.lock:
+            rings = self.rings.get(scope)
+            heaviest = rings[window].top(now, k) if rings else []
+            talkers = [
+                {
+                    'mac_address': mac.hex(':'),
+                    'bytes': count,
+                    'bytes_per_second': round(count / WINDOWS[window], 1),
+                    'error': error,
+                }
+                for mac, count, error in heaviest
+            ]
+            if len(self.cache) > 1000:
+                self.cache.clear()
+            self.cache[key] = talkers
+        return talkers
+
+    def devices(self):
+        """
+        Returns the switches with talkers tracked.
+        """
+        return [scope for scope in list(self.rings) if scope is not None]
@@ -0,0 +1,242 @@
+import base64
+import json
+from datetime import datetime, timezone
+
+from sqlalchemy import and_, func, or_, tuple_, union_all
+
+from shared import db
+
+# Supported bucket sizes in seconds
+BUCKETS = {
+    '10s': 10,
+    '1m': 60,
+    '1h': 3600,
+}
+
+# Supported aggregates
+AGGREGATES = {
+    'avg': lambda column: func.avg(column),
+    'max': lambda column: func.max(column),
+    'sum': lambda column: func.sum(column),
+    'p95': lambda column: func.percentile_cont(0.95).within_group(column),
+}
+
+def parse_timestamp(value):
+    """
+    Parses a timestamp query parameter given as ISO 8601 or seconds since the epoch.
+
+    Args:
+        value: The raw query parameter value, or None.
+
+    Returns:
+        A naive UTC datetime (matching the stored timestamps), or None if no value was given.
+
+    Raises:
+        ValueError: If the value cannot be parsed.
+    """
+    if value is None or value == '':
+        return None
+    try:
+        parsed = datetime.fromtimestamp(float(value), timezone.utc)
+    except ValueError:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def encode_cursor(timestamp, row_id):
+    """
+    Encodes the position of the last returned row into an opaque keyset cursor.
+    """
+    return base64.urlsafe_b64encode(f'{timestamp.isoformat()}|{row_id}'.encode()).decode()
+
+def decode_cursor(cursor):
+    """
+    Decodes a keyset cursor produced by encode_cursor.
+
+    Returns:
+        Tuple of (timestamp, row ID).
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor.')
+
+def bucket_column(column, seconds):
+    """
+    Returns an SQL expression truncating a timestamp column to the start of its bucket, in epoch seconds.
+    """
+    return (func.floor(func.extract('epoch', column) / seconds) * seconds).label('bucket')
+
+def bucket_timestamp(bucket):
+    """
+    Converts a bucket start in epoch seconds into an ISO 8601 timestamp.
+    """
+    return datetime.fromtimestamp(float(bucket), timezone.utc).isoformat()
+
+def filter_range(query, column, start, end):
+    """
+    Restricts a query to rows with column in [start, end).
+    """
+    if start is not None:
+        query = query.filter(column >= start)
+    if end is not None:
+        query = query.filter(column < end)
+    return query
+
+def keyset_page(query, timestamp_column, id_column, cursor, limit):
+    """
+    Applies keyset pagination (newest first) to a query of raw rows.
+
+    Args:
+        query: The filtered query.
+        timestamp_column: Timestamp column of the model.
+        id_column: Primary key column of the model, used as tie breaker.
+        cursor: Cursor returned with the previous page, or None for the first page.
+        limit: Maximum number of rows in the page.
+
+    Returns:
+        Tuple of (rows, cursor for the next page or None if this is the last page).
+    """
+    if cursor:
+        cursor_timestamp, cursor_id = decode_cursor(cursor)
+        query = query.filter(tuple_(timestamp_column, id_column) < tuple_(cursor_timestamp, cursor_id))
+
+    rows = query.order_by(timestamp_column.desc(), id_column.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].timestamp, rows[-1].id)
+
+def bucketed(group_columns, value_columns, timestamp_column, bucket, agg):
+    """
+    Builds a bucketed aggregate query. Row filters can be applied to the returned query.
+
+    Args:
+        group_columns: Columns selected and grouped on besides the bucket (e.g. device ID, MAC address).
+        value_columns: Dictionary of output name to column to aggregate.
+        timestamp_column: Timestamp column to bucket on.
+        bucket: Bucket size in seconds.
+        agg: Name of the aggregate in AGGREGATES.
+
+    Returns:
+        The query, ordered by bucket (newest first).
+    """
+    aggregate = AGGREGATES[agg]
+    bucket_start = bucket_column(timestamp_column, bucket)
+    query = db.session.query(
+        bucket_start,
+        *group_columns,
+        *[aggregate(column).label(name) for name, column in value_columns.items()]
+    )
+    return query.group_by(bucket_start, *group_columns).order_by(bucket_start.desc())
+
+def rollup_bucketed(rollup, group_columns, values, resolution, bucket, agg):
+    """
+    Builds a bucketed aggregate query over a rollup table.
+
+    Args:
+        rollup: The rollup model.
+        group_columns: Columns selected and grouped on besides the bucket.
+        values: Names of the rolled up values (each has a "<name>_sum" and "<name>_max" column).
+        resolution: Resolution of the rollup rows to read, in seconds.
+        bucket: Bucket size in seconds, a multiple of the resolution.
+        agg: Name of the aggregate ("avg", "max" or "sum").
+
+    Returns:
+        The query, ordered by bucket (newest first).
+    """
+    def aggregate(name):
+        if agg == 'max':
+            return func.max(getattr(rollup, f'{name}_max'))
+        if agg == 'avg':
+            return func.sum(getattr(rollup, f'{name}_sum')) / func.sum(rollup.samples)
+        return func.sum(getattr(rollup, f'{name}_sum'))
+
+    bucket_start = bucket_column(rollup.bucket, bucket)
+    query = db.session.query(
+        bucket_start,
+        *group_columns,
+        *[aggregate(name).label(name) for name in values]
+    ).filter(rollup.resolution == resolution)
+    return query.group_by(bucket_start, *group_columns).order_by(bucket_start.desc())
+
+def union_buckets(*queries):
+    """
+    Combines bucketed queries over disjoint time ranges (e.g. rollups and the raw rows not rolled up
+    yet) into one query, to be ordered and paged by bucket_keyset. The queries must select the same
+    columns in the same order.
+    """
+    combined = union_all(*[query.order_by(None).statement for query in queries]).subquery()
+    return db.session.query(combined)
+
+def encode_bucket_cursor(bucket, keys):
+    """
+    Encodes the position of the last returned bucketed row (bucket start and group key values) into
+    an opaque cursor.
+    """
+    return base64.urlsafe_b64encode(json.dumps([int(bucket), *keys]).encode()).decode()
+
+def decode_bucket_cursor(cursor):
+    """
+    Decodes a bucketed cursor produced by encode_bucket_cursor.
+
+    Returns:
+        Tuple of (bucket start in epoch seconds, list of group key values).
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        bucket, *keys = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(bucket), keys
+    except Exception:
+        raise ValueError('Invalid cursor.')
+
+def bucket_keyset(query, key_names, cursor):
+    """
+    Orders a bucketed query by bucket (newest first) then by its group keys, resuming after the row
+    of a cursor, so a bucket with more rows than a page continues on the next page.
+
+    Args:
+        query: A query built by bucketed or rollup_bucketed, with its filters applied.
+        key_names: Names of the group columns identifying a row within a bucket.
+        cursor: Cursor returned with the previous page, or None for the first page.
+
+    Returns:
+        The ordered query.
+
+    Raises:
+        ValueError: If the cursor is malformed or does not match the group columns.
+    """
+    rows = query.subquery()
+    keys = [rows.c[name] for name in key_names]
+    paged = db.session.query(rows)
+    if cursor:
+        bucket, values = decode_bucket_cursor(cursor)
+        if len(values) != len(keys):
+            raise ValueError('Invalid cursor.')
+        paged = paged.filter(or_(rows.c.bucket < bucket, and_(rows.c.bucket == bucket, tuple_(*keys) > tuple_(*values))))
+    return paged.order_by(rows.c.bucket.desc(), *keys)
+
+def bucket_page(rows, limit, key_names):
+    """
+    Cuts a page of bucketed rows fetched with limit + 1 from a bucket_keyset query.
+
+    Args:
+        rows: Bucketed rows ordered by bucket (newest first) then group keys, at most limit + 1 of them.
+        limit: Maximum number of rows in the page.
+        key_names: Names of the group columns identifying a row within a bucket.
+
+    Returns:
+        Tuple of (rows, cursor for the next page or None if this is the last page).
+    """
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_bucket_cursor(last.bucket, [getattr(last, name) for name in key_names])
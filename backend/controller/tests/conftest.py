@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+CONTROLLER_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BACKEND_DIR = os.path.dirname(CONTROLLER_DIR)
+for path in (BACKEND_DIR, CONTROLLER_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+@pytest.fixture
+def database_app():
+    """
+    Flask application bound to the PostgreSQL database in TEST_DATABASE_URL, with freshly created tables.
+    """
+    url = os.environ.get('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip('TEST_DATABASE_URL not set')
+    pytest.importorskip('flask_sqlalchemy')
+    os.environ.setdefault('DATABASE_URL', url)
+
+    from flask import Flask
+    from shared import db
+    from shared.config import Config
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    db.init_app(app)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
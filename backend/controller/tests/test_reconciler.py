@@ -0,0 +1,55 @@
+import pytest
+
+reconciler = pytest.importorskip('reconciler')
+
+def same(actual, desired):
+    return actual == desired
+
+def apply(pipeline, operations):
+    """
+    Applies a plan the way the switch does: an add replaces or appends a stage, a remove shifts the following stages down.
+    """
+    pipeline = list(pipeline)
+    for operation in operations:
+        if operation[0] == 'add':
+            _, index, name = operation
+            assert index <= len(pipeline)
+            pipeline[index:index + 1] = [name]
+        else:
+            del pipeline[operation[1]]
+    return pipeline
+
+def test_matching_pipeline_is_kept():
+    assert reconciler.plan(['monitoring', 'learning'], ['monitoring', 'learning'], same) == []
+
+def test_different_stage_is_replaced():
+    assert reconciler.plan(['monitoring', 'assetdisc', 'learning'], ['monitoring', 'goose_analyser', 'learning'], same) == [
+        ('add', 1, 'goose_analyser'),
+    ]
+
+def test_extra_stage_is_removed():
+    assert reconciler.plan(['monitoring', 'assetdisc', 'learning'], ['monitoring', 'learning'], same) == [('remove', 1)]
+
+def test_missing_stages_are_appended():
+    assert reconciler.plan(['monitoring'], ['monitoring', 'learning', 'goose_analyser'], same) == [
+        ('add', 1, 'learning'),
+        ('add', 2, 'goose_analyser'),
+    ]
+
+def test_trailing_stages_are_removed_from_the_end():
+    assert reconciler.plan(['monitoring', 'assetdisc', 'learning', 'goose_analyser'], ['monitoring'], same) == [
+        ('remove', 3),
+        ('remove', 2),
+        ('remove', 1),
+    ]
+
+@pytest.mark.parametrize('actual, desired', [
+    ([], ['monitoring', 'learning']),
+    (['monitoring', 'learning'], []),
+    (['assetdisc', 'monitoring', 'learning'], ['monitoring', 'ddos_auto_mitigation', 'learning', 'goose_analyser']),
+    (['learning', 'monitoring'], ['monitoring', 'learning']),
+    (['a', 'b', 'c', 'd', 'e'], ['b', 'x', 'd']),
+])
+def test_plan_turns_the_running_pipeline_into_the_desired_one(actual, desired):
+    operations = reconciler.plan(actual, desired, same)
+    assert apply(actual, operations) == desired
@@ -0,0 +1,100 @@
+import pytest
+
+replies = pytest.importorskip('replies')
+
+DPID = 1
+OPCODE = 'TABLE_LIST_REPLY'
+
+def expect(tracker, key=None):
+    return tracker.expect(DPID, OPCODE, key)
+
+def test_keyless_replies_are_matched_in_send_order():
+    tracker = replies.ReplyTracker()
+    first, second = expect(tracker), expect(tracker)
+
+    assert tracker.resolve(DPID, OPCODE, 'first')
+    assert tracker.resolve(DPID, OPCODE, 'second')
+    assert (first.result(0), second.result(0)) == ('first', 'second')
+    assert not tracker.resolve(DPID, OPCODE, 'third')
+
+def test_keyed_reply_goes_to_the_request_with_its_key():
+    tracker = replies.ReplyTracker()
+    first, second = expect(tracker, key=3), expect(tracker, key=4)
+
+    assert tracker.resolve(DPID, OPCODE, 'stage 4', key=4)
+    assert second.result(0) == 'stage 4'
+    assert not first.done()
+
+def test_keyed_reply_goes_to_the_oldest_keyless_request():
+    """
+    A poll sent before a browser read owns the first reply, even if it names the table the browser reads.
+    """
+    tracker = replies.ReplyTracker()
+    poll, browse = expect(tracker), expect(tracker)
+
+    assert tracker.resolve(DPID, OPCODE, 'monitor of the poll', key='monitor')
+    assert poll.result(0) == 'monitor of the poll'
+    assert not browse.done()
+
+def test_error_reply_is_never_handed_to_a_keyed_request():
+    tracker = replies.ReplyTracker()
+    keyed = expect(tracker, key='monitor')
+
+    assert not tracker.resolve(DPID, OPCODE, 'TABLE_NOT_FOUND')
+    assert not keyed.done()
+
+def test_error_reply_goes_to_the_oldest_request_only():
+    tracker = replies.ReplyTracker()
+    first, second = expect(tracker), expect(tracker)
+
+    assert tracker.resolve(DPID, OPCODE, 'TABLE_NOT_FOUND')
+    assert first.result(0) == 'TABLE_NOT_FOUND'
+    assert not second.done()
+
+def test_reply_of_a_timed_out_request_is_left_to_the_handlers():
+    tracker = replies.ReplyTracker()
+    timed_out, waiting = expect(tracker), expect(tracker)
+    timed_out.cancel()
+
+    assert not tracker.resolve(DPID, OPCODE, 'late')
+    assert tracker.resolve(DPID, OPCODE, 'on time')
+    assert waiting.result(0) == 'on time'
+
+def test_replies_are_matched_per_switch_and_type():
+    tracker = replies.ReplyTracker()
+    future = expect(tracker)
+
+    assert not tracker.resolve(DPID + 1, OPCODE, 'other switch')
+    assert not tracker.resolve(DPID, 'TABLE_ENTRY_GET_REPLY', 'other type')
+    assert not future.done()
+
+def test_fail_fails_every_request_of_a_switch():
+    tracker = replies.ReplyTracker()
+    future, other = expect(tracker), tracker.expect(DPID + 1, OPCODE)
+
+    tracker.fail(DPID, 'connection lost')
+    with pytest.raises(ConnectionError):
+        future.result(0)
+    assert not other.done()
+
+def test_reply_of_a_request_left_to_the_handlers_keeps_the_send_order():
+    """
+    A telemetry poll sent before a browser read: its reply goes to the regular handlers, the next one to the browser.
+    """
+    tracker = replies.ReplyTracker()
+    assert tracker.expect(DPID, OPCODE, handlers=True) is None
+    browse = expect(tracker)
+
+    assert not tracker.resolve(DPID, OPCODE, 'monitor of the poll', key='monitor')
+    assert not browse.done()
+    assert tracker.resolve(DPID, OPCODE, 'monitor of the browser', key='monitor')
+    assert browse.result(0) == 'monitor of the browser'
+
+def test_fail_skips_requests_left_to_the_handlers():
+    tracker = replies.ReplyTracker()
+    tracker.expect(DPID, OPCODE, handlers=True)
+    future = expect(tracker)
+
+    tracker.fail(DPID, 'connection lost')
+    with pytest.raises(ConnectionError):
+        future.result(0)
@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from sqlalchemy import func, insert
+
+def add_device(db):
+    from shared.models import Device
+    device = Device(name='s1', device_type='switch', dpid=1, status='connected')
+    db.session.add(device)
+    db.session.commit()
+    return device.id
+
+def sample(device_id, timestamp, bandwidth):
+    return {'timestamp': timestamp, 'device_id': device_id, 'mac_address': '00:00:00:00:00:01', 'bandwidth': bandwidth}
+
+def rolled_up_samples(db):
+    from shared.models import MonitoringRollup
+    return db.session.query(func.sum(MonitoringRollup.samples)).filter(MonitoringRollup.resolution == 60).scalar() or 0
+
+def test_row_committed_after_a_higher_id_is_rolled_up(database_app):
+    """
+    Worker A takes an ID, worker B takes the next one and commits first: the rollup pass must not move
+    the high-water mark past A's row before it is committed.
+    """
+    from shared import db
+    from shared.models import MonitoringData, RollupState
+    from rollups import RollupEngine, utcnow
+
+    device_id = add_device(db)
+    timestamp = utcnow()
+
+    # Worker A inserts first and keeps its transaction open
+    worker_a = db.engine.connect()
+    transaction = worker_a.begin()
+    first_id = worker_a.execute(insert(MonitoringData).values(sample(device_id, timestamp, 100)).returning(MonitoringData.id)).scalar()
+
+    # Worker B inserts after A and commits first
+    db.session.execute(insert(MonitoringData).values(sample(device_id, timestamp, 200)))
+    db.session.commit()
+
+    engine = RollupEngine(database_app)
+    errors = []
+    def run():
+        with database_app.app_context():
+            try:
+                engine.run_once()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+    thread = threading.Thread(target=run)
+    thread.start()
+    time.sleep(0.3)
+    # The pass waits for A instead of rolling up B alone
+    assert thread.is_alive()
+    transaction.commit()
+    worker_a.close()
+    thread.join(5)
+
+    assert not errors
+    db.session.expire_all()
+    assert rolled_up_samples(db) == 2
+    assert db.session.get(RollupState, MonitoringData.__tablename__).high_water_id == first_id + 1
+
+def test_rollup_postponed_while_insert_in_flight(database_app):
+    """
+    When the in-flight insert outlasts the lock timeout, the pass is postponed and rolls up both rows later.
+    """
+    from shared import db
+    from shared.models import MonitoringData, RollupState
+    from rollups import RollupEngine, utcnow
+
+    device_id = add_device(db)
+    timestamp = utcnow()
+
+    worker_a = db.engine.connect()
+    transaction = worker_a.begin()
+    worker_a.execute(insert(MonitoringData).values(sample(device_id, timestamp, 100)))
+    db.session.execute(insert(MonitoringData).values(sample(device_id, timestamp, 200)))
+    db.session.commit()
+
+    engine = RollupEngine(database_app)
+    engine.lock_timeout = 0.2
+    engine.run_once()
+    state = db.session.get(RollupState, MonitoringData.__tablename__)
+    assert state is None or state.high_water_id == 0
+    assert rolled_up_samples(db) == 0
+
+    transaction.commit()
+    worker_a.close()
+    engine.run_once()
+    db.session.expire_all()
+    assert rolled_up_samples(db) == 2
+
+def test_expired_range_past_the_high_water_mark_reads_the_raw_tail(database_app):
+    from datetime import timedelta
+    from shared import db
+    from shared.models import MonitoringData, RollupState
+    from rollups import choose_resolution, utcnow
+
+    high_water = utcnow().replace(minute=30, second=15, microsecond=0) - timedelta(hours=1)
+    db.session.add(RollupState(source=MonitoringData.__tablename__, high_water_id=1, high_water_timestamp=high_water))
+    db.session.commit()
+    expired = utcnow() - timedelta(days=database_app.config['RETENTION_RAW_DAYS'] + 1)
+
+    # Open range: the rollups answer up to the start of the minute bucket holding the mark
+    assert choose_resolution(MonitoringData.__tablename__, 60, 'avg', expired, None, database_app.config) == (60, high_water.replace(second=0))
+    # Range ending before the mark: rollups only
+    assert choose_resolution(MonitoringData.__tablename__, 60, 'avg', expired, high_water, database_app.config) == (60, None)
+    # Recent range: raw rows only
+    assert choose_resolution(MonitoringData.__tablename__, 60, 'avg', utcnow() - timedelta(minutes=5), None, database_app.config) == (None, None)
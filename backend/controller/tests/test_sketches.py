@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+def add_device(db):
+    from shared.models import Device
+    device = Device(name='s1', device_type='switch', dpid=1, status='connected')
+    db.session.add(device)
+    db.session.commit()
+    return device.id
+
+def stored_samples(db):
+    from shared.models import BandwidthSketch
+    return {row.mac_address: row.samples for row in db.session.query(BandwidthSketch).all()}
+
+def test_failed_flush_keeps_the_closed_buckets(database_app, monkeypatch):
+    from shared import db
+    from sketches import BandwidthSketches, SWITCH_SERIES
+
+    device_id = add_device(db)
+    sketches = BandwidthSketches(database_app)
+    closed = datetime.now(timezone.utc) - timedelta(seconds=2 * sketches.bucket)
+    sketches.observe(device_id, closed, {'00:00:00:00:00:01': 100.0, '00:00:00:00:00:02': 200.0})
+
+    def lost_connection():
+        raise RuntimeError('connection lost')
+    monkeypatch.setattr(db.session, 'commit', lost_connection)
+    sketches.flush()
+    monkeypatch.undo()
+
+    assert len(sketches.open) == 3
+    assert stored_samples(db) == {}
+
+    # Samples arriving meanwhile are merged with the kept sketches
+    sketches.observe(device_id, closed, {'00:00:00:00:00:01': 300.0})
+    sketches.flush()
+    assert sketches.open == {}
+    assert stored_samples(db) == {'00:00:00:00:00:01': 2, '00:00:00:00:00:02': 1, SWITCH_SERIES: 2}
+
+def test_flush_merges_with_the_stored_sketches(database_app):
+    from shared import db
+    from sketches import BandwidthSketches
+
+    device_id = add_device(db)
+    sketches = BandwidthSketches(database_app)
+    closed = datetime.now(timezone.utc) - timedelta(seconds=2 * sketches.bucket)
+
+    sketches.observe(device_id, closed, {'00:00:00:00:00:01': 100.0})
+    sketches.flush()
+    sketches.observe(device_id, closed, {'00:00:00:00:00:01': 200.0})
+    sketches.flush()
+
+    assert stored_samples(db)['00:00:00:00:00:01'] == 2
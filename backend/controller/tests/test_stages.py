@@ -0,0 +1,30 @@
+from types import SimpleNamespace
+
+from stages import FunctionStages
+
+def entry(index, name):
+    return SimpleNamespace(index=index, name=name)
+
+def test_stage_follows_the_switch_pipeline():
+    stages = FunctionStages('ddos_auto_mitigation')
+    stages.stages_listed(1, [entry(0, 'monitoring'), entry(1, 'learning'), entry(2, 'ddos_auto_mitigation')])
+    assert stages.copy() == {1: 2}
+
+    # Removing a stage before it moves it down, replacing it forgets it
+    stages.stage_removed(1, 0)
+    assert stages.copy() == {1: 1}
+    stages.stage_added(1, 1, 'goose_analyser')
+    assert stages.copy() == {}
+
+    stages.stage_added(1, 3, 'ddos_auto_mitigation')
+    stages.stage_removed(1, 3)
+    assert stages.copy() == {}
+
+def test_listed_pipeline_overrides_the_followed_stage():
+    stages = FunctionStages('goose_analyser')
+    stages.stage_added(1, 4, 'goose_analyser')
+    stages.stage_added(2, 0, 'goose_analyser')
+
+    stages.stages_listed(1, [entry(0, 'goose_analyser'), entry(1, 'goose_analyser')])
+    stages.stages_listed(2, [entry(0, 'monitoring')])
+    assert stages.items() == [(1, 0)]
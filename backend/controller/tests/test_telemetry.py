@@ -0,0 +1,132 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('flask_sqlalchemy')
+
+from flask import Flask
+from sqlalchemy import Column, DateTime, Float, Integer, MetaData, String, Table
+
+from shared import db
+from telemetry import bucket_keyset, bucket_page, decode_bucket_cursor, keyset_page, union_buckets
+
+metadata = MetaData()
+
+samples = Table(
+    'samples', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('timestamp', DateTime, nullable=False),
+    Column('bandwidth', Integer, nullable=False),
+)
+
+# Already bucketed rows, standing in for the output of bucketed() which needs PostgreSQL
+buckets = Table(
+    'buckets', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('bucket', Float, nullable=False),
+    Column('device_id', Integer, nullable=False),
+    Column('mac_address', String(17), nullable=False),
+    Column('bandwidth', Float, nullable=False),
+)
+
+Row = namedtuple('Row', ['bucket', 'device_id', 'mac_address'])
+
+@pytest.fixture
+def sqlite_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        metadata.create_all(db.engine)
+        yield app
+        db.session.remove()
+
+def test_bucket_page_last_page_has_no_cursor():
+    rows = [Row(60, 1, 'a'), Row(60, 1, 'b')]
+    assert bucket_page(rows, 2, ['device_id', 'mac_address']) == (rows, None)
+
+def test_bucket_page_cursor_points_inside_the_bucket():
+    rows = [Row(60, 1, 'a'), Row(60, 1, 'b'), Row(60, 1, 'c')]
+    page, cursor = bucket_page(rows, 2, ['device_id', 'mac_address'])
+    assert page == rows[:2]
+    assert decode_bucket_cursor(cursor) == (60, [1, 'b'])
+
+def test_bucket_pages_do_not_drop_rows_of_large_buckets(sqlite_app):
+    rows = [
+        {'bucket': bucket, 'device_id': device_id, 'mac_address': f'00:00:00:00:00:{mac:02x}', 'bandwidth': mac}
+        for bucket in (0, 60, 120)
+        for device_id in (1, 2)
+        for mac in range(7)
+    ]
+    db.session.execute(buckets.insert(), rows)
+    keys = ['device_id', 'mac_address']
+    query = db.session.query(buckets.c.bucket, buckets.c.device_id, buckets.c.mac_address, buckets.c.bandwidth)
+
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = bucket_page(bucket_keyset(query, keys, cursor).limit(6).all(), 5, keys)
+        seen.extend((row.bucket, row.device_id, row.mac_address) for row in page)
+        if cursor is None:
+            break
+
+    expected = sorted(((row['bucket'], row['device_id'], row['mac_address']) for row in rows), key=lambda row: (-row[0], row[1], row[2]))
+    assert seen == expected
+
+def test_bucket_keyset_rejects_mismatched_cursor(sqlite_app):
+    query = db.session.query(buckets.c.bucket, buckets.c.device_id)
+    page, cursor = bucket_page([Row(60, 1, 'a'), Row(0, 1, 'a')], 1, ['device_id', 'mac_address'])
+    with pytest.raises(ValueError):
+        bucket_keyset(query, ['device_id'], cursor)
+    with pytest.raises(ValueError):
+        bucket_keyset(query, ['device_id'], 'not a cursor')
+
+def test_keyset_page_walks_ties_newest_first(sqlite_app):
+    start = datetime(2024, 1, 1)
+    # Two rows per timestamp, so pages have to break ties on the ID
+    db.session.execute(samples.insert(), [{'timestamp': start + timedelta(seconds=i // 2), 'bandwidth': i} for i in range(11)])
+    query = db.session.query(samples)
+
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = keyset_page(query, samples.c.timestamp, samples.c.id, cursor, 3)
+        assert len(page) <= 3
+        seen.extend(row.id for row in page)
+        if cursor is None:
+            break
+
+    assert seen == list(range(11, 0, -1))
+
+def test_keyset_page_rejects_malformed_cursor(sqlite_app):
+    with pytest.raises(ValueError):
+        keyset_page(db.session.query(samples), samples.c.timestamp, samples.c.id, 'garbage', 3)
+
+def test_union_buckets_pages_over_both_ranges(sqlite_app):
+    """
+    Rollup buckets before the raw tail and raw buckets from it on are paged as one series.
+    """
+    rows = [
+        {'bucket': bucket, 'device_id': 1, 'mac_address': f'00:00:00:00:00:{mac:02x}', 'bandwidth': mac}
+        for bucket in (0, 60, 120, 180)
+        for mac in range(3)
+    ]
+    db.session.execute(buckets.insert(), rows)
+    keys = ['device_id', 'mac_address']
+
+    def part(condition):
+        return db.session.query(buckets.c.bucket, buckets.c.device_id, buckets.c.mac_address, buckets.c.bandwidth).filter(
+            condition
+        ).order_by(buckets.c.bucket.desc())
+    query = union_buckets(part(buckets.c.bucket < 120), part(buckets.c.bucket >= 120))
+
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = bucket_page(bucket_keyset(query, keys, cursor).limit(5).all(), 4, keys)
+        seen.extend((row.bucket, row.mac_address) for row in page)
+        if cursor is None:
+            break
+
+    assert seen == sorted(((row['bucket'], row['mac_address']) for row in rows), key=lambda row: (-row[0], row[1]))
@@ -0,0 +1,80 @@
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from sqlalchemy import text
+
+def save_topology(db, version):
+    """
+    Saves two switches and a link the way the network simulation does, recording its topology version.
+    """
+    from shared.models import Device, Link, TopologyState
+    first = Device(name='s1', device_type='switch', dpid=1, status='disconnected')
+    second = Device(name='s2', device_type='switch', dpid=2, status='disconnected')
+    db.session.add_all([first, second])
+    db.session.flush()
+    db.session.add(Link(source_device_id=first.id, destination_device_id=second.id, link_type='ethernet'))
+    db.session.merge(TopologyState(id=1, version=version))
+    db.session.commit()
+
+def test_same_topology_saved_after_a_reset_starts_a_new_version(database_app):
+    """
+    A reset restarts the table IDs, so saving the same topology again leaves the row counts and the
+    highest IDs unchanged: only the recorded version tells the cache it was rewritten.
+    """
+    from shared import db
+    from shared.models import TopologyState
+    from topology_cache import TopologyCache
+
+    cache = TopologyCache()
+    save_topology(db, 1)
+    version, _ = cache.get_snapshot()
+
+    db.session.execute(text('TRUNCATE TABLE links, device_functions, devices RESTART IDENTITY CASCADE'))
+    db.session.merge(TopologyState(id=1, version=2))
+    db.session.commit()
+    save_topology(db, 3)
+
+    new_version, _ = cache.get_snapshot()
+    assert new_version > version
+    assert cache.get_delta(version, cache.epoch) is None
+
+def test_unchanged_topology_keeps_its_version(database_app):
+    from shared import db
+    from topology_cache import TopologyCache
+
+    cache = TopologyCache()
+    save_topology(db, 1)
+    version, body = cache.get_snapshot()
+
+    assert cache.get_snapshot() == (version, body)
+    assert cache.get_delta(version, cache.epoch)['devices'] == []
+
+def test_first_topology_saved_after_startup_starts_a_new_version(database_app):
+    from shared import db
+    from topology_cache import TopologyCache
+
+    cache = TopologyCache()
+    version, _ = cache.get_snapshot()
+    save_topology(db, 1)
+
+    assert cache.refresh() > version
+
+def test_version_of_another_process_gets_a_full_snapshot(database_app):
+    """
+    Versions start over in every controller process: a version seen before a restart must not be
+    served as a delta, even when the new process already reached it.
+    """
+    from shared import db
+    from topology_cache import TopologyCache
+
+    save_topology(db, 1)
+    previous = TopologyCache()
+    version, _ = previous.get_snapshot()
+
+    cache = TopologyCache()
+    cache.get_snapshot()
+    assert cache.epoch != previous.epoch
+    assert cache.get_delta(version, previous.epoch) is None
+    assert cache.get_delta(version, None) is None
+    assert cache.get_delta(version, cache.epoch) is not None
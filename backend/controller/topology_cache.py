@@ -0,0 +1,241 @@
+import json
+import logging
+import threading
+import uuid
+
+from sqlalchemy.orm import selectinload
+
+from shared import db
+from shared.models import Device, Link, TopologyState
+from stream import broker
+
+class TopologyCache:
+    """
+    Versioned cache of the serialised network topology.
+
+    The controller bumps the version whenever it changes the topology (HELLO, disconnect, function
+    add/remove). Writes made by the network simulation happen in another process, which bumps the version in
+    the topology_state table in the same transaction, and the cache starts a new full version when it moves.
+    The version is checked on every request, and by a background thread (see watch) so that live stream
+    subscribers hear of the change without polling.
+
+    Versions count from 1 again in every controller process, so they are only meaningful together with
+    the epoch of the process, which is part of the ETag and must be given back with delta requests.
+
+    Attributes:
+        epoch: Random identifier of this process's version sequence.
+        version: Current topology version.
+        reset_version: Oldest version that can be served as a delta, anything older gets a full snapshot.
+        device_versions: Version at which each device (and its functions) last changed, mapped by device ID.
+        removed_devices: Version at which each device was removed, mapped by device ID.
+        simulation_version: Last seen topology version recorded by the network simulation.
+        snapshot: Tuple of (version, serialised JSON body) for the cached full snapshot.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.epoch = uuid.uuid4().hex[:12]
+        self.version = 1
+        self.reset_version = 1
+        self.device_versions = {}
+        self.removed_devices = {}
+        self.simulation_version = None
+        self.snapshot = None
+        self.stopped = threading.Event()
+
+    def watch(self, app):
+        """
+        Checks the topology version written by the network simulation in a background daemon thread, so
+        its changes reach the live stream subscribers even when no client requests the topology.
+
+        Args:
+            app: The Flask application instance for database context.
+
+        Returns:
+            Reference to the instance for further use.
+        """
+        interval = app.config['TOPOLOGY_WATCH_INTERVAL']
+
+        def run():
+            while not self.stopped.wait(interval):
+                with app.app_context():
+                    try:
+                        self.refresh()
+                    except Exception as e:
+                        logging.error(f"Error checking the topology version: {e}")
+                        db.session.rollback()
+        threading.Thread(target=run, daemon=True).start()
+        return self
+
+    def stop(self):
+        """
+        Stops watching the topology version.
+        """
+        self.stopped.set()
+
+    def bump(self, device_id=None, removed=False):
+        """
+        Moves the topology to a new version.
+
+        Args:
+            device_id: The ID of the device that changed, or None if the change is not tied to a device.
+            removed: True if the device was removed from the topology.
+
+        Returns:
+            The new topology version.
+        """
+        with self.lock:
+            self.version += 1
+            if device_id is not None:
+                if removed:
+                    self.device_versions.pop(device_id, None)
+                    self.removed_devices[device_id] = self.version
+                else:
+                    self.device_versions[device_id] = self.version
+                    self.removed_devices.pop(device_id, None)
+            version = self.version
+        logging.debug(f"Topology version bumped to {version} (device {device_id}).")
+        broker.publish('topology', {'epoch': self.epoch, 'version': version}, key='topology')
+        return version
+
+    def reset(self):
+        """
+        Invalidates all delta history, so every client gets a full snapshot on its next request.
+
+        Returns:
+            The new topology version.
+        """
+        with self.lock:
+            self.version += 1
+            self.reset_version = self.version
+            self.device_versions.clear()
+            self.removed_devices.clear()
+            version = self.version
+        logging.info(f"Topology reset to version {version}.")
+        broker.publish('topology', {'epoch': self.epoch, 'version': version}, key='topology')
+        return version
+
+    def refresh(self):
+        """
+        Compares the topology version recorded by the network simulation with the last one seen and
+        resets the cache if it moved. Runs a single primary key lookup.
+
+        Returns:
+            The current topology version.
+        """
+        # No row until the simulation first saved a topology
+        simulation_version = db.session.query(TopologyState.version).filter_by(id=1).scalar() or 0
+
+        with self.lock:
+            changed = self.simulation_version is not None and simulation_version != self.simulation_version
+            self.simulation_version = simulation_version
+        if changed:
+            return self.reset()
+        return self.version
+
+    @staticmethod
+    def serialise_device(device):
+        """
+        Serialises a device and its functions into a dictionary.
+        """
+        return {
+            'id': str(device.id),
+            'name': device.name,
+            'device_type': device.device_type,
+            'status': device.status,
+            'dpid': device.dpid,
+            'ip_address': device.ip_address,
+            'mac_address': device.mac_address,
+            'functions': [
+                {
+                    'id': func.id,
+                    'function_name': func.function_name,
+                    'status': func.status,
+                    'index': func.index
+                } for func in device.functions
+            ]
+        }
+
+    @staticmethod
+    def serialise_link(link):
+        """
+        Serialises a link into a dictionary.
+        """
+        return {
+            'id': str(link.id),
+            'source_device_id': str(link.source_device_id),
+            'destination_device_id': str(link.destination_device_id),
+            'link_type': link.link_type,
+        }
+
+    def get_snapshot(self):
+        """
+        Returns the full topology snapshot for the current version, building it only if the cached one is stale.
+
+        Devices are loaded together with their functions in two queries instead of one query per device.
+        The snapshot holds no link utilization, which moves with every poll, so it stays valid (and
+        revalidates) for as long as the topology version does.
+
+        Returns:
+            Tuple of (version, serialised JSON body).
+        """
+        version = self.refresh()
+        with self.lock:
+            if self.snapshot and self.snapshot[0] == version:
+                return self.snapshot
+
+        devices = Device.query.options(selectinload(Device.functions)).order_by(Device.id).all()
+        body = json.dumps({
+            'epoch': self.epoch,
+            'version': version,
+            'full': True,
+            'devices': [self.serialise_device(device) for device in devices],
+            'links': [self.serialise_link(link) for link in Link.query.order_by(Link.id).all()],
+        })
+
+        with self.lock:
+            # Only keep the snapshot if nothing changed while it was being built
+            if self.version == version:
+                self.snapshot = (version, body)
+        return version, body
+
+    def get_delta(self, since, epoch, links=None):
+        """
+        Returns the devices and functions changed after the given version.
+
+        Args:
+            since: The version the client already has.
+            epoch: The epoch of that version, a version of another process is never served as a delta.
+            links: The LinkUtilization of the running controller, or None. The current utilization of
+                every link is then included, since it changes with every poll.
+
+        Returns:
+            A dictionary with the changed devices and removed device IDs, or None if the version is too old
+            (or from another epoch) to be served as a delta and the client needs a full snapshot.
+        """
+        version = self.refresh()
+        with self.lock:
+            if epoch != self.epoch or since < self.reset_version or since > version:
+                return None
+            changed_ids = [device_id for device_id, changed in self.device_versions.items() if changed > since]
+            removed_ids = [device_id for device_id, removed in self.removed_devices.items() if removed > since]
+
+        devices = []
+        if changed_ids:
+            devices = Device.query.options(selectinload(Device.functions)).filter(Device.id.in_(changed_ids)).order_by(Device.id).all()
+
+        delta = {
+            'epoch': self.epoch,
+            'version': version,
+            'since': since,
+            'devices': [self.serialise_device(device) for device in devices],
+            'removed_devices': [str(device_id) for device_id in removed_ids],
+            # Links are only written by the simulation, which always resets the cache
+            'links': [],
+        }
+        if links is not None:
+            utilization = links.snapshot()
+            delta['link_utilization'] = {str(link_id): link for link_id, link in utilization.items()}
+        return delta
+
+# Shared topology cache for the controller and its routes
+topology_cache = TopologyCache()
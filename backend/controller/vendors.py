@@ -0,0 +1,248 @@
+import csv
+import logging
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left
+
+# Prefix lengths of the MA-S, MA-M and MA-L registries, longest first
+PREFIX_BITS = (36, 28, 24)
+
+# Magic, format version, number of prefixes of each length, number of vendors and size of the name table
+INDEX_HEADER = struct.Struct('<4sI3III4x')
+INDEX_MAGIC = b'OUIX'
+INDEX_VERSION = 1
+
+# Vendors known without a registry, the IEDs of the testbed
+BUILTIN_VENDORS = {
+    0x30b216: 'Hitachi',
+    0xb4b15a: 'Siemens',
+}
+
+def mac_to_int(mac):
+    """
+    Converts a MAC address, raw bytes or hex with or without separators, to a 48-bit integer.
+
+    Raises:
+        ValueError: If the address is not 6 bytes long.
+    """
+    if isinstance(mac, (bytes, bytearray)):
+        raw = bytes(mac)
+    else:
+        raw = bytes.fromhex(mac.replace(':', '').replace('-', '').replace('.', ''))
+    if len(raw) != 6:
+        raise ValueError(f'invalid MAC address: {mac!r}')
+    return int.from_bytes(raw, 'big')
+
+def read_registries(paths):
+    """
+    Reads IEEE registry exports (oui.csv, mam.csv and oui36.csv, with the "Registry,Assignment,
+    Organization Name,Organization Address" columns). The prefix length of an assignment is given by
+    its number of hex digits, so the three files can be given in any order, or concatenated.
+
+    Returns:
+        Vendor names mapped by (prefix length, prefix).
+    """
+    assignments = {}
+    for path in paths:
+        with open(path, newline='', encoding='utf-8', errors='replace') as f:
+            for row in csv.reader(f):
+                if len(row) < 3:
+                    continue
+                assignment = row[1].strip()
+                bits = len(assignment) * 4
+                if bits not in PREFIX_BITS:
+                    continue
+                try:
+                    prefix = int(assignment, 16)
+                except ValueError:
+                    # Header row
+                    continue
+                assignments[(bits, prefix)] = ' '.join(row[2].split())
+    return assignments
+
+def build_index(assignments, path):
+    """
+    Writes the prefix index of the given assignments.
+
+    The index holds, for each prefix length, the sorted prefixes as 64-bit integers followed by the
+    vendor number of each prefix, then the offsets of the vendor names in a UTF-8 name table. Every
+    array is 8-byte aligned and in native byte order, so a reader maps the file and uses the arrays in
+    place. The file is written under a temporary name and renamed, so readers never see a partial index.
+    """
+    names = {}
+    levels = {bits: [] for bits in PREFIX_BITS}
+    for (bits, prefix), name in assignments.items():
+        levels[bits].append((prefix, names.setdefault(name, len(names))))
+
+    table = bytearray()
+    offsets = array('I')
+    for name in names:
+        offsets.append(len(table))
+        table += name.encode('utf-8')
+    offsets.append(len(table))
+
+    prefixes = []
+    vendors = []
+    for bits in PREFIX_BITS:
+        entries = sorted(levels[bits])
+        prefixes.append(array('Q', (prefix for prefix, _ in entries)))
+        vendors.append(array('I', (vendor for _, vendor in entries)))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, *(len(level) for level in prefixes), len(names), len(table)))
+        for level in prefixes:
+            f.write(level.tobytes())
+        for level in vendors + [offsets]:
+            data = level.tobytes()
+            f.write(data + bytes(-len(data) % 8))
+        f.write(table)
+    os.replace(temporary, path)
+
+class VendorDatabase:
+    """
+    Offline MAC vendor classification from the IEEE MA-L, MA-M and MA-S registries.
+
+    The registries are compiled once into a binary prefix index (see build_index), rebuilt when a
+    registry file is newer than it. The index is memory mapped read-only, so the processes of the
+    controller share a single copy of it in the page cache, and lookups search the mapped arrays
+    directly without loading them. An address is looked up as its 36, 28 and 24-bit prefix in turn,
+    a binary search each, so the most specific assignment wins; results are cached per MAC.
+
+    Without any registry, the built-in vendors are used.
+
+    Attributes:
+        registries: Paths of the registry CSV files.
+        index_path: Path of the compiled index.
+        prefixes: Number of prefixes of each length in the index.
+    """
+    def __init__(self, registries, index_path, cache_size=65536):
+        self.registries = registries
+        self.index_path = index_path
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.mapped = None
+        self.levels = []
+        self.offsets = None
+        self.names = None
+        self.prefixes = {}
+        self.cache = {}
+
+    def load(self):
+        """
+        Maps the index, compiling it first if it is missing or older than a registry.
+
+        Returns:
+            Reference to the instance for further use.
+        """
+        registries = [path for path in self.registries if os.path.isfile(path)]
+        for path in set(self.registries) - set(registries):
+            logging.warning(f"OUI registry {path} not found.")
+        if not registries:
+            logging.warning("No OUI registry available, only the built-in vendors are known.")
+            return self
+
+        try:
+            newest = max(os.path.getmtime(path) for path in registries)
+            if not os.path.isfile(self.index_path) or os.path.getmtime(self.index_path) < newest:
+                assignments = read_registries(registries)
+                build_index(assignments, self.index_path)
+                logging.info(f"OUI index {self.index_path} built from {len(assignments)} assignments.")
+            self.map()
+        except (OSError, ValueError, struct.error) as e:
+            logging.error(f"Error loading the OUI index: {e}")
+        return self
+
+    def map(self):
+        """
+        Maps the index file and casts its arrays in place.
+
+        Raises:
+            ValueError: If the file is not an index of this version.
+        """
+        with open(self.index_path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(mapped)
+        magic, version, *counts, n_vendors, table_size = INDEX_HEADER.unpack_from(view)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            view.release()
+            mapped.close()
+            raise ValueError(f'{self.index_path} is not an OUI index of version {INDEX_VERSION}')
+
+        offset = INDEX_HEADER.size
+        prefixes = []
+        for count in counts:
+            prefixes.append(view[offset:offset + 8 * count].cast('Q'))
+            offset += 8 * count
+        vendors = []
+        for count in counts + [n_vendors + 1]:
+            vendors.append(view[offset:offset + 4 * count].cast('I'))
+            offset += 4 * count + (-4 * count % 8)
+        names = view[offset:offset + table_size]
+
+        with self.lock:
+            self.mapped = mapped
+            self.levels = list(zip(PREFIX_BITS, prefixes, vendors))
+            self.offsets = vendors[-1]
+            self.names = names
+            self.prefixes = {bits: count for bits, count in zip(PREFIX_BITS, counts)}
+            self.cache.clear()
+
+    def lookup(self, mac):
+        """
+        Returns the vendor of a MAC address and the length of the matching prefix.
+
+        Args:
+            mac: Raw bytes or hex string of the MAC address.
+
+        Returns:
+            Tuple of (vendor name, prefix length in bits), or None if the vendor is unknown.
+
+        Raises:
+            ValueError: If the address is not a MAC address.
+        """
+        value = mac_to_int(mac)
+        result = self.cache.get(value, False)
+        if result is not False:
+            return result
+
+        result = None
+        for bits, prefixes, vendors in self.levels:
+            prefix = value >> (48 - bits)
+            i = bisect_left(prefixes, prefix)
+            if i < len(prefixes) and prefixes[i] == prefix:
+                start, end = self.offsets[vendors[i]], self.offsets[vendors[i] + 1]
+                result = (bytes(self.names[start:end]).decode('utf-8'), bits)
+                break
+        if result is None and (value >> 24) in BUILTIN_VENDORS:
+            result = (BUILTIN_VENDORS[value >> 24], 24)
+
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[value] = result
+        return result
+
+    def vendor(self, mac, default='unknown'):
+        """
+        Returns the vendor name of a MAC address, or default if it is unknown or not a MAC address.
+        """
+        try:
+            result = self.lookup(mac)
+        except ValueError:
+            return default
+        return result[0] if result else default
+
+    def status(self):
+        """
+        Returns the index path and the number of prefixes of each length.
+        """
+        return {
+            'index': self.index_path if self.mapped is not None else None,
+            'registries': self.registries,
+            'prefixes': {f'{bits}-bit': count for bits, count in self.prefixes.items()},
+            'cached': len(self.cache),
+        }
@@ -3,6 +3,7 @@ from flask_migrate import Migrate
 from shared import db
 from shared.models import * # Import all models to ensure migrations include them 
 from shared.config import Config
+from shared.partitions import PARTITIONED_TABLES, convert_to_partitioned, ensure_partitions
 
 # Create a Flask application instance
 app = Flask(__name__)
@@ -17,4 +18,16 @@ db.init_app(app)
 migrate = Migrate(app, db)
 
 # This file serves as the entry point for database management commands, such as migrations.
-# To create or apply migrations, you can use Flask-Migrate commands with this setup.
\ No newline at end of file
+# To create or apply migrations, you can use Flask-Migrate commands with this setup.
+
+@app.cli.command('partition-telemetry')
+def partition_telemetry():
+    """
+    Migrates the telemetry tables to daily range partitioning and creates the upcoming partitions.
+
+    Existing rows are kept in a legacy partition. Set TELEMETRY_PARTITIONING=true afterwards so new
+    migrations are generated against the partitioned tables.
+    """
+    for table in PARTITIONED_TABLES:
+        convert_to_partitioned(table)
+        ensure_partitions(table, app.config['TELEMETRY_PARTITION_DAYS_AHEAD'])
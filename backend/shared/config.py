@@ -12,6 +12,79 @@ class Config:
         SECRET_KEY (str): Secret key for Flask application security.
         SQLALCHEMY_TRACK_MODIFICATIONS (bool): Disable SQLAlchemy modification tracking to save resources.
         SQLALCHEMY_DATABASE_URI (str): URI for connecting to the PostgreSQL database.
+        STREAM_MAX_PENDING (int): Maximum number of coalesced updates buffered per live stream client.
+        TOPOLOGY_WATCH_INTERVAL (float): Seconds between checks of the topology version written by the network simulation.
+        ROLLUP_INTERVAL (int): Seconds between two telemetry rollup and retention passes.
+        ROLLUP_BATCH_SIZE (int): Maximum number of raw rows rolled up in one transaction.
+        ROLLUP_LOCK_TIMEOUT (float): Seconds a rollup pass waits for in-flight telemetry inserts before postponing.
+        RETENTION_DELETE_BATCH (int): Maximum number of expired rows deleted in one transaction.
+        RETENTION_RAW_DAYS (float): Retention of raw monitoring and asset discovery rows.
+        RETENTION_1M_DAYS (float): Retention of 1 minute rollups.
+        RETENTION_1H_DAYS (float): Retention of 1 hour rollups.
+        TELEMETRY_PARTITION_DAYS_AHEAD (int): Number of future daily partitions created for partitioned telemetry tables.
+        TELEMETRY_PARTITION_DETACH_ONLY (bool): Detach expired telemetry partitions instead of dropping them.
+        ASSET_HISTORY_BYTES_DELTA (int): Byte counter change that triggers a new asset history row.
+        ASSET_HISTORY_PACKETS_DELTA (int): Packet counter change that triggers a new asset history row.
+        ASSET_DUMP_MIN_INTERVAL (float): Minimum seconds between two asset discovery table requests to a switch.
+        MONITORING_POLL_INTERVAL (float): Seconds between two monitor table requests to a switch running the monitoring function.
+        FUNCTIONS_DIR (str): Directory holding the compiled eBPF function objects.
+        ARTIFACT_SCAN_INTERVAL (float): Seconds between two scans of the functions directory for changes.
+        ROLLOUT_MAX_IN_FLIGHT (int): Maximum number of switches a bulk install or removal waits on at the same time.
+        ROLLOUT_TIMEOUT (float): Default seconds a bulk install or removal waits for each switch to reply.
+        RECONCILE_DELAY (float): Seconds to collect reconnecting switches before reconciling them as a batch.
+        DDOS_MITIGATION_ENABLED (bool): Block DDoS sources automatically from the monitoring samples.
+        DDOS_BLOCK_RATE (float): Smoothed rate in bytes per second at which a source MAC is blocked.
+        DDOS_RELEASE_RATE (float): Smoothed rate in bytes per second under which a blocked MAC cools down.
+        DDOS_EWMA_ALPHA (float): Weight of a new sample in the smoothed rate (0 to 1).
+        DDOS_COOLDOWN (float): Seconds a blocked MAC has to stay under the release rate before it is released.
+        DDOS_DECISION_HISTORY (int): Number of recent mitigation decisions kept in memory.
+        TABLE_WRITE_WINDOW (int): Maximum number of table entry requests waiting for a reply on a switch.
+        TABLE_WRITE_TIMEOUT (float): Default seconds a table entry request waits for its reply.
+        TABLE_READ_TIMEOUT (float): Seconds a table browser request waits for the switch to reply.
+        TABLE_CACHE_TTL (float): Seconds a table read is served to other dashboard users from the cache.
+        PACKET_IN_RATE (float): Sustained PACKET_IN messages per second handled for each switch.
+        PACKET_IN_BURST (int): Number of PACKET_IN messages a switch may send at once above the sustained rate.
+        PACKET_IN_LATENCY_SAMPLES (int): Number of recent packet-in to packet-out latencies kept for percentiles.
+        CAPTURE_ENABLED (bool): Capture the frames of PACKET_IN messages (off by default).
+        CAPTURE_DIR (str): Directory the rotating pcap files are written to.
+        CAPTURE_RING_SIZE (int): Number of recent frames kept in memory for each switch.
+        CAPTURE_FILTER (str): Default capture filter (pcap-filter subset, e.g. "tcp and port 502").
+        CAPTURE_SAMPLE_RATE (float): Default fraction (0 to 1) of the captured frames persisted to disk, raised per switch with /captures.
+        CAPTURE_FILE_BYTES (int): Size at which a switch's pcap file is rotated.
+        CAPTURE_MAX_FILES (int): Number of pcap files kept for each switch, older ones are deleted with their index rows.
+        CAPTURE_QUEUE_SIZE (int): Number of sampled frames waiting to be written before new ones are dropped.
+        CAPTURE_FLUSH_INTERVAL (float): Seconds between writes of the packet index rows.
+        CAPTURE_EXPORT_LIMIT (int): Maximum number of packets in a pcap export.
+        GOOSE_POLL_INTERVAL (float): Seconds between polls of the goose_analyser tables.
+        GOOSE_MAX_ST_STEP (int): Largest stNum increase between two polls reported as a gap rather than a jump.
+        GOOSE_ALERT_COOLDOWN (float): Seconds before the same anomaly of a GOOSE publisher is raised again.
+        GOOSE_ANOMALY_HISTORY (int): Number of recent GOOSE anomalies kept in memory.
+        CONTROLLER_CORE (str): Event loop serving the switch connections, "twisted" or "asyncio".
+        CONTROLLER_UVLOOP (bool): Run the asyncio core on uvloop when it is installed.
+        SCHEDULER_BUDGET (float): Seconds of message handling per reactor tick before I/O runs again.
+        SCHEDULER_QUANTUM (int): Telemetry messages handled per switch per round-robin turn (times its weight).
+        SCHEDULER_HIGH_WATER (int): Queued telemetry messages at which a switch connection stops being read.
+        TELEMETRY_WORKERS (int): Threads decoding and storing the telemetry tables off the reactor.
+        SNAPSHOT_PATH (str): File the controller's in-memory state is snapshotted to for warm restarts.
+        SNAPSHOT_INTERVAL (float): Seconds between state snapshots (0 disables them).
+        SNAPSHOT_MAX_AGE (float): Age in seconds over which a snapshot is not restored on startup.
+        TOP_TALKERS_CAPACITY (int): MACs counted by each top talkers summary, bounds their memory and the largest k.
+        TOP_TALKERS_K (int): Number of top talkers returned by default.
+        SKETCH_BUCKET_SECONDS (int): Time covered by each bandwidth quantile sketch.
+        SKETCH_RELATIVE_ACCURACY (float): Relative error bound of the bandwidth quantiles.
+        SKETCH_RETENTION_DAYS (int): Number of days bandwidth quantile sketches are kept.
+        ANOMALY_ALPHA (float): Weight of a new value in the EWMA baselines of the per MAC rates.
+        ANOMALY_Z_THRESHOLD (float): Deviation from the baseline, in standard deviations, raised as an anomaly.
+        ANOMALY_DEVICE_THRESHOLDS (str): Per switch thresholds overriding the default, as "dpid=threshold,...".
+        ANOMALY_WARMUP (int): Number of values of a series before it is scored.
+        ANOMALY_COOLDOWN (float): Seconds before the same series raises an anomaly again.
+        ANOMALY_MAX_EVENTS (int): Maximum number of anomaly events raised per poll of a switch, the rest is summed up.
+        ANOMALY_HISTORY (int): Number of recent anomalies kept in memory.
+        LINK_DEFAULT_CAPACITY_MBPS (float): Capacity of links stored without a bandwidth attribute (0 if unknown).
+        LINK_PEAK_WINDOW (float): Seconds the peak utilization of a link is kept before it decays to the current one.
+        OUI_REGISTRIES (str): Comma separated IEEE MA-L, MA-M and MA-S registry CSV files used to classify MAC vendors.
+        OUI_INDEX_PATH (str): Compiled prefix index of the OUI registries, shared by the controller processes.
+        SIM_PERSIST_DRY_RUN (bool): Roll back the devices and links of the simulated topology instead of saving them.
     """
     SECRET_KEY = os.environ.get('SECRET_KEY', 'bikram123') # Default secret key for development (An example for further secure development)
     SQLALCHEMY_TRACK_MODIFICATIONS = False # Disable modification tracking to improve performance
@@ -19,4 +92,119 @@ class Config:
     # Database URI for connecting to PostgreSQL
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     if not SQLALCHEMY_DATABASE_URI:
-        raise RuntimeError("DATABASE_URL not set. Please configure your PostgreSQL credentials.")
\ No newline at end of file
+        raise RuntimeError("DATABASE_URL not set. Please configure your PostgreSQL credentials.")
+
+    # Live update streaming
+    STREAM_MAX_PENDING = int(os.environ.get('STREAM_MAX_PENDING', 256))
+    TOPOLOGY_WATCH_INTERVAL = float(os.environ.get('TOPOLOGY_WATCH_INTERVAL', 2.0))
+
+    # Telemetry rollups and retention
+    ROLLUP_INTERVAL = int(os.environ.get('ROLLUP_INTERVAL', 60))
+    ROLLUP_BATCH_SIZE = int(os.environ.get('ROLLUP_BATCH_SIZE', 100000))
+    ROLLUP_LOCK_TIMEOUT = float(os.environ.get('ROLLUP_LOCK_TIMEOUT', 2.0))
+    RETENTION_DELETE_BATCH = int(os.environ.get('RETENTION_DELETE_BATCH', 5000))
+    RETENTION_RAW_DAYS = float(os.environ.get('RETENTION_RAW_DAYS', 2))
+    RETENTION_1M_DAYS = float(os.environ.get('RETENTION_1M_DAYS', 30))
+    RETENTION_1H_DAYS = float(os.environ.get('RETENTION_1H_DAYS', 365))
+
+    # Telemetry partitioning (enabled with TELEMETRY_PARTITIONING, see shared/partitions.py)
+    TELEMETRY_PARTITION_DAYS_AHEAD = int(os.environ.get('TELEMETRY_PARTITION_DAYS_AHEAD', 7))
+    TELEMETRY_PARTITION_DETACH_ONLY = os.environ.get('TELEMETRY_PARTITION_DETACH_ONLY', 'false').lower() in ('1', 'true', 'yes')
+
+    # Asset inventory
+    ASSET_HISTORY_BYTES_DELTA = int(os.environ.get('ASSET_HISTORY_BYTES_DELTA', 1000000))
+    ASSET_HISTORY_PACKETS_DELTA = int(os.environ.get('ASSET_HISTORY_PACKETS_DELTA', 1000))
+    ASSET_DUMP_MIN_INTERVAL = float(os.environ.get('ASSET_DUMP_MIN_INTERVAL', 1.0))
+
+    # Monitoring
+    MONITORING_POLL_INTERVAL = float(os.environ.get('MONITORING_POLL_INTERVAL', 1.0))
+
+    # Function artifacts
+    FUNCTIONS_DIR = os.environ.get('FUNCTIONS_DIR', '../functions')
+    ARTIFACT_SCAN_INTERVAL = float(os.environ.get('ARTIFACT_SCAN_INTERVAL', 2.0))
+
+    # Bulk function rollouts
+    ROLLOUT_MAX_IN_FLIGHT = int(os.environ.get('ROLLOUT_MAX_IN_FLIGHT', 32))
+    ROLLOUT_TIMEOUT = float(os.environ.get('ROLLOUT_TIMEOUT', 5.0))
+    RECONCILE_DELAY = float(os.environ.get('RECONCILE_DELAY', 0.5))
+
+    # DDoS mitigation
+    DDOS_MITIGATION_ENABLED = os.environ.get('DDOS_MITIGATION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    DDOS_BLOCK_RATE = float(os.environ.get('DDOS_BLOCK_RATE', 1000000))
+    DDOS_RELEASE_RATE = float(os.environ.get('DDOS_RELEASE_RATE', 100000))
+    DDOS_EWMA_ALPHA = float(os.environ.get('DDOS_EWMA_ALPHA', 0.5))
+    DDOS_COOLDOWN = float(os.environ.get('DDOS_COOLDOWN', 60))
+    DDOS_DECISION_HISTORY = int(os.environ.get('DDOS_DECISION_HISTORY', 100))
+
+    # Table entry writes
+    TABLE_WRITE_WINDOW = int(os.environ.get('TABLE_WRITE_WINDOW', 64))
+    TABLE_WRITE_TIMEOUT = float(os.environ.get('TABLE_WRITE_TIMEOUT', 5.0))
+    TABLE_READ_TIMEOUT = float(os.environ.get('TABLE_READ_TIMEOUT', 5.0))
+    TABLE_CACHE_TTL = float(os.environ.get('TABLE_CACHE_TTL', 1.0))
+
+    # Centralized MAC learning
+    PACKET_IN_RATE = float(os.environ.get('PACKET_IN_RATE', 1000))
+    PACKET_IN_BURST = int(os.environ.get('PACKET_IN_BURST', 200))
+    PACKET_IN_LATENCY_SAMPLES = int(os.environ.get('PACKET_IN_LATENCY_SAMPLES', 4096))
+
+    # Packet capture
+    CAPTURE_ENABLED = os.environ.get('CAPTURE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+    CAPTURE_DIR = os.environ.get('CAPTURE_DIR', '../captures')
+    CAPTURE_RING_SIZE = int(os.environ.get('CAPTURE_RING_SIZE', 1024))
+    CAPTURE_FILTER = os.environ.get('CAPTURE_FILTER', '')
+    CAPTURE_SAMPLE_RATE = float(os.environ.get('CAPTURE_SAMPLE_RATE', 0.01))
+    CAPTURE_FILE_BYTES = int(os.environ.get('CAPTURE_FILE_BYTES', 64 * 1024 * 1024))
+    CAPTURE_MAX_FILES = int(os.environ.get('CAPTURE_MAX_FILES', 16))
+    CAPTURE_QUEUE_SIZE = int(os.environ.get('CAPTURE_QUEUE_SIZE', 10000))
+    CAPTURE_FLUSH_INTERVAL = float(os.environ.get('CAPTURE_FLUSH_INTERVAL', 1.0))
+    CAPTURE_EXPORT_LIMIT = int(os.environ.get('CAPTURE_EXPORT_LIMIT', 100000))
+
+    # GOOSE analysis
+    GOOSE_POLL_INTERVAL = float(os.environ.get('GOOSE_POLL_INTERVAL', 1.0))
+    GOOSE_MAX_ST_STEP = int(os.environ.get('GOOSE_MAX_ST_STEP', 3))
+    GOOSE_ALERT_COOLDOWN = float(os.environ.get('GOOSE_ALERT_COOLDOWN', 10.0))
+    GOOSE_ANOMALY_HISTORY = int(os.environ.get('GOOSE_ANOMALY_HISTORY', 100))
+
+    # Controller core
+    CONTROLLER_CORE = os.environ.get('CONTROLLER_CORE', 'twisted')
+    CONTROLLER_UVLOOP = os.environ.get('CONTROLLER_UVLOOP', 'false').lower() in ('1', 'true', 'yes')
+
+    # Inbound message scheduling
+    SCHEDULER_BUDGET = float(os.environ.get('SCHEDULER_BUDGET', 0.01))
+    SCHEDULER_QUANTUM = int(os.environ.get('SCHEDULER_QUANTUM', 32))
+    SCHEDULER_HIGH_WATER = int(os.environ.get('SCHEDULER_HIGH_WATER', 10000))
+    TELEMETRY_WORKERS = int(os.environ.get('TELEMETRY_WORKERS', 4))
+
+    # Warm restarts
+    SNAPSHOT_PATH = os.environ.get('SNAPSHOT_PATH', '../state/controller_snapshot.json')
+    SNAPSHOT_INTERVAL = float(os.environ.get('SNAPSHOT_INTERVAL', 5.0))
+    SNAPSHOT_MAX_AGE = float(os.environ.get('SNAPSHOT_MAX_AGE', 300))
+
+    # Top talkers
+    TOP_TALKERS_CAPACITY = int(os.environ.get('TOP_TALKERS_CAPACITY', 100))
+    TOP_TALKERS_K = int(os.environ.get('TOP_TALKERS_K', 10))
+
+    # Bandwidth quantile sketches
+    SKETCH_BUCKET_SECONDS = int(os.environ.get('SKETCH_BUCKET_SECONDS', 60))
+    SKETCH_RELATIVE_ACCURACY = float(os.environ.get('SKETCH_RELATIVE_ACCURACY', 0.01))
+    SKETCH_RETENTION_DAYS = int(os.environ.get('SKETCH_RETENTION_DAYS', 90))
+
+    # Baseline anomaly detection
+    ANOMALY_ALPHA = float(os.environ.get('ANOMALY_ALPHA', 0.1))
+    ANOMALY_Z_THRESHOLD = float(os.environ.get('ANOMALY_Z_THRESHOLD', 4.0))
+    ANOMALY_DEVICE_THRESHOLDS = os.environ.get('ANOMALY_DEVICE_THRESHOLDS', '')
+    ANOMALY_WARMUP = int(os.environ.get('ANOMALY_WARMUP', 30))
+    ANOMALY_COOLDOWN = float(os.environ.get('ANOMALY_COOLDOWN', 300))
+    ANOMALY_MAX_EVENTS = int(os.environ.get('ANOMALY_MAX_EVENTS', 10))
+    ANOMALY_HISTORY = int(os.environ.get('ANOMALY_HISTORY', 100))
+
+    # Link utilization
+    LINK_DEFAULT_CAPACITY_MBPS = float(os.environ.get('LINK_DEFAULT_CAPACITY_MBPS', 0))
+    LINK_PEAK_WINDOW = float(os.environ.get('LINK_PEAK_WINDOW', 300))
+
+    # MAC vendor classification
+    OUI_REGISTRIES = os.environ.get('OUI_REGISTRIES', '../oui/oui.csv,../oui/mam.csv,../oui/oui36.csv')
+    OUI_INDEX_PATH = os.environ.get('OUI_INDEX_PATH', '../state/oui.idx')
+
+    # Network simulation
+    SIM_PERSIST_DRY_RUN = os.environ.get('SIM_PERSIST_DRY_RUN', 'false').lower() in ('1', 'true', 'yes')
@@ -2,6 +2,18 @@ from . import db
 from sqlalchemy.dialects.postgresql import JSON, BYTEA
 from datetime import datetime
 from datetime import timezone
+import os
+
+# Telemetry tables are created range partitioned by day when enabled (see shared/partitions.py)
+TELEMETRY_PARTITIONING = os.environ.get('TELEMETRY_PARTITIONING', 'false').lower() in ('1', 'true', 'yes')
+
+def telemetry_table_args(*args):
+	"""
+	Returns the table arguments for a telemetry table, adding daily range partitioning on the timestamp when enabled.
+	"""
+	if TELEMETRY_PARTITIONING:
+		return (*args, {'postgresql_partition_by': 'RANGE ("timestamp")'})
+	return args
  
 # Device model for representing hosts and switches
 class Device(db.Model):
@@ -31,7 +43,7 @@ class Link(db.Model):
 	source_device_id = db.Column(db.Integer, db.ForeignKey('devices.id', ondelete='CASCADE'), nullable=False)
 	destination_device_id = db.Column(db.Integer, db.ForeignKey('devices.id', ondelete='CASCADE'), nullable=False)
 	link_type = db.Column(db.String(50), nullable=False) # Type of link (Hardcoded to Ethernet for now)
-	attributes = db.Column(JSON, nullable=True) # Additional link attributes (stays empty in the current implementation)
+	attributes = db.Column(JSON, nullable=True) # Additional link attributes, e.g. bandwidth_mbps of shaped links
 
 	# Relationships to devices
 	source_device = db.relationship('Device', foreign_keys=[source_device_id], backref='source_links')
@@ -62,6 +74,16 @@ class DeviceFunction(db.Model):
 	# Relationship with the Device table
 	device = db.relationship('Device', back_populates='functions')
 
+# FunctionPipeline model for storing the desired function pipeline of a switch or a group of devices
+class FunctionPipeline(db.Model):
+	__tablename__ = 'function_pipelines'
+
+	id = db.Column(db.Integer, primary_key=True)
+	dpid = db.Column(db.Integer, unique=True, nullable=True) # Switch the pipeline applies to (kept by DPID so it survives topology resets)
+	device_type = db.Column(db.String(50), unique=True, nullable=True) # Device group the pipeline applies to when no DPID is set
+	functions = db.Column(JSON, nullable=False) # Ordered list of function names, one per stage
+	updated_at = db.Column(db.DateTime, nullable=False) # Last time the pipeline was changed
+
 # EventLog model for recording events in the system
 class EventLog(db.Model):
 	__tablename__ = 'event_logs'
@@ -80,8 +102,9 @@ class EventLog(db.Model):
 class MonitoringData(db.Model):
 	__tablename__ = 'monitoring_data'
  
-	id = db.Column(db.Integer, primary_key=True)
-	timestamp = db.Column(db.DateTime, default=datetime.now(timezone.utc), nullable=False)
+	# The timestamp is part of the primary key so the table can be partitioned on it
+	id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+	timestamp = db.Column(db.DateTime, default=datetime.now(timezone.utc), primary_key=True, nullable=False)
 	device_id = db.Column(db.Integer, db.ForeignKey('devices.id', ondelete='CASCADE'), nullable=False)
 	mac_address = db.Column(db.String(17), nullable=False) # MAC address monitored
 	bandwidth = db.Column(db.Integer, nullable=False)  # Bandwidth usage in bytes per second
@@ -89,9 +112,10 @@ class MonitoringData(db.Model):
 	# Relationship to the Device model
 	device = db.relationship('Device', back_populates='monitoring_data')
 
-	# Ensure unique entries for monitoring data	
-	__table_args__ = (
+	# Ensure unique entries for monitoring data (also serves per MAC time range queries)
+	__table_args__ = telemetry_table_args(
     	db.UniqueConstraint('device_id', 'mac_address', 'timestamp', name='_monitoring_unique'),
+    	db.Index('ix_monitoring_device_timestamp', 'device_id', 'timestamp'),
 	)
  
 # GooseAnalysisData model (not implemented in this current version of the application)
@@ -118,19 +142,30 @@ class PacketCapture(db.Model):
 	id = db.Column(db.Integer, primary_key=True)
 	timestamp = db.Column(db.DateTime, default=datetime.now(timezone.utc), nullable=False)
 	device_id = db.Column(db.Integer, db.ForeignKey('devices.id', ondelete='CASCADE'), nullable=False)
-	packet_data = db.Column(BYTEA, nullable=False)
-	source_ip = db.Column(db.String(15), nullable=False)
-	destination_ip = db.Column(db.String(15), nullable=False)
+	packet_data = db.Column(BYTEA, nullable=True) # Unset for packets stored in a pcap file
+	source_ip = db.Column(db.String(15), nullable=True) # Unset for non IPv4 packets
+	destination_ip = db.Column(db.String(15), nullable=True)
+	source_mac = db.Column(db.String(17), nullable=True)
+	destination_mac = db.Column(db.String(17), nullable=True)
 	protocol = db.Column(db.String(20), nullable=False)
+	file_name = db.Column(db.String(255), nullable=True) # Pcap file holding the packet, relative to CAPTURE_DIR
+	file_offset = db.Column(db.BigInteger, nullable=True) # Offset of the packet record in the pcap file
+	length = db.Column(db.Integer, nullable=True) # Captured length of the frame
  
 	device = db.relationship('Device', back_populates='packet_captures')
+
+	__table_args__ = (
+    	db.Index('ix_packet_captures_device_timestamp', 'device_id', 'timestamp'),
+    	db.Index('ix_packet_captures_file_name', 'file_name'),
+	)
  
 # AssetDiscovery model for storing discovered assets
 class AssetDiscovery(db.Model):
 	__tablename__ = 'asset_discovery'
  
-	id = db.Column(db.Integer, primary_key=True)
-	timestamp = db.Column(db.DateTime, default=datetime.now(timezone.utc), nullable=False)
+	# The timestamp is part of the primary key so the table can be partitioned on it
+	id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+	timestamp = db.Column(db.DateTime, default=datetime.now(timezone.utc), primary_key=True, nullable=False)
 	switch_id = db.Column(db.Integer, db.ForeignKey('devices.id', ondelete='CASCADE'), nullable=False)
 	mac_address = db.Column(db.String(17), nullable=False)
 	bytes = db.Column(db.Integer, nullable=False)
@@ -139,8 +174,93 @@ class AssetDiscovery(db.Model):
 	# Relationship to the Device model
 	switch = db.relationship('Device', back_populates='asset_discoveries')
  
-	# Ensure unique entries for asset discovery data
-	__table_args__ = (
+	# Ensure unique entries for asset discovery data (also serves per MAC time range queries)
+	__table_args__ = telemetry_table_args(
     	db.UniqueConstraint('switch_id', 'mac_address', 'timestamp', name='_asset_discovery_unique'),
+    	db.Index('ix_asset_discovery_switch_timestamp', 'switch_id', 'timestamp'),
+	)
+
+# AssetInventory model for storing the current state of each asset discovered by a switch
+class AssetInventory(db.Model):
+	__tablename__ = 'asset_inventory'
+
+	id = db.Column(db.Integer, primary_key=True)
+	switch_id = db.Column(db.Integer, db.ForeignKey('devices.id', ondelete='CASCADE'), nullable=False)
+	mac_address = db.Column(db.String(17), nullable=False)
+	first_seen = db.Column(db.DateTime, nullable=False) # First time the asset was reported by the switch
+	last_seen = db.Column(db.DateTime, nullable=False) # Last time the asset was reported by the switch
+	bytes = db.Column(db.BigInteger, nullable=False) # Cumulative byte counter
+	packets = db.Column(db.BigInteger, nullable=False) # Cumulative packet counter
+	present = db.Column(db.Boolean, nullable=False, default=True) # False once the asset is gone from the switch table
+
+	__table_args__ = (
+    	db.UniqueConstraint('switch_id', 'mac_address', name='_asset_inventory_unique'),
+	)
+
+# MonitoringRollup model for storing monitoring data aggregated per resolution (1 minute, 1 hour)
+class MonitoringRollup(db.Model):
+	__tablename__ = 'monitoring_rollups'
+
+	id = db.Column(db.Integer, primary_key=True)
+	resolution = db.Column(db.Integer, nullable=False) # Bucket size in seconds
+	bucket = db.Column(db.DateTime, nullable=False) # Start of the bucket
+	device_id = db.Column(db.Integer, db.ForeignKey('devices.id', ondelete='CASCADE'), nullable=False)
+	mac_address = db.Column(db.String(17), nullable=False)
+	samples = db.Column(db.Integer, nullable=False) # Number of raw samples in the bucket
+	bandwidth_sum = db.Column(db.BigInteger, nullable=False)
+	bandwidth_max = db.Column(db.Integer, nullable=False)
+
+	__table_args__ = (
+    	db.UniqueConstraint('resolution', 'device_id', 'mac_address', 'bucket', name='_monitoring_rollup_unique'),
+    	db.Index('ix_monitoring_rollup_device_bucket', 'resolution', 'device_id', 'bucket'),
+	)
+
+# AssetDiscoveryRollup model for storing asset discovery data aggregated per resolution (1 minute, 1 hour)
+class AssetDiscoveryRollup(db.Model):
+	__tablename__ = 'asset_discovery_rollups'
+
+	id = db.Column(db.Integer, primary_key=True)
+	resolution = db.Column(db.Integer, nullable=False) # Bucket size in seconds
+	bucket = db.Column(db.DateTime, nullable=False) # Start of the bucket
+	switch_id = db.Column(db.Integer, db.ForeignKey('devices.id', ondelete='CASCADE'), nullable=False)
+	mac_address = db.Column(db.String(17), nullable=False)
+	samples = db.Column(db.Integer, nullable=False) # Number of raw samples in the bucket
+	bytes_sum = db.Column(db.BigInteger, nullable=False)
+	bytes_max = db.Column(db.BigInteger, nullable=False)
+	packets_sum = db.Column(db.BigInteger, nullable=False)
+	packets_max = db.Column(db.BigInteger, nullable=False)
+
+	__table_args__ = (
+    	db.UniqueConstraint('resolution', 'switch_id', 'mac_address', 'bucket', name='_asset_discovery_rollup_unique'),
 	)
 
+# TopologyState model for the version of the devices and links written by the network simulation
+class TopologyState(db.Model):
+	__tablename__ = 'topology_state'
+
+	id = db.Column(db.Integer, primary_key=True) # Single row, always 1
+	version = db.Column(db.BigInteger, nullable=False, default=0) # Bumped in every transaction that rewrites the devices or links
+
+# RollupState model for storing how far each raw table has been rolled up
+class RollupState(db.Model):
+	__tablename__ = 'rollup_state'
+
+	source = db.Column(db.String(50), primary_key=True) # Name of the raw table
+	high_water_id = db.Column(db.BigInteger, nullable=False, default=0) # Last raw row ID included in the rollups
+	high_water_timestamp = db.Column(db.DateTime, nullable=True) # Newest raw timestamp included in the rollups
+
+# BandwidthSketch model for storing mergeable bandwidth quantile sketches per series and bucket
+class BandwidthSketch(db.Model):
+	__tablename__ = 'bandwidth_sketches'
+
+	id = db.Column(db.Integer, primary_key=True)
+	bucket = db.Column(db.DateTime, nullable=False) # Start of the bucket
+	device_id = db.Column(db.Integer, db.ForeignKey('devices.id', ondelete='CASCADE'), nullable=False)
+	mac_address = db.Column(db.String(17), nullable=False) # '*' for the total bandwidth of the switch
+	samples = db.Column(db.Integer, nullable=False) # Number of samples in the sketch
+	sketch = db.Column(BYTEA, nullable=False) # Serialised DDSketch
+
+	__table_args__ = (
+    	db.UniqueConstraint('device_id', 'mac_address', 'bucket', name='_bandwidth_sketch_unique'),
+    	db.Index('ix_bandwidth_sketch_bucket', 'bucket'),
+	)
@@ -0,0 +1,182 @@
+import logging
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import ForeignKeyConstraint, UniqueConstraint, text
+
+from . import db
+from . import models # Registers the telemetry tables in the metadata
+
+# Telemetry tables that can be range partitioned by day on their timestamp column
+PARTITIONED_TABLES = ('monitoring_data', 'asset_discovery')
+
+# Bounds of a range partition as returned by pg_get_expr(relpartbound)
+BOUND_PATTERN = re.compile(r"FROM \((MINVALUE|'[^']+')\) TO \((MAXVALUE|'[^']+')\)")
+
+def is_partitioned(table):
+    """
+    Checks whether a table is a PostgreSQL partitioned table.
+
+    Args:
+        table: Name of the table.
+
+    Returns:
+        True if the table is partitioned, False for plain tables (or other databases).
+    """
+    if db.engine.dialect.name != 'postgresql':
+        return False
+    return db.session.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :table"
+    ), {'table': table}).first() is not None
+
+def list_partitions(table):
+    """
+    Lists the partitions of a partitioned table with their bounds.
+
+    Args:
+        table: Name of the partitioned table.
+
+    Returns:
+        List of (partition name, lower bound, upper bound) sorted by lower bound. Unbounded ends are None.
+    """
+    rows = db.session.execute(text(
+        "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+        "FROM pg_inherits i "
+        "JOIN pg_class parent ON parent.oid = i.inhparent "
+        "JOIN pg_class child ON child.oid = i.inhrelid "
+        "WHERE parent.relname = :table"
+    ), {'table': table}).all()
+
+    def parse(bound):
+        if bound in ('MINVALUE', 'MAXVALUE'):
+            return None
+        return datetime.fromisoformat(bound.strip("'"))
+
+    partitions = []
+    for name, bound in rows:
+        match = BOUND_PATTERN.search(bound or '')
+        if match:
+            partitions.append((name, parse(match.group(1)), parse(match.group(2))))
+    return sorted(partitions, key=lambda partition: partition[1] or datetime.min)
+
+def quoted(columns):
+    """
+    Returns a comma separated list of quoted column names.
+    """
+    return ', '.join(f'"{column.name}"' for column in columns)
+
+def convert_to_partitioned(table, now=None):
+    """
+    Migrates a plain telemetry table to a table range partitioned by day.
+
+    The existing table is kept as a legacy partition covering everything up to the end of the current day,
+    so no rows are copied. Constraints and indexes are recreated on the partitioned table from the model
+    definition. Daily partitions are then created from the next day on.
+
+    Args:
+        table: Name of the table to convert.
+        now: Current time (naive UTC), defaults to now.
+
+    Returns:
+        True if the table was converted, False if it was already partitioned.
+    """
+    if is_partitioned(table):
+        logging.info(f"Table {table} is already partitioned.")
+        return False
+
+    now = now or datetime.utcnow()
+    legacy_end = datetime(now.year, now.month, now.day) + timedelta(days=1)
+    legacy = f'{table}_legacy'
+    model_table = db.metadata.tables[table]
+
+    statements = [
+        f'ALTER TABLE {table} RENAME TO {legacy}',
+        # Index and constraint names are shared by the whole schema, free them for the new table
+        f'ALTER TABLE {legacy} DROP CONSTRAINT IF EXISTS {table}_pkey',
+    ]
+    statements += [f'ALTER TABLE {legacy} RENAME CONSTRAINT {constraint.name} TO {constraint.name}_legacy'
+                   for constraint in model_table.constraints if isinstance(constraint, UniqueConstraint)]
+    statements += [f'ALTER INDEX IF EXISTS {index.name} RENAME TO {index.name}_legacy' for index in model_table.indexes]
+
+    statements += [
+        f'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp")',
+        # Keep the ID sequence when the legacy partition is eventually dropped
+        f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id',
+        f'ALTER TABLE {table} ADD PRIMARY KEY (id, "timestamp")',
+    ]
+    for constraint in model_table.constraints:
+        if isinstance(constraint, UniqueConstraint):
+            statements.append(f'ALTER TABLE {table} ADD CONSTRAINT {constraint.name} UNIQUE ({quoted(constraint.columns)})')
+        elif isinstance(constraint, ForeignKeyConstraint):
+            referred = [element.column for element in constraint.elements]
+            on_delete = f' ON DELETE {constraint.ondelete}' if constraint.ondelete else ''
+            statements.append(
+                f'ALTER TABLE {table} ADD FOREIGN KEY ({quoted(constraint.columns)}) '
+                f'REFERENCES {referred[0].table.name} ({quoted(referred)}){on_delete}'
+            )
+    statements += [f'CREATE INDEX {index.name} ON {table} ({quoted(index.columns)})' for index in model_table.indexes]
+    statements.append(f"ALTER TABLE {table} ATTACH PARTITION {legacy} FOR VALUES FROM (MINVALUE) TO ('{legacy_end.isoformat(sep=' ')}')")
+
+    for statement in statements:
+        db.session.execute(text(statement))
+    db.session.commit()
+    logging.info(f"Converted {table} to a partitioned table, existing rows kept in {legacy}.")
+    return True
+
+def ensure_partitions(table, days_ahead, now=None):
+    """
+    Creates the daily partitions of a table from today up to days_ahead days in the future.
+
+    Args:
+        table: Name of the partitioned table.
+        days_ahead: Number of future days to create partitions for.
+        now: Current time (naive UTC), defaults to now.
+
+    Returns:
+        The names of the partitions created.
+    """
+    now = now or datetime.utcnow()
+    partitions = list_partitions(table)
+    # Never overlap the legacy partition or partitions created earlier
+    covered_until = max((upper for _, _, upper in partitions if upper is not None), default=None)
+
+    created = []
+    day = datetime(now.year, now.month, now.day)
+    for _ in range(days_ahead + 1):
+        if covered_until is None or day >= covered_until:
+            name = f'{table}_p{day:%Y%m%d}'
+            db.session.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{day.isoformat(sep=' ')}') TO ('{(day + timedelta(days=1)).isoformat(sep=' ')}')"
+            ))
+            created.append(name)
+        day += timedelta(days=1)
+    db.session.commit()
+    if created:
+        logging.info(f"Created partitions {', '.join(created)}.")
+    return created
+
+def drop_expired_partitions(table, cutoff, detach_only=False):
+    """
+    Removes the partitions of a table holding only rows older than the cutoff.
+
+    Args:
+        table: Name of the partitioned table.
+        cutoff: Partitions whose upper bound is at or before this time are removed.
+        detach_only: Only detach the partitions (keeping them as plain tables) instead of dropping them.
+
+    Returns:
+        The names of the partitions removed.
+    """
+    removed = []
+    for name, _, upper in list_partitions(table):
+        if upper is None or upper > cutoff:
+            continue
+        db.session.execute(text(f'ALTER TABLE {table} DETACH PARTITION {name}'))
+        if not detach_only:
+            db.session.execute(text(f'DROP TABLE {name}'))
+        removed.append(name)
+    db.session.commit()
+    if removed:
+        logging.info(f"Removed expired partitions {', '.join(removed)} from {table}.")
+    return removed
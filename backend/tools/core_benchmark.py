@@ -0,0 +1,148 @@
+"""
+Compares the message throughput and latency of the controller cores.
+
+Each core is started in its own process with an echo handler answering every PACKET_IN with a PACKET_OUT
+carrying the same data. Simulated switches connect, say HELLO, then send PACKET_IN messages keeping a window
+of them in flight. The round trip of every message is measured by the switch that sent it.
+
+    python core_benchmark.py --cores twisted asyncio uvloop --switches 16 --messages 20000 --window 64
+"""
+import argparse
+import asyncio
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+CONTROLLER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'controller')
+sys.path.insert(0, CONTROLLER_DIR)
+# The protobuf modules are found relative to the controller directory
+os.chdir(CONTROLLER_DIR)
+
+from core import eBPFCoreApplication, set_event_handler
+from core.connection import eBPFConnection
+from core.packets import *
+
+HEADER = struct.Struct(eBPFConnection.HEADER_FMT)
+# Sequence number and send time, at the start of the PACKET_IN data
+STAMP = struct.Struct('<Qd')
+
+class EchoApplication(eBPFCoreApplication):
+    @set_event_handler(Header.PACKET_IN)
+    def packet_in(self, connection, pkt):
+        connection.send(PacketOut(data=pkt.data, out_port=0))
+
+def serve(core, port):
+    use_uvloop = core == 'uvloop'
+    application = EchoApplication(core='twisted' if core == 'twisted' else 'asyncio', use_uvloop=use_uvloop, port=port)
+    application.run()
+
+def frame(pkt):
+    payload = pkt.SerializeToString()
+    return HEADER.pack(eBPFConnection._message_object_to_type[type(pkt)], len(payload)) + payload
+
+async def read_message(reader):
+    kind, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return kind, await reader.readexactly(length)
+
+async def switch(dpid, port, messages, window, size, latencies):
+    """
+    Simulated switch: sends messages PACKET_INs with at most window of them unanswered.
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(frame(Hello(version=1, dpid=dpid)))
+    kind, _ = await read_message(reader)
+    assert kind == Header.HELLO
+
+    padding = bytes(max(0, size - STAMP.size))
+    credits = asyncio.Semaphore(window)
+
+    async def send():
+        for sequence in range(messages):
+            await credits.acquire()
+            writer.write(frame(PacketIn(data=STAMP.pack(sequence, time.perf_counter()) + padding)))
+            await writer.drain()
+
+    sender = asyncio.ensure_future(send())
+    received = 0
+    while received < messages:
+        kind, payload = await read_message(reader)
+        if kind != Header.PACKET_OUT:
+            continue
+        pkt = PacketOut()
+        pkt.ParseFromString(payload)
+        _, sent = STAMP.unpack_from(pkt.data)
+        latencies.append(time.perf_counter() - sent)
+        received += 1
+        credits.release()
+    await sender
+    writer.close()
+
+async def load(port, switches, messages, window, size):
+    latencies = []
+    started = time.perf_counter()
+    await asyncio.gather(*(switch(dpid + 1, port, messages, window, size, latencies) for dpid in range(switches)))
+    return time.perf_counter() - started, latencies
+
+def wait_listening(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def benchmark(core, args):
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', core, '--port', str(args.port)],
+                              stdout=subprocess.DEVNULL)
+    try:
+        if not wait_listening(args.port):
+            raise RuntimeError(f'The {core} core did not start listening on port {args.port}')
+        elapsed, latencies = asyncio.run(load(args.port, args.switches, args.messages, args.window, args.size))
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    return {
+        'core': core,
+        'messages': len(latencies),
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'p999': percentile(latencies, 0.999) * 1000,
+        'max': latencies[-1] * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cores', nargs='+', default=['twisted', 'asyncio'], choices=['twisted', 'asyncio', 'uvloop'])
+    parser.add_argument('--switches', type=int, default=8, help='Number of simulated switches.')
+    parser.add_argument('--messages', type=int, default=20000, help='PACKET_IN messages sent by each switch.')
+    parser.add_argument('--window', type=int, default=64, help='Unanswered messages allowed per switch.')
+    parser.add_argument('--size', type=int, default=128, help='Size of the PACKET_IN data in bytes.')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--serve', choices=['twisted', 'asyncio', 'uvloop'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    print(f"{args.switches} switches x {args.messages} messages, window {args.window}, {args.size} bytes")
+    print(f"{'core':<10}{'msg/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'p99.9 ms':>10}{'max ms':>10}")
+    for core in args.cores:
+        result = benchmark(core, args)
+        print(f"{result['core']:<10}{result['throughput']:>12.0f}{result['p50']:>10.3f}{result['p99']:>10.3f}"
+              f"{result['p999']:>10.3f}{result['max']:>10.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,10 @@ def start_sim():
     """
     Starts the network simulation in a separate thread.
 
+    Query parameters (optional):
+        dry_run: Roll back the devices and links of the topology instead of saving them (default from
+            SIM_PERSIST_DRY_RUN).
+
     Returns:
         JSON response indicating whether the simulation started or was already running.
     """
@@ -18,7 +22,10 @@ def start_sim():
         if network_sim.simulation_running:
             logging.info("Simulation already running start_sim ignored.")
             return jsonify({"status": "Simulation already started."}), 200
-        sim_thread = Thread(target=network_sim.smartGridSimNetwork, args=(current_app._get_current_object(),))
+        dry_run = request.args.get('dry_run')
+        if dry_run is not None:
+            dry_run = dry_run.lower() in ('1', 'true', 'yes')
+        sim_thread = Thread(target=network_sim.smartGridSimNetwork, args=(current_app._get_current_object(), dry_run))
         sim_thread.start()
     return jsonify({"status": "Simulation started."}), 200
 
@@ -7,9 +7,10 @@ from mininet.clean import cleanup
 from mininet.cli import CLI
 from eBPFSwitch import eBPFSwitch, eBPFHost
 from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
 
 from shared import db
-from shared.models import Device, Link, EventLog
+from shared.models import Device, Link, EventLog, TopologyState
 
 import threading
 
@@ -21,12 +22,13 @@ net = None
 simulation_running = False
 simulation_lock = threading.Lock()
 
-def smartGridSimNetwork(app):
+def smartGridSimNetwork(app, dry_run=None):
     """
     Starts the Smart Grid network simulation using Mininet.
 
     Args:
         app: The flask application instance for database context.
+        dry_run: Roll back the devices and links instead of saving them, SIM_PERSIST_DRY_RUN if None.
 
     Manages:
         Network initialisation and topology setup.
@@ -35,6 +37,8 @@ def smartGridSimNetwork(app):
     """
     global net, simulation_running
     logging.info("Attempting to start network simulation.")
+    if dry_run is None:
+        dry_run = app.config['SIM_PERSIST_DRY_RUN']
 
     with simulation_lock:
         if simulation_running:
@@ -112,46 +116,7 @@ def smartGridSimNetwork(app):
         logging.info("Network simulation started.")
 
         # Save devices and links to the database
-        with app.app_context():
-            # Add devices to database
-            for host in net.hosts:
-                device = Device.query.filter_by(name=host.name).first()
-                if not device:
-                    device = Device(
-                        name=host.name,
-                        device_type='host',
-                        ip_address=host.IP(),
-                        mac_address=host.MAC(),
-                        status='disconnected'
-                    )
-                    db.session.add(device)
-            for switch in net.switches:
-                device = Device.query.filter_by(name=switch.name).first()
-                if not device:
-                    device = Device(
-                        name=switch.name,
-                        device_type='switch',
-                        dpid=int(switch.dpid),
-                        status='disconnected'
-                    )
-                    db.session.add(device)
-            db.session.commit()
-
-            # Add links to database
-            for link in net.links:
-                src = link.intf1.node
-                dst = link.intf2.node
-                src_device = Device.query.filter_by(name=src.name).first()
-                dst_device = Device.query.filter_by(name=dst.name).first()
-                if src_device and dst_device:
-                    link_entry = Link(
-                        source_device_id=src_device.id,
-                        destination_device_id=dst_device.id,
-                        link_type='ethernet',
-                        attributes={}
-                    )
-                    db.session.add(link_entry)
-            db.session.commit()
+        persist_topology(app, net, dry_run)
         CLI(net)
 
     except Exception as e:
@@ -160,6 +125,113 @@ def smartGridSimNetwork(app):
             net.stop()
             net = None
 
+def bump_topology_version():
+    """
+    Bumps the topology version read by the controller, in the current transaction.
+
+    The controller runs in another process and cannot see the simulation rewrite the devices and links
+    tables (a reset restarts their IDs, so the same topology saved again looks unchanged). Committing
+    the bump with the rewrite tells it to drop its cached topology.
+    """
+    db.session.execute(
+        insert(TopologyState).values(id=1, version=1)
+        .on_conflict_do_update(index_elements=[TopologyState.id], set_={'version': TopologyState.version + 1})
+    )
+
+def persist_topology(app, net, dry_run=False):
+    """
+    Saves the devices and links of the simulated network in a single transaction.
+
+    Devices not stored yet (by name) are inserted in one statement, skipping those whose IP address,
+    MAC address or DPID is already taken. Device names are then resolved to IDs with one query and the
+    links inserted in one statement, so the number of round trips does not grow with the topology.
+
+    Args:
+        app: The Flask application instance for database context.
+        net: The built Mininet network.
+        dry_run: Run the statements but roll the transaction back instead of committing it.
+
+    Returns:
+        A dictionary with the number of devices and links inserted, the links skipped because an
+        endpoint is missing, and the time taken in milliseconds.
+    """
+    started = time.perf_counter()
+    devices = {
+        host.name: {
+            'name': host.name,
+            'device_type': 'host',
+            'ip_address': host.IP(),
+            'mac_address': host.MAC(),
+            'status': 'disconnected'
+        }
+        for host in net.hosts
+    }
+    devices.update({
+        switch.name: {
+            'name': switch.name,
+            'device_type': 'switch',
+            'dpid': int(switch.dpid),
+            'status': 'disconnected'
+        }
+        for switch in net.switches
+    })
+
+    with app.app_context():
+        try:
+            # Hosts and switches set different columns, every row gets all of them to fit a single insert
+            columns = ('name', 'device_type', 'ip_address', 'mac_address', 'dpid', 'status')
+            stored = dict(db.session.query(Device.name, Device.id).filter(Device.name.in_(devices)).all())
+            rows = [{column: device.get(column) for column in columns} for name, device in devices.items() if name not in stored]
+            inserted = 0
+            if rows:
+                result = db.session.execute(insert(Device).values(rows).on_conflict_do_nothing().returning(Device.name, Device.id))
+                inserted = len(rows)
+                for name, device_id in result:
+                    stored[name] = device_id
+                missing = [row['name'] for row in rows if row['name'] not in stored]
+                inserted -= len(missing)
+                if missing:
+                    logging.warning(f"Devices not saved, their address or DPID is already taken: {', '.join(missing)}")
+
+            links = []
+            skipped = 0
+            for link in net.links:
+                src_id = stored.get(link.intf1.node.name)
+                dst_id = stored.get(link.intf2.node.name)
+                if src_id is None or dst_id is None:
+                    skipped += 1
+                    continue
+                # Shaped (TCLink) links record their bandwidth for the link utilization
+                bandwidth = link.intf1.params.get('bw')
+                links.append({
+                    'source_device_id': src_id,
+                    'destination_device_id': dst_id,
+                    'link_type': 'ethernet',
+                    'attributes': {'bandwidth_mbps': bandwidth} if bandwidth else {}
+                })
+            if links:
+                db.session.execute(insert(Link).values(links))
+            bump_topology_version()
+
+            if dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    report = {
+        'devices': inserted,
+        'links': len(links),
+        'skipped_links': skipped,
+        'dry_run': dry_run,
+        'milliseconds': round((time.perf_counter() - started) * 1000, 1),
+    }
+    logging.info(f"{'Dry run: would have saved' if dry_run else 'Saved'} {inserted} devices and {len(links)} links "
+                 f"in {report['milliseconds']} ms ({skipped} links skipped).")
+    return report
+
 def stop_network(app):
     """
     Stops the running network and cleans up resources.
@@ -195,6 +267,7 @@ def stop_network(app):
                 truncate_stmt = f"TRUNCATE TABLE {', '.join(tables)} RESTART IDENTITY CASCADE;"
 
                 db.session.execute(text(truncate_stmt))
+                bump_topology_version()
 
                 db.session.commit()
                 logging.info("Database has been successfully reset.")                
@@ -208,6 +281,7 @@ def stop_network(app):
                 truncate_stmt = f"TRUNCATE TABLE {', '.join(tables)} RESTART IDENTITY CASCADE;"
 
                 db.session.execute(text(truncate_stmt))
+                bump_topology_version()
 
                 db.session.commit()
                 logging.info("Database has been successfully reset.")